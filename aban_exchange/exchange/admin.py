@@ -2,7 +2,46 @@ from django.contrib import admin
 
 from .models import ArchiveOrder
 from .models import Order
+from .models import PendingValue
+from .services import order_delete
 
-# Register your models here.
-admin.site.register(Order)
-admin.site.register(ArchiveOrder)
\ No newline at end of file
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    # orders are placed by the validators, editing one here would put the balances
+    # and `PendingValue` out of sync
+    readonly_fields = ["user", "price", "amount"]
+    list_display = ["id", "user", "price", "amount", "created_at"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def delete_model(self, request, obj):
+        order_delete(Order.objects.filter(id=obj.id))
+
+    def delete_queryset(self, request, queryset):
+        order_delete(queryset)
+
+
+@admin.register(ArchiveOrder)
+class ArchiveOrderAdmin(admin.ModelAdmin):
+    # orders are archived by the filler with the id they had as pending orders
+    list_display = ["id", "user", "price", "amount", "created_at"]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(PendingValue)
+class PendingValueAdmin(admin.ModelAdmin):
+    # maintained by the validators and the filler only
+    list_display = ["price", "shard", "value"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
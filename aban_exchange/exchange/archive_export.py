@@ -0,0 +1,225 @@
+import json
+import sys
+import zlib
+from array import array
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+from itertools import accumulate
+from itertools import pairwise
+from pathlib import Path
+from typing import NamedTuple
+
+from .models import ArchiveOrder
+
+# An export is a data file and its index. The data file is a sequence of chunks,
+# a chunk holds the columns of up to `chunk_size` orders one after the other, each
+# column is an array of signed 64 bit little endian integers compressed with zlib.
+# The orders are sorted by user then id, so the orders of a user are in a few
+# consecutive chunks. The ids and the fill times mostly increase among the orders
+# of a user, they are stored as the difference to the previous value which
+# compresses much better. The index is a JSON file with the position, the sizes
+# and the min/max values of every chunk (fill times in microseconds since the
+# epoch), it is written last so an export without index is incomplete.
+COLUMNS = ("id", "user_id", "price", "amount", "created_at")
+_DELTA_COLUMNS = {"id", "created_at"}
+DATA_SUFFIX = ".col"
+INDEX_SUFFIX = ".idx"
+_FORMAT_VERSION = 2
+# older exports are sorted by id only
+_SORTED_BY_USER_VERSION = 2
+_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class ExportedOrder(NamedTuple):
+    id: int
+    user_id: int
+    price: int
+    amount: int
+    created_at: datetime
+
+
+def _to_micros(value):
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(value):
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def _encode_column(name, values):
+    if name in _DELTA_COLUMNS:
+        values = [values[0]] + [b - a for a, b in pairwise(values)]
+    column = array("q", values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return zlib.compress(column.tobytes())
+
+
+def _decode_column(name, data):
+    column = array("q")
+    column.frombytes(zlib.decompress(data))
+    if sys.byteorder == "big":
+        column.byteswap()
+    if name in _DELTA_COLUMNS:
+        return list(accumulate(column))
+    return column.tolist()
+
+
+class _ExportWriter:
+    def __init__(self, path):
+        self._data_path = path.with_suffix(DATA_SUFFIX)
+        self._index_path = path.with_suffix(INDEX_SUFFIX)
+        self._file = self._data_path.with_suffix(".tmp").open("wb")
+        self._chunks = []
+        self.rows = 0
+
+    def write_chunk(self, rows):
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(COLUMNS)}
+        offset = self._file.tell()
+        sizes = []
+        for name in COLUMNS:
+            data = _encode_column(name, columns[name])
+            self._file.write(data)
+            sizes.append(len(data))
+        self._chunks.append(
+            {
+                "offset": offset,
+                "sizes": sizes,
+                "rows": len(rows),
+                **{
+                    f"{bound.__name__}_{name}": bound(columns[name])
+                    for name in ("id", "user_id", "created_at")
+                    for bound in (min, max)
+                },
+            },
+        )
+        self.rows += len(rows)
+
+    def close(self, meta):
+        self._file.flush()
+        self._file.close()
+        self._data_path.with_suffix(".tmp").rename(self._data_path)
+
+        index = {
+            "version": _FORMAT_VERSION,
+            "columns": COLUMNS,
+            "rows": self.rows,
+            **meta,
+            "chunks": self._chunks,
+        }
+        tmp = self._index_path.with_suffix(".idx.tmp")
+        tmp.write_text(json.dumps(index))
+        tmp.rename(self._index_path)
+
+    def abort(self):
+        self._file.close()
+        self._data_path.with_suffix(".tmp").unlink(missing_ok=True)
+
+
+def archive_export(path, *, start: datetime, end: datetime, chunk_size: int) -> int:
+    """
+    Exports the orders archived from `start` to `end` (excluded) to a file.
+
+    The orders are read in user then id order (the `(user, id)` index) through a
+    server-side cursor and written `chunk_size` at a time, so the memory used
+    doesn't depend on the number of orders. Only the partitions of the period are
+    read.
+
+    Args:
+        path (Path): The export, without suffix, `.col` and `.idx` are added.
+        start (datetime): First fill time exported.
+        end (datetime): Fill time the export stops at.
+        chunk_size (int): Orders per chunk.
+
+    Returns:
+        int: The number of exported orders.
+
+    Raises:
+        FileExistsError: If the export already exists.
+    """
+
+    path = Path(path)
+    if path.with_suffix(INDEX_SUFFIX).exists():
+        raise FileExistsError(path.with_suffix(INDEX_SUFFIX))
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    rows = (
+        ArchiveOrder.objects.created_between(start, end)
+        .order_by("user_id", "id")
+        .values_list(*COLUMNS)
+        .iterator(chunk_size=chunk_size)
+    )
+    writer = _ExportWriter(path)
+    try:
+        chunk = []
+        for order_id, user_id, price, amount, created_at in rows:
+            chunk.append((order_id, user_id, price, amount, _to_micros(created_at)))
+            if len(chunk) == chunk_size:
+                writer.write_chunk(chunk)
+                chunk = []
+        if chunk:
+            writer.write_chunk(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+
+    writer.close({"start": start.isoformat(), "end": end.isoformat()})
+    return writer.rows
+
+
+def archive_export_read(path, *, user_id: int):
+    """
+    Yields the exported orders of a user, in id order.
+
+    Chunks are read one at a time, the ones whose user ids can't contain the user
+    are skipped and only the user id column is decompressed for the others until
+    one of their orders is the user's. The chunks are sorted by user, so reading
+    stops at the first chunk of a later user.
+
+    Args:
+        path (Path): The export, with or without suffix.
+        user_id (int): ID of the user.
+
+    Yields:
+        ExportedOrder: The orders of the user.
+    """
+
+    path = Path(path)
+    index = json.loads(path.with_suffix(INDEX_SUFFIX).read_text())
+    columns = index["columns"]
+    user_column = columns.index("user_id")
+    sorted_by_user = index["version"] >= _SORTED_BY_USER_VERSION
+
+    with path.with_suffix(DATA_SUFFIX).open("rb") as data:
+        for chunk in index["chunks"]:
+            if sorted_by_user and chunk["min_user_id"] > user_id:
+                break
+            if not chunk["min_user_id"] <= user_id <= chunk["max_user_id"]:
+                continue
+
+            offsets = list(accumulate(chunk["sizes"], initial=chunk["offset"]))
+            data.seek(offsets[user_column])
+            user_ids = _decode_column(
+                "user_id",
+                data.read(chunk["sizes"][user_column]),
+            )
+            matches = [i for i, value in enumerate(user_ids) if value == user_id]
+            if not matches:
+                continue
+
+            values = {}
+            for i, name in enumerate(columns):
+                if i == user_column:
+                    continue
+                data.seek(offsets[i])
+                values[name] = _decode_column(name, data.read(chunk["sizes"][i]))
+            for row in matches:
+                yield ExportedOrder(
+                    id=values["id"][row],
+                    user_id=user_id,
+                    price=values["price"][row],
+                    amount=values["amount"][row],
+                    created_at=_from_micros(values["created_at"][row]),
+                )
@@ -0,0 +1,84 @@
+import json
+import struct
+import time
+
+from django.conf import settings
+
+# Binary orders start with their format version, a JSON order always starts with
+# "{", so both formats can be in the queue at the same time (e.g. while the
+# workers are switched from one codec to the other).
+BINARY_V1 = 1
+# version, user_id, amount, price, queued at (milliseconds since the epoch)
+_BINARY_V1_LAYOUT = struct.Struct("<BQIIQ")
+
+
+def _encode_json(user_id, amount, price):
+    return json.dumps(
+        {
+            "user_id": user_id,
+            "amount": amount,
+            "price": price,
+        },
+    )
+
+
+def _encode_binary(user_id, amount, price):
+    return _BINARY_V1_LAYOUT.pack(
+        BINARY_V1,
+        int(user_id),
+        amount,
+        price,
+        time.time_ns() // 1_000_000,
+    )
+
+
+_ENCODERS = {
+    "json": _encode_json,
+    "binary": _encode_binary,
+}
+
+
+def encode_order(*, user_id, amount: int, price: int):
+    """
+    Serializes an order for the order queue.
+
+    The format is chosen by `settings.REQUEST_HANDLER_QUEUE_CODEC`: "json" or
+    "binary" (a fixed 25 bytes layout, see `BINARY_V1`).
+
+    Returns:
+        str | bytes: The serialized order.
+    """
+
+    return _ENCODERS[settings.REQUEST_HANDLER_QUEUE_CODEC](user_id, amount, price)
+
+
+def decode_order(item):
+    """
+    Deserializes an order of the order queue, whatever codec encoded it.
+
+    Args:
+        item (str | bytes): An order serialized by `encode_order`.
+
+    Returns:
+        dict: The order with integer `user_id`, `amount` and `price`.
+
+    Raises:
+        ValueError: If the item is not a valid order.
+    """
+
+    if isinstance(item, bytes) and item[:1] == bytes([BINARY_V1]):
+        try:
+            _, user_id, amount, price, _ = _BINARY_V1_LAYOUT.unpack(item)
+        except struct.error as e:
+            raise ValueError(e) from e
+        return {"user_id": user_id, "amount": amount, "price": price}
+
+    try:
+        data = json.loads(item)
+        return {
+            "user_id": int(data["user_id"]),
+            "amount": int(data["amount"]),
+            "price": int(data["price"]),
+        }
+    except (TypeError, KeyError) as e:
+        raise ValueError(e) from e
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+
+
+class OrderIntakeBuffer:
+    """
+    Collects the orders received by one web worker and pushes them together.
+
+    `submit` is called by the request threads, a background thread flushes the
+    collected orders with one `push` call as soon as `max_size` orders are waiting
+    or `max_wait` milliseconds passed since the first one. Every request waits for
+    the flush of its own order and receives its error, so an order is acknowledged
+    only after it is really in the queue.
+
+    Batching only happens when a worker handles several requests at the same time,
+    e.g. gunicorn `gthread` workers.
+    """
+
+    def __init__(self, push, *, max_size: int, max_wait: int, timeout: int):
+        self._push = push
+        self._max_size = max_size
+        self._max_wait = max_wait / 1000
+        self._timeout = timeout / 1000
+        self._condition = threading.Condition()
+        self._pending = []  # (item, Future) in arrival order
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run,
+                name="order-intake-buffer",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _take_batch(self):
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+
+            deadline = time.monotonic() + self._max_wait
+            while len(self._pending) < self._max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = self._pending[: self._max_size]
+            self._pending = self._pending[self._max_size :]
+
+        # the items whose request already timed out are dropped, the others can't
+        # be cancelled anymore
+        return [
+            (item, future)
+            for item, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                self._push([item for item, _ in batch])
+            except Exception as e:  # noqa: BLE001
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+
+    def submit(self, item):
+        """
+        Adds an item to the next flush and waits for it.
+
+        Raises:
+            Exception: The error raised by `push` while flushing the item.
+            TimeoutError: If the item was not flushed in `timeout` milliseconds. The
+                item is dropped unless its flush had already started.
+        """
+
+        future = Future()
+        with self._condition:
+            self._ensure_thread()
+            self._pending.append((item, future))
+            # wakes the flusher up when it is idle or the batch became full
+            self._condition.notify()
+        try:
+            future.result(timeout=self._timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+
+# buffer of this process, forked workers create their own buffer and thread
+_buffer = {"pid": None, "instance": None}
+_buffer_lock = threading.Lock()
+
+
+def get_intake_buffer(push):
+    """
+    Returns the intake buffer of the current process.
+
+    Args:
+        push (callable): Pushes a list of serialized orders to the queue, only used
+            when the buffer is created.
+    """
+
+    with _buffer_lock:
+        if _buffer["pid"] != os.getpid():
+            _buffer["instance"] = OrderIntakeBuffer(
+                push,
+                max_size=settings.ORDER_INTAKE_BUFFER_SIZE,
+                max_wait=settings.ORDER_INTAKE_BUFFER_WAIT,
+                timeout=settings.ORDER_INTAKE_BUFFER_TIMEOUT,
+            )
+            _buffer["pid"] = os.getpid()
+        return _buffer["instance"]
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from aban_exchange.exchange.partitions import archive_partitions_maintain
+from aban_exchange.exchange.partitions import partitioning_supported
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the monthly partitions of the archived orders ahead of time and "
+        "remove the partitions past the retention. Scheduled daily by "
+        "init_periodic_tasks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=settings.ARCHIVE_PARTITIONS_AHEAD,
+            help="Months after the current one which must have a partition.",
+        )
+        parser.add_argument(
+            "--retention",
+            type=int,
+            default=settings.ARCHIVE_RETENTION_MONTHS,
+            help="Months kept, the current one included, 0 keeps them all.",
+        )
+        parser.add_argument(
+            "--detach-only",
+            action="store_true",
+            help="Keep the expired partitions as standalone tables.",
+        )
+
+    def handle(self, *args, **options):
+        if not partitioning_supported():
+            msg = "Archived orders are only partitioned on PostgreSQL."
+            raise CommandError(msg)
+
+        created, removed = archive_partitions_maintain(
+            today=timezone.now().date(),
+            ahead=options["ahead"],
+            retention=options["retention"],
+            drop=not options["detach_only"],
+        )
+        for month in created:
+            self.stdout.write(f"Partition of {month:%Y-%m} created.")
+        action = "detached" if options["detach_only"] else "dropped"
+        for month in removed:
+            self.stdout.write(f"Partition of {month:%Y-%m} {action}.")
+        self.stdout.write("Done.")
@@ -0,0 +1,63 @@
+import logging
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from redis.exceptions import RedisError
+
+from aban_exchange.exchange.spool import spool_drain
+from aban_exchange.utils.io.redis_helper import RedisConnector
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Push the orders spooled on this host while Redis was unreachable to the "
+        "order queue. Run it on every web host when ORDER_SPOOL_ENABLED is set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=settings.ORDER_SPOOL_DRAIN_INTERVAL,
+            help="Milliseconds to wait when the spool is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the spool once and exit.",
+        )
+
+    def _stop(self, signum, frame):
+        # the current segment is always checkpointed, we only stop draining more
+        self.stdout.write("Stopping order spool drainer...")
+        self._running = False
+
+    def handle(self, *args, **options):
+        self._running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(f"Draining order spool {settings.ORDER_SPOOL_DIR}.")
+        while self._running:
+            try:
+                replayed = spool_drain(RedisConnector.get_connection())
+            except RedisError as e:
+                # still unreachable, the drain resumes from the last checkpoint
+                self.stderr.write(f"Error on draining the order spool: {e}")
+                replayed = 0
+            except Exception:
+                logger.exception("Error on draining the order spool")
+                replayed = 0
+
+            if replayed:
+                self.stdout.write(f"{replayed} spooled orders pushed.")
+            if options["once"]:
+                break
+            if not replayed:
+                time.sleep(options["interval"] / 1000)
+
+        self.stdout.write("Done.")
@@ -0,0 +1,63 @@
+from datetime import UTC
+from datetime import date
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from aban_exchange.exchange.archive_export import archive_export
+
+
+def _day(value):
+    return datetime.combine(date.fromisoformat(value), datetime.min.time(), UTC)
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the orders archived in a period to compressed column files, e.g. "
+        "the months archive_partitions is about to drop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "start",
+            type=_day,
+            help="First day exported (YYYY-MM-DD, UTC).",
+        )
+        parser.add_argument(
+            "end",
+            type=_day,
+            help="Day the export stops at, excluded (YYYY-MM-DD, UTC).",
+        )
+        parser.add_argument(
+            "--directory",
+            default=settings.ARCHIVE_EXPORT_DIR,
+            help="Directory of the export files.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.ARCHIVE_EXPORT_CHUNK_SIZE,
+            help="Orders per chunk.",
+        )
+
+    def handle(self, *args, **options):
+        start, end = options["start"], options["end"]
+        if start >= end:
+            msg = "The end of the period must be after its start."
+            raise CommandError(msg)
+
+        path = Path(options["directory"]) / f"archive-{start:%Y%m%d}-{end:%Y%m%d}"
+        try:
+            exported = archive_export(
+                path,
+                start=start,
+                end=end,
+                chunk_size=options["chunk_size"],
+            )
+        except FileExistsError as e:
+            msg = f"The period is already exported to {path}."
+            raise CommandError(msg) from e
+        self.stdout.write(f"{exported} archived orders exported to {path}.")
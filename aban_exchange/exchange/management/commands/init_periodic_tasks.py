@@ -1,10 +1,21 @@
+import json
+
 from django.conf import settings
 from django.core.management.base import BaseCommand
 from django_celery_beat.models import IntervalSchedule
 from django_celery_beat.models import PeriodicTask
+from django_celery_beat.models import PeriodicTasks
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--without-request-handler",
+            action="store_true",
+            help="Don't schedule the 'request handler' task, orders are consumed "
+            "by the run_order_consumer daemon.",
+        )
+
     def _request_handler(self):
         print("Init 'request handler' tasks...")  # noqa: T201
 
@@ -12,16 +23,43 @@ class Command(BaseCommand):
             every=settings.REQUEST_HANDLER_INTERVAL,
             period=IntervalSchedule.MICROSECONDS,
         )
-        task, created = PeriodicTask.objects.get_or_create(
-            interval=schedule,
-            name="Validate and place new recieved orders.",
-            task="aban_exchange.exchange.tasks.handle_batch_of_request",
-        )
 
-        if task:
-            print("Done.")  # noqa: T201
-        else:
-            print("Fail!")  # noqa: T201
+        # One task per queue shard, the shards are validated in parallel. Shard 0
+        # keeps the name of the task of a single shard, so the existing task is
+        # updated rather than duplicated.
+        names = []
+        for shard in range(settings.REQUEST_HANDLER_QUEUE_SHARDS):
+            name = "Validate and place new recieved orders."
+            if shard:
+                name = f"Validate and place new recieved orders (shard {shard})."
+            task, created = PeriodicTask.objects.update_or_create(
+                name=name,
+                defaults={
+                    "interval": schedule,
+                    "task": "aban_exchange.exchange.tasks.handle_batch_of_request",
+                    "kwargs": json.dumps({"shard": shard}),
+                    "enabled": True,
+                },
+            )
+            names.append(name)
+
+            if task:
+                print("Done.")  # noqa: T201
+            else:
+                print("Fail!")  # noqa: T201
+
+        # the tasks of the shards removed since the last run
+        disabled = (
+            PeriodicTask.objects.filter(
+                task="aban_exchange.exchange.tasks.handle_batch_of_request",
+                enabled=True,
+            )
+            .exclude(name__in=names)
+            .update(enabled=False)
+        )
+        if disabled:
+            PeriodicTasks.update_changed()
+            print(f"{disabled} tasks of removed shards disabled.")  # noqa: T201
 
     def _order_filler(self):
         print("Init 'order filler' tasks...")  # noqa: T201
@@ -41,6 +79,48 @@ class Command(BaseCommand):
         else:
             print("Fail!")  # noqa: T201
 
+    def _wallet_snapshot(self):
+        print("Init 'wallet snapshot' tasks...")  # noqa: T201
+
+        schedule, created = IntervalSchedule.objects.get_or_create(
+            every=settings.WALLET_SNAPSHOT_INTERVAL,
+            period=IntervalSchedule.SECONDS,
+        )
+        task, created = PeriodicTask.objects.get_or_create(
+            interval=schedule,
+            name="Fold balance entries into the wallets.",
+            task="aban_exchange.users.tasks.snapshot_wallets",
+        )
+
+        if task:
+            print("Done.")  # noqa: T201
+        else:
+            print("Fail!")  # noqa: T201
+
+    def _archive_partitions(self):
+        print("Init 'archive partitions' tasks...")  # noqa: T201
+
+        schedule, created = IntervalSchedule.objects.get_or_create(
+            every=1,
+            period=IntervalSchedule.DAYS,
+        )
+        task, created = PeriodicTask.objects.get_or_create(
+            interval=schedule,
+            name="Create and expire the partitions of archived orders.",
+            task="aban_exchange.exchange.tasks.maintain_archive_partitions",
+        )
+
+        if task:
+            print("Done.")  # noqa: T201
+        else:
+            print("Fail!")  # noqa: T201
+
     def handle(self, *args, **options):
-        self._request_handler()
-        self._order_filler()
+        if not options["without_request_handler"]:
+            self._request_handler()
+        if settings.ORDER_BOOK_ENABLED:
+            print("Skip 'order filler' tasks, orders are filled by run_order_book.")  # noqa: T201
+        else:
+            self._order_filler()
+        self._wallet_snapshot()
+        self._archive_partitions()
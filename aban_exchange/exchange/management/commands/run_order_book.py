@@ -0,0 +1,94 @@
+import json
+import logging
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from redis.exceptions import RedisError
+
+from aban_exchange.exchange.order_book import BookOrder
+from aban_exchange.exchange.order_book import OrderBook
+from aban_exchange.exchange.queues import STREAM_PAYLOAD_FIELD
+from aban_exchange.exchange.services import order_book_fill
+from aban_exchange.exchange.services import order_book_load
+from aban_exchange.exchange.tasks import filled_order_notif
+from aban_exchange.utils.exception.system import ServiceUnavailable
+from aban_exchange.utils.io.redis_helper import RedisConnector
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep the pending orders in an in-memory order book and fill a price level "
+        "as soon as it becomes fillable. Needs ORDER_BOOK_ENABLED=True so the "
+        "validators publish the placed orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--block",
+            type=int,
+            default=settings.ORDER_CONSUMER_BLOCK_TIMEOUT,
+            help="Milliseconds to wait for placed orders before checking for "
+            "shutdown again.",
+        )
+
+    def _stop(self, signum, frame):
+        self.stdout.write("Stopping order book...")
+        self._running = False
+
+    def _fill(self, book):
+        # drop a connection broken by a database restart, so the daemon
+        # recovers instead of failing on it forever
+        close_old_connections()
+        try:
+            user_ids = order_book_fill(book)
+        except ServiceUnavailable as e:
+            self.stderr.write(str(e.detail))
+            time.sleep(1)
+            return
+        except Exception:
+            logger.exception("Error on filling the order book")
+            time.sleep(1)
+            return
+
+        if user_ids:
+            filled_order_notif.delay(user_ids)
+
+    def handle(self, *args, **options):
+        self._running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        redis = RedisConnector.get_connection()
+        stream = settings.ORDER_BOOK_STREAM_NAME
+
+        # Remember the stream position before loading the table, orders published
+        # while loading are read again from the stream and skipped by the book
+        last_entries = redis.xrevrange(stream, count=1)
+        last_id = last_entries[0][0] if last_entries else "0-0"
+
+        book = order_book_load(OrderBook())
+        self.stdout.write(f"Order book started with {len(book)} orders.")
+        self._fill(book)
+
+        while self._running:
+            try:
+                response = redis.xread({stream: last_id}, block=options["block"])
+            except RedisError as e:
+                self.stderr.write(f"Error accessing Redis: {e}")
+                time.sleep(1)
+                continue
+
+            for _stream, entries in response or []:
+                for entry_id, fields in entries:
+                    for row in json.loads(fields[STREAM_PAYLOAD_FIELD]):
+                        book.add(BookOrder(*row))
+                    last_id = entry_id
+
+            self._fill(book)
+
+        self.stdout.write("Done.")
@@ -0,0 +1,72 @@
+import logging
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import close_old_connections
+
+from aban_exchange.exchange.tasks import handle_batch_of_request
+from aban_exchange.utils.exception.system import ServiceUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Validate and place received orders as soon as they arrive. "
+        "Replaces the periodic 'request handler' task, run init_periodic_tasks "
+        "with --without-request-handler when this daemon is used."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--block",
+            type=int,
+            default=settings.ORDER_CONSUMER_BLOCK_TIMEOUT,
+            help="Milliseconds to wait on an empty queue before checking for "
+            "shutdown again.",
+        )
+        parser.add_argument(
+            "--shard",
+            type=int,
+            default=0,
+            help="Queue shard to consume, run one consumer per shard when "
+            "REQUEST_HANDLER_QUEUE_SHARDS is more than 1.",
+        )
+
+    def _stop(self, signum, frame):
+        # the current batch is always finished, we only stop asking for a new one
+        self.stdout.write("Stopping order consumer...")
+        self._running = False
+
+    def handle(self, *args, **options):
+        self._running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        if not 0 <= options["shard"] < settings.REQUEST_HANDLER_QUEUE_SHARDS:
+            msg = f"Shard must be in [0, {settings.REQUEST_HANDLER_QUEUE_SHARDS})."
+            raise CommandError(msg)
+
+        self.stdout.write(f"Order consumer started on shard {options['shard']}.")
+        while self._running:
+            # drop a connection broken by a database restart, so the daemon
+            # recovers instead of failing on it forever
+            close_old_connections()
+            try:
+                # run the task in this process, it blocks on the queue until a
+                # batch arrives or the timeout is reached
+                handle_batch_of_request(block=options["block"], shard=options["shard"])
+            except ServiceUnavailable as e:
+                self.stderr.write(str(e.detail))
+                # don't spin on a broken Redis/database connection
+                time.sleep(1)
+            except Exception:
+                # an unexpected error must not stop the daemon, the batch is left
+                # pending (stream backend) and claimed again later
+                logger.exception("Error on handling a batch of orders")
+                time.sleep(1)
+
+        self.stdout.write("Done.")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from aban_exchange.exchange.prices import token_price_set
+
+
+class Command(BaseCommand):
+    help = "Change the token price of every running worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("price", type=int)
+
+    def handle(self, *args, **options):
+        try:
+            version = token_price_set(options["price"])
+        except ValueError as e:
+            raise CommandError(e) from e
+        self.stdout.write(f"Token price set to {options['price']} (version {version}).")
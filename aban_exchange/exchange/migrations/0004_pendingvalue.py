@@ -0,0 +1,32 @@
+# Generated by Django 5.0.10 on 2026-10-18 13:20
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_pending_value(apps, schema_editor):
+    Order = apps.get_model('exchange', 'Order')
+    PendingValue = apps.get_model('exchange', 'PendingValue')
+    PendingValue.objects.bulk_create(
+        PendingValue(price=row['price'], value=row['value'])
+        for row in Order.objects.values('price').annotate(value=Sum('amount'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange', '0003_order_exchange_or_price_b96b7c_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.PositiveIntegerField(unique=True, verbose_name='Currency Price')),
+                ('value', models.PositiveBigIntegerField(default=0, verbose_name='Pending value (USD)')),
+            ],
+        ),
+        migrations.RunPython(populate_pending_value, migrations.RunPython.noop),
+    ]
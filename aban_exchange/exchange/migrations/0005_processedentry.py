@@ -0,0 +1,20 @@
+# Generated by Django 5.0.10 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange', '0004_pendingvalue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedEntry',
+            fields=[
+                ('entry_id', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Entry ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+            ],
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.0.10 on 2026-10-18 15:02
+
+from datetime import UTC, datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+TABLE = 'exchange_archiveorder'
+# months after the current one created with the table, then by the
+# `archive_partitions` command
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=UTC)
+
+
+def _rebuild(schema_editor, create_table, primary_key, after_copy=()):
+    # Replaces the table by the one `create_table` creates, with the same rows,
+    # indexes and foreign keys
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s',
+            [TABLE, f'{TABLE}_pkey'],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT min(created_at) FROM {TABLE}')
+        first = cursor.fetchone()[0]
+
+    schema_editor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_old')
+    create_table(schema_editor, first)
+    schema_editor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_old')
+    schema_editor.execute(f'DROP TABLE {TABLE}_old')
+    schema_editor.execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({primary_key})'
+    )
+    for sql in after_copy:
+        schema_editor.execute(sql)
+    for indexdef in indexes:
+        schema_editor.execute(indexdef)
+    for name, definition in foreign_keys:
+        schema_editor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+
+
+def _create_partitioned(schema_editor, first):
+    # the primary key of a partitioned table must contain the partition key, ids
+    # are copied from `Order` so they don't need a default
+    schema_editor.execute(
+        f'CREATE TABLE {TABLE} (LIKE {TABLE}_old INCLUDING DEFAULTS) '
+        'PARTITION BY RANGE (created_at)'
+    )
+    schema_editor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+    current = _add_months(timezone.now(), 0)
+    month = _add_months(first or current, 0)
+    while month <= _add_months(current, MONTHS_AHEAD):
+        schema_editor.execute(
+            f'CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} '
+            'FOR VALUES FROM (%s) TO (%s)',
+            [month, _add_months(month, 1)],
+        )
+        month = _add_months(month, 1)
+
+
+def _create_plain(schema_editor, first):
+    schema_editor.execute(f'CREATE TABLE {TABLE} (LIKE {TABLE}_old INCLUDING DEFAULTS)')
+
+
+def partition_archiveorder(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    _rebuild(schema_editor, _create_partitioned, 'id, created_at')
+
+
+def unpartition_archiveorder(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    _rebuild(
+        schema_editor,
+        _create_plain,
+        'id',
+        after_copy=[
+            f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY',
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), "
+            f'coalesce(max(id), 0) + 1, false) FROM {TABLE}',
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange', '0005_processedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_archiveorder, unpartition_archiveorder),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.10 on 2026-10-18 14:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange', '0006_partition_archiveorder'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archiveorder',
+            index=models.Index(fields=['user', 'id'], name='exchange_ar_user_id_0fd2a9_idx'),
+        ),
+    ]
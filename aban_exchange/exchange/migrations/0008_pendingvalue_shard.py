@@ -0,0 +1,27 @@
+# Generated by Django 5.0.10 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange', '0007_archiveorder_user_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingvalue',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Queue shard'),
+        ),
+        migrations.AlterField(
+            model_name='pendingvalue',
+            name='price',
+            field=models.PositiveIntegerField(verbose_name='Currency Price'),
+        ),
+        migrations.AddConstraint(
+            model_name='pendingvalue',
+            constraint=models.UniqueConstraint(fields=('price', 'shard'), name='exchange_pendingvalue_price_shard_uniq'),
+        ),
+    ]
@@ -1,9 +1,16 @@
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.db.models import PROTECT
+from django.db.models import CharField
+from django.db.models import DateTimeField
 from django.db.models import ForeignKey
 from django.db.models import Index
+from django.db.models import Model
+from django.db.models import PositiveBigIntegerField
 from django.db.models import PositiveIntegerField
+from django.db.models import PositiveSmallIntegerField
+from django.db.models import QuerySet
+from django.db.models import UniqueConstraint
 
 from aban_exchange.utils.db.models import BaseModel
 
@@ -37,5 +44,70 @@ class Order(BaseOrder):
         ]
 
 
+class ArchiveOrderQuerySet(QuerySet):
+    def created_between(self, start, end):
+        """
+        Orders archived from `start` (included) to `end` (excluded).
+        """
+        return self.filter(created_at__gte=start, created_at__lt=end)
+
+
 class ArchiveOrder(BaseOrder):
-    pass
+    """
+    Filled orders, `created_at` is the time they were filled.
+
+    On PostgreSQL the table is partitioned by month of `created_at` (see
+    `exchange.partitions`), filter on it, e.g. with `created_between`, so only the
+    partitions of the period are read.
+    """
+
+    objects = ArchiveOrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # the order history of a user is read in id order
+            Index(fields=["user", "id"]),
+        ]
+
+
+class PendingValue(Model):
+    """
+    Total value of the pending orders on each price.
+
+    Kept in sync with `Order` in the same transactions that place and fill orders,
+    so the filler can check `MIN_ORDERS_VALUE` without aggregating the order table.
+    Every queue shard adds to its own row of a price, so the validators of
+    different shards don't wait for each other, the pending value of a price is
+    the sum of its rows.
+    """
+
+    price = PositiveIntegerField(verbose_name="Currency Price")
+    shard = PositiveSmallIntegerField(default=0, verbose_name="Queue shard")
+    value = PositiveBigIntegerField(default=0, verbose_name="Pending value (USD)")
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=["price", "shard"],
+                name="exchange_pendingvalue_price_shard_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.value}$ pending on price {self.price} (shard {self.shard})"
+
+
+class ProcessedEntry(Model):
+    """
+    Order queue stream entries whose orders are already placed.
+
+    Written in the transaction that places the orders, so an entry claimed again
+    after a crash or a failed acknowledgement is skipped instead of being placed
+    twice. Rows are removed as soon as their entries are acknowledged.
+    """
+
+    entry_id = CharField(max_length=64, primary_key=True, verbose_name="Entry ID")
+    created_at = DateTimeField(auto_now_add=True, verbose_name="Created at")
+
+    def __str__(self):
+        return self.entry_id
@@ -0,0 +1,97 @@
+from bisect import bisect_left
+from bisect import insort
+from collections import deque
+from typing import NamedTuple
+
+
+class BookOrder(NamedTuple):
+    id: int
+    user_id: int
+    price: int
+    amount: int
+
+
+class OrderBook:
+    """
+    In-memory book of the pending orders, bucketed by price level.
+
+    Price levels are kept in a sorted list (found with a binary search) and every
+    level holds its orders in a FIFO queue together with the total value of the
+    level, so checking or taking a level never scans the order table or the other
+    levels. The book is only a mirror of `Order`, filling a level must still be
+    persisted (see `services.order_book_fill`).
+    """
+
+    def __init__(self):
+        self._prices = []  # sorted price levels
+        self._levels = {}  # price -> deque of BookOrder in arrival order
+        self._values = {}  # price -> total amount of the level
+        self._order_ids = set()
+
+    def __len__(self):
+        return len(self._order_ids)
+
+    def __contains__(self, order_id):
+        return order_id in self._order_ids
+
+    @property
+    def prices(self):
+        return list(self._prices)
+
+    def add(self, order: BookOrder):
+        """
+        Appends an order to the end of its price level.
+
+        Orders already in the book are ignored, so the same order can be received
+        from the database and from the placement stream without being counted twice.
+        """
+
+        if order.id in self._order_ids:
+            return
+
+        level = self._levels.get(order.price)
+        if level is None:
+            insort(self._prices, order.price)
+            level = self._levels[order.price] = deque()
+            self._values[order.price] = 0
+
+        level.append(order)
+        self._values[order.price] += order.amount
+        self._order_ids.add(order.id)
+
+    def level_value(self, price: int):
+        return self._values.get(price, 0)
+
+    def pop_level(self, price: int):
+        """
+        Removes a price level from the book.
+
+        Returns:
+            list: Orders of the level in arrival order, empty if the level doesn't
+            exist.
+        """
+
+        level = self._levels.pop(price, None)
+        if level is None:
+            return []
+
+        del self._prices[bisect_left(self._prices, price)]
+        del self._values[price]
+        self._order_ids.difference_update(order.id for order in level)
+        return list(level)
+
+    def match(self, price: int, min_value: int):
+        """
+        Takes the level which is fillable on the given token price.
+
+        An order is filled only on its own price, so the level of `price` is taken
+        when its value reached `min_value`.
+
+        Returns:
+            list: Matched orders in arrival order, empty if nothing is fillable.
+        """
+
+        value = self.level_value(price)
+        if not value or value < min_value:
+            return []
+        return self.pop_level(price)
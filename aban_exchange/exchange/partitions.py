@@ -0,0 +1,185 @@
+import logging
+import re
+from datetime import UTC
+from datetime import date
+from datetime import datetime
+
+from django.db import connection
+from django.db import transaction
+
+from .models import ArchiveOrder
+
+logger = logging.getLogger(__name__)
+
+# `ArchiveOrder` is range partitioned by `created_at` on PostgreSQL (see migration
+# 0006_partition_archiveorder), one partition per month named after it, and a
+# default partition for the rows of months without one.
+_PARTITION_NAME = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _table():
+    return ArchiveOrder._meta.db_table  # noqa: SLF001
+
+
+def _month_start(month):
+    return datetime(month.year, month.month, 1, tzinfo=UTC)
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partitioning_supported() -> bool:
+    return connection.vendor == "postgresql"
+
+
+def archive_partition_name(month: date) -> str:
+    return f"{_table()}_p{month.year:04d}{month.month:02d}"
+
+
+def archive_default_partition_name() -> str:
+    return f"{_table()}_default"
+
+
+def archive_partitions() -> list[date]:
+    """
+    Returns the months which have a partition, oldest first.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            """,
+            [_table()],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    months = []
+    for name in names:
+        match = _PARTITION_NAME.search(name)
+        if match:
+            months.append(date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def archive_partition_create(month: date) -> bool:
+    """
+    Creates the partition of a month if it doesn't exist.
+
+    Rows of the month already in the default partition are moved to the new one,
+    PostgreSQL refuses to attach it otherwise.
+
+    Args:
+        month (date): Any day of the month.
+
+    Returns:
+        bool: True if the partition was created.
+    """
+
+    month = month.replace(day=1)
+    if month in archive_partitions():
+        return False
+
+    partition = _quote(archive_partition_name(month))
+    bounds = [_month_start(month), _month_start(_add_months(month, 1))]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {partition} "
+            f"(LIKE {_quote(_table())} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+        )
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {_quote(archive_default_partition_name())}
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING *
+            )
+            INSERT INTO {partition} SELECT * FROM moved
+            """,  # noqa: S608
+            bounds,
+        )
+        if cursor.rowcount:
+            logger.warning(
+                "%d archived orders moved from the default partition to %s",
+                cursor.rowcount,
+                partition,
+            )
+        cursor.execute(
+            f"ALTER TABLE {_quote(_table())} ATTACH PARTITION {partition} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+    return True
+
+
+def archive_partition_remove(month: date, *, drop: bool = True):
+    """
+    Detaches the partition of a month from `ArchiveOrder`, then drops it.
+
+    Removing a partition is a catalog change, the rows are not deleted one by
+    one. A detached partition is kept as a standalone table.
+
+    Args:
+        month (date): Any day of the month.
+        drop (bool): Drop the partition once detached.
+    """
+
+    partition = _quote(archive_partition_name(month.replace(day=1)))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"ALTER TABLE {_quote(_table())} DETACH PARTITION {partition}",
+        )
+        if drop:
+            cursor.execute(f"DROP TABLE {partition}")
+
+
+def archive_partitions_maintain(
+    *,
+    today: date,
+    ahead: int,
+    retention: int,
+    drop: bool = True,
+) -> tuple[list[date], list[date]]:
+    """
+    Creates the partitions of the coming months and removes the expired ones.
+
+    Retention removes whole partitions only, the rows of the default partition
+    (months which had no partition when archived) are never expired. They are
+    moved out when the partition of their month is created.
+
+    Args:
+        today (date): The current day.
+        ahead (int): Months after the current one which must have a partition.
+        retention (int): Months kept, the current one included. Partitions of
+            older months are removed, 0 keeps every partition.
+        drop (bool): Drop the removed partitions, otherwise they are only
+            detached.
+
+    Returns:
+        tuple: The months whose partitions were created and removed.
+    """
+
+    current = today.replace(day=1)
+    created = [
+        month
+        for month in (_add_months(current, offset) for offset in range(ahead + 1))
+        if archive_partition_create(month)
+    ]
+
+    removed = []
+    if retention:
+        oldest = _add_months(current, -(retention - 1))
+        for month in archive_partitions():
+            if month < oldest:
+                archive_partition_remove(month, drop=drop)
+                removed.append(month)
+    return created, removed
@@ -0,0 +1,130 @@
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from aban_exchange.utils.io.redis_helper import RedisConnector
+
+logger = logging.getLogger(__name__)
+
+# Sets the price, increments its version and notifies the workers atomically
+_SET_PRICE_SCRIPT = """
+redis.call('HSET', KEYS[1], 'price', ARGV[1])
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('PUBLISH', ARGV[2], version .. ':' .. ARGV[1])
+return version
+"""
+
+_lock = threading.Lock()
+_cache = {"price": None, "version": 0, "expires_at": 0.0}
+# pub/sub listener of this process, forked workers start their own listener
+_listener = {"pid": None, "thread": None}
+
+
+def _store(price, version, now, *, newer_only=False):
+    with _lock:
+        # a late notification must never replace a newer snapshot
+        if newer_only and version <= _cache["version"]:
+            return
+        _cache["price"] = price
+        _cache["version"] = version
+        _cache["expires_at"] = now + settings.TOKEN_PRICE_CACHE_TTL / 1000
+
+
+def _on_price_message(message):
+    version, price = message["data"].split(":")
+    _store(int(price), int(version), time.monotonic(), newer_only=True)
+
+
+def _on_listener_error(error, pubsub, thread):
+    logger.error("Token price listener stopped: %s", error)
+    thread.stop()
+    pubsub.close()
+    # the next `token_price_get` starts a new listener
+    _listener["thread"] = None
+
+
+def _ensure_listener(redis):
+    if _listener["pid"] == os.getpid() and _listener["thread"] is not None:
+        return
+
+    pubsub = redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{settings.TOKEN_PRICE_CHANNEL: _on_price_message})
+    _listener["pid"] = os.getpid()
+    _listener["thread"] = pubsub.run_in_thread(
+        sleep_time=1,
+        daemon=True,
+        exception_handler=_on_listener_error,
+    )
+
+
+def token_price_get():
+    """
+    Returns the current token price.
+
+    The price is stored in Redis (`settings.TOKEN_PRICE_KEY`) with a version
+    number. Every process keeps a snapshot of it for `settings.TOKEN_PRICE_CACHE_TTL`
+    milliseconds and replaces the snapshot as soon as a new price is published on
+    `settings.TOKEN_PRICE_CHANNEL`, so reading the price usually needs no Redis
+    round trip.
+
+    Returns:
+        int: The token price. `settings.TOKEN_PRICE` is used until a price is
+        set, when the dynamic price is disabled (`settings.DYNAMIC_TOKEN_PRICE`)
+        or, if no snapshot exists yet, when Redis is unavailable.
+    """
+
+    if not settings.DYNAMIC_TOKEN_PRICE:
+        return settings.TOKEN_PRICE
+
+    now = time.monotonic()
+    if _cache["price"] is not None and now < _cache["expires_at"]:
+        return _cache["price"]
+
+    try:
+        redis = RedisConnector.get_connection()
+        _ensure_listener(redis)
+        price, version = redis.hmget(settings.TOKEN_PRICE_KEY, "price", "version")
+    except Exception:
+        logger.exception("Error on reading the token price")
+        # keep using the last known price rather than failing the caller
+        return _cache["price"] if _cache["price"] is not None else settings.TOKEN_PRICE
+
+    if price is None or int(price) < 1:
+        # never set, or written by hand with a price the filler can't divide by
+        price, version = settings.TOKEN_PRICE, 0
+    _store(int(price), int(version), now)
+    return int(price)
+
+
+def token_price_set(price: int):
+    """
+    Changes the token price for every worker.
+
+    Args:
+        price (int): The new token price.
+
+    Returns:
+        int: The version of the new price.
+
+    Raises:
+        ValueError: If the price is lower than 1, tokens are computed by dividing
+        the order amount by the price.
+    """
+
+    if price < 1:
+        msg = "Token price must be at least 1."
+        raise ValueError(msg)
+
+    redis = RedisConnector.get_connection()
+    version = redis.eval(
+        _SET_PRICE_SCRIPT,
+        1,
+        settings.TOKEN_PRICE_KEY,
+        price,
+        settings.TOKEN_PRICE_CHANNEL,
+    )
+    _store(price, int(version), time.monotonic(), newer_only=True)
+    return int(version)
@@ -0,0 +1,414 @@
+import os
+import socket
+from typing import NamedTuple
+
+from django.conf import settings
+from redis.client import Pipeline
+from redis.exceptions import ResponseError
+
+# field name used to store the serialized order inside each stream entry
+STREAM_PAYLOAD_FIELD = "data"
+
+# Pushes orders to a queue shard (KEYS[1]) unless a guard refuses them, in one
+# call. With a `rate` the orders take a token each from the bucket of the user
+# (KEYS[2]), which holds at most `burst` tokens and is refilled with `rate` tokens
+# per second. With a `ttl` the idempotency key (last key) is set to `value` for
+# `ttl` seconds, orders already pushed under the key are not pushed again.
+# Returns {0, false} when the orders are pushed, {0, previous value} on a replay,
+# otherwise the milliseconds until enough tokens are available (-1 when there are
+# more orders than the bucket can ever hold). Entries are added with the
+# `STREAM_PAYLOAD_FIELD` field.
+_GUARDED_PUSH_SCRIPT = """
+local backend = ARGV[1]
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local first = 6
+local cost = #ARGV - first + 1
+
+local idempotency_key = KEYS[#KEYS]
+if ttl > 0 and not redis.call('SET', idempotency_key, ARGV[5], 'NX', 'EX', ttl) then
+    return {0, redis.call('GET', idempotency_key)}
+end
+
+if rate > 0 then
+    local wait = 0
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    local bucket = redis.call('HMGET', KEYS[2], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate / 1000)
+    if cost > burst then
+        wait = -1
+    elseif tokens < cost then
+        wait = math.ceil((cost - tokens) * 1000 / rate)
+    end
+    if wait ~= 0 then
+        -- refused orders can be sent again with the same key
+        if ttl > 0 then
+            redis.call('DEL', idempotency_key)
+        end
+        return {wait, false}
+    end
+
+    redis.call('HSET', KEYS[2], 'tokens', tostring(tokens - cost), 'updated_at', now)
+    -- a full bucket is the same as no bucket
+    redis.call('PEXPIRE', KEYS[2], math.ceil(burst * 1000 / rate))
+end
+
+if backend == 'stream' then
+    for i = first, #ARGV do
+        redis.call('XADD', KEYS[1], '*', 'data', ARGV[i])
+    end
+else
+    redis.call('RPUSH', KEYS[1], unpack(ARGV, first))
+end
+return {0, false}
+"""
+
+
+class RateLimit(NamedTuple):
+    # token bucket of a user, see `queue_push_guarded`
+    key: str
+    rate: float
+    burst: int
+
+
+class IdempotencyKey(NamedTuple):
+    # a value identifying the orders is kept under the key for `ttl` seconds
+    key: str
+    value: str
+    ttl: int
+
+
+# consumer groups already created by this process, so we don't send
+# XGROUP CREATE on every batch
+_initialized_groups = set()
+
+
+def _consumer_name():
+    # every worker process needs its own consumer name inside the group,
+    # otherwise two workers would share (and steal) the same pending entries
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _is_stream_backend():
+    return settings.REQUEST_HANDLER_QUEUE_BACKEND == "stream"
+
+
+def queue_shard(user_id) -> int:
+    """
+    Returns the queue shard of a user's orders.
+
+    All orders of a user go to the same shard, so validators of different shards
+    never lock the same user. The user ID itself is used rather than `hash()`,
+    which is randomized per process for strings.
+    """
+
+    return int(user_id) % settings.REQUEST_HANDLER_QUEUE_SHARDS
+
+
+def queue_name(shard: int = 0) -> str:
+    """
+    Returns the Redis key of a queue shard.
+
+    Shard 0 is `settings.REQUEST_HANDLER_QUEUE_NAME` itself, the queue used with a
+    single shard, so its orders are still consumed after adding shards. The keys
+    of the other shards are suffixed by the shard number.
+    """
+
+    if shard == 0:
+        return settings.REQUEST_HANDLER_QUEUE_NAME
+    return f"{settings.REQUEST_HANDLER_QUEUE_NAME}:{shard}"
+
+
+def _ensure_group(redis, name):
+    if name in _initialized_groups:
+        return
+
+    try:
+        redis.xgroup_create(
+            name,
+            settings.REQUEST_HANDLER_CONSUMER_GROUP,
+            id="0",
+            mkstream=True,
+        )
+    except ResponseError as e:
+        # the group was created by another worker before us
+        if "BUSYGROUP" not in str(e):
+            raise
+    _initialized_groups.add(name)
+
+
+def _stream_claim(redis, name, count, block):
+    _ensure_group(redis, name)
+    consumer = _consumer_name()
+
+    try:
+        # first take over entries that another consumer read but never
+        # acknowledged (e.g. the worker crashed in the middle of a batch)
+        response = redis.xautoclaim(
+            name,
+            settings.REQUEST_HANDLER_CONSUMER_GROUP,
+            consumer,
+            min_idle_time=settings.REQUEST_HANDLER_CLAIM_IDLE_TIME,
+            start_id="0-0",
+            count=count,
+        )
+        entries = list(response[1]) if response else []
+
+        if len(entries) < count:
+            response = redis.xreadgroup(
+                settings.REQUEST_HANDLER_CONSUMER_GROUP,
+                consumer,
+                {name: ">"},
+                count=count - len(entries),
+                # never wait when we already have reclaimed entries to process
+                block=None if entries else block,
+            )
+            for _stream, stream_entries in response or []:
+                entries.extend(stream_entries)
+    except ResponseError as e:
+        # the stream (and its group) was removed, create it again on next call
+        if "NOGROUP" in str(e):
+            _initialized_groups.discard(name)
+        raise
+
+    entry_ids = []
+    items = []
+    for entry_id, fields in entries:
+        # a binary connection returns bytes, IDs are always kept as text
+        entry_ids.append(entry_id.decode() if isinstance(entry_id, bytes) else entry_id)
+        # entries deleted while pending come back without fields, we only
+        # need to acknowledge them
+        items.append(_payload(fields) if fields else None)
+    return entry_ids, items
+
+
+def _payload(fields):
+    if STREAM_PAYLOAD_FIELD in fields:
+        return fields[STREAM_PAYLOAD_FIELD]
+    return fields[STREAM_PAYLOAD_FIELD.encode()]
+
+
+def queue_push(redis, items: list[str | bytes], *, shard: int = 0):
+    """
+    Pushes serialized orders to a shard of the order queue.
+
+    Depending on `settings.REQUEST_HANDLER_QUEUE_BACKEND` orders are appended to
+    a Redis list (RPUSH) or to a Redis stream (XADD).
+
+    Args:
+        redis (Redis): An open Redis connection, or a pipeline which is executed
+            by the caller.
+        items (list[str | bytes]): Serialized orders (see `codecs.encode_order`).
+        shard (int): The queue shard of the orders (see `queue_shard`).
+    """
+
+    name = queue_name(shard)
+    if not _is_stream_backend():
+        redis.rpush(name, *items)
+        return
+
+    if len(items) == 1:
+        redis.xadd(name, {STREAM_PAYLOAD_FIELD: items[0]})
+        return
+
+    pipe = redis if isinstance(redis, Pipeline) else redis.pipeline(transaction=False)
+    for item in items:
+        pipe.xadd(name, {STREAM_PAYLOAD_FIELD: item})
+    if pipe is not redis:
+        pipe.execute()
+
+
+async def queue_push_async(redis, items: list[str | bytes], *, shard: int = 0):
+    """
+    Same as `queue_push` for a `redis.asyncio` connection.
+    """
+
+    name = queue_name(shard)
+    if not _is_stream_backend():
+        await redis.rpush(name, *items)
+        return
+
+    pipe = redis.pipeline(transaction=False)
+    for item in items:
+        pipe.xadd(name, {STREAM_PAYLOAD_FIELD: item})
+    await pipe.execute()
+
+
+def _guarded_push_args(items, shard, rate_limit, idempotency):
+    keys = [queue_name(shard)]
+    if rate_limit:
+        keys.append(rate_limit.key)
+    if idempotency:
+        keys.append(idempotency.key)
+    return (
+        _GUARDED_PUSH_SCRIPT,
+        len(keys),
+        *keys,
+        settings.REQUEST_HANDLER_QUEUE_BACKEND,
+        rate_limit.rate if rate_limit else 0,
+        rate_limit.burst if rate_limit else 0,
+        idempotency.ttl if idempotency else 0,
+        idempotency.value if idempotency else "",
+        *items,
+    )
+
+
+def queue_push_guarded(
+    redis,
+    items: list[str | bytes],
+    *,
+    shard: int = 0,
+    rate_limit: RateLimit | None = None,
+    idempotency: IdempotencyKey | None = None,
+) -> tuple[int, str | None]:
+    """
+    Pushes serialized orders to a shard of the order queue if a token bucket
+    allows it and they were not pushed before under the same idempotency key.
+
+    The guards are checked and the orders are pushed by one Lua script, so
+    everything happens atomically in a single round trip. Every order costs a
+    token, orders refused by the bucket don't keep the idempotency key.
+
+    Args:
+        redis (Redis): An open Redis connection.
+        items (list[str | bytes]): Serialized orders (see `codecs.encode_order`).
+        shard (int): The queue shard of the orders (see `queue_shard`).
+        rate_limit (RateLimit | None): The token bucket of the user, if any.
+        idempotency (IdempotencyKey | None): The idempotency key of the orders, if
+            any.
+
+    Returns:
+        tuple: A tuple containing:
+            - 0 if the orders were pushed (or pushed before), otherwise the
+              milliseconds to wait until the bucket holds enough tokens, or -1 if
+              there are more orders than `burst`.
+            - The value of the idempotency key if the orders were pushed before,
+              otherwise `None`.
+    """
+
+    wait, previous = redis.eval(
+        *_guarded_push_args(items, shard, rate_limit, idempotency),
+    )
+    return int(wait), previous
+
+
+async def queue_push_guarded_async(
+    redis,
+    items: list[str | bytes],
+    *,
+    shard: int = 0,
+    rate_limit: RateLimit | None = None,
+    idempotency: IdempotencyKey | None = None,
+) -> tuple[int, str | None]:
+    """
+    Same as `queue_push_guarded` for a `redis.asyncio` connection.
+    """
+
+    wait, previous = await redis.eval(
+        *_guarded_push_args(items, shard, rate_limit, idempotency),
+    )
+    return int(wait), previous
+
+
+def queue_length(redis, *, shard: int = 0) -> int:
+    """
+    Returns the number of orders waiting in a shard of the order queue.
+
+    With the stream backend the entries claimed by a validator but not
+    acknowledged yet are counted too.
+    """
+
+    name = queue_name(shard)
+    if _is_stream_backend():
+        return redis.xlen(name)
+    return redis.llen(name)
+
+
+async def queue_length_async(redis, *, shard: int = 0) -> int:
+    """
+    Same as `queue_length` for a `redis.asyncio` connection.
+    """
+
+    name = queue_name(shard)
+    if _is_stream_backend():
+        return await redis.xlen(name)
+    return await redis.llen(name)
+
+
+def _list_claim(redis, name, count, block):
+    if not block:
+        return redis.lpop(name, count) or []
+
+    # BLPOP only returns one item, it is used to wait for the first order and
+    # the rest of the batch is taken without waiting
+    response = redis.blpop(name, timeout=block / 1000)
+    if not response:
+        return []
+
+    items = [response[1]]
+    if count > 1:
+        items.extend(redis.lpop(name, count - 1) or [])
+    return items
+
+
+def queue_claim(redis, count: int, block: int | None = None, *, shard: int = 0):
+    """
+    Atomically takes a batch of serialized orders from the order queue.
+
+    With the list backend the batch is removed by a single `LPOP` so two
+    validators never receive the same orders. With the stream backend the batch
+    is read through a consumer group (XREADGROUP) and stays pending until
+    `queue_ack` is called; entries left pending by a crashed worker for longer
+    than `settings.REQUEST_HANDLER_CLAIM_IDLE_TIME` milliseconds are taken over
+    first (XAUTOCLAIM), so several validators can consume in parallel without
+    losing a batch.
+
+    Args:
+        redis (Redis): An open Redis connection.
+        count (int): Maximum number of orders to take.
+        block (int | None): If given, wait up to this many milliseconds for the
+            first order when the queue is empty instead of returning at once.
+        shard (int): The queue shard to take the orders from.
+
+    Returns:
+        tuple: A tuple containing:
+            - A list of stream entry IDs which must be acknowledged (always
+              empty for the list backend).
+            - A list of serialized orders. With the stream backend the order at
+              each position belongs to the entry ID at the same position and is
+              `None` for entries deleted while pending.
+    """
+
+    name = queue_name(shard)
+    if _is_stream_backend():
+        return _stream_claim(redis, name, count, block)
+
+    return [], _list_claim(redis, name, count, block)
+
+
+def queue_ack(redis, entry_ids: list[str], *, shard: int = 0):
+    """
+    Acknowledges processed stream entries and removes them from the stream.
+
+    Does nothing for the list backend, because `queue_claim` already removed
+    the orders from the list.
+
+    Args:
+        redis (Redis): An open Redis connection.
+        entry_ids (list[str]): Entry IDs returned by `queue_claim`.
+        shard (int): The queue shard the entries were taken from.
+    """
+
+    if not entry_ids or not _is_stream_backend():
+        return
+
+    name = queue_name(shard)
+    pipe = redis.pipeline(transaction=False)
+    pipe.xack(name, settings.REQUEST_HANDLER_CONSUMER_GROUP, *entry_ids)
+    # acknowledged entries are useless, keep the stream as small as the backlog
+    pipe.xdel(name, *entry_ids)
+    pipe.execute()
@@ -1,59 +1,653 @@
 import json
+import logging
+import math
+import time
+from collections import defaultdict
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import connection
 from django.db import transaction
+from django.db.models import F
+from django.db.models import Max
 from django.db.models import Sum
 from django.db.utils import DatabaseError
+from redis.exceptions import ConnectionError as RedisConnectionError
 
-from aban_exchange.users.models import User
+from aban_exchange.users.models import BalanceEntry
+from aban_exchange.users.models import Wallet
+from aban_exchange.users.services import wallet_balances
+from aban_exchange.users.services import wallet_lock
+from aban_exchange.utils.exception.system import IdempotencyKeyReused
+from aban_exchange.utils.exception.system import QueueFull
+from aban_exchange.utils.exception.system import RateLimited
 from aban_exchange.utils.exception.system import ServiceUnavailable
+from aban_exchange.utils.io.redis_helper import AsyncRedisConnector
 from aban_exchange.utils.io.redis_helper import RedisConnector
 
+from .codecs import decode_order
+from .codecs import encode_order
+from .intake import get_intake_buffer
 from .models import ArchiveOrder
 from .models import Order
+from .models import PendingValue
+from .models import ProcessedEntry
+from .order_book import BookOrder
+from .order_book import OrderBook
+from .prices import token_price_get
+from .queues import STREAM_PAYLOAD_FIELD
+from .queues import IdempotencyKey
+from .queues import RateLimit
+from .queues import queue_ack
+from .queues import queue_claim
+from .queues import queue_length
+from .queues import queue_length_async
+from .queues import queue_push
+from .queues import queue_push_async
+from .queues import queue_push_guarded
+from .queues import queue_push_guarded_async
+from .queues import queue_shard
+from .spool import get_spool
 
+logger = logging.getLogger(__name__)
 
-def order_receive(*, user_id: str, amount: int, price: int):
+# queue depth read by this process, shard -> (depth, expires at)
+_queue_depths = {}
+
+
+def _admission_enabled():
+    return bool(
+        settings.REQUEST_HANDLER_QUEUE_SOFT_LIMIT
+        or settings.REQUEST_HANDLER_QUEUE_HARD_LIMIT,
+    )
+
+
+def _cached_queue_depth(shard, now):
+    cached = _queue_depths.get(shard)
+    if cached is not None and now < cached[1]:
+        return cached[0]
+    return None
+
+
+def _store_queue_depth(shard, depth, now):
+    _queue_depths[shard] = (
+        depth,
+        now + settings.REQUEST_HANDLER_QUEUE_DEPTH_CACHE_TTL / 1000,
+    )
+    soft_limit = settings.REQUEST_HANDLER_QUEUE_SOFT_LIMIT
+    if soft_limit and depth >= soft_limit:
+        # logged once per refresh, not once per order
+        logger.warning(
+            "Order queue shard %d is over its soft limit: %d orders",
+            shard,
+            depth,
+            extra={"metric": "order_queue.soft_limit", "shard": shard, "depth": depth},
+        )
+
+
+def _check_queue_depth(depth):
+    hard_limit = settings.REQUEST_HANDLER_QUEUE_HARD_LIMIT
+    if hard_limit and depth >= hard_limit:
+        raise QueueFull(wait=settings.REQUEST_HANDLER_QUEUE_RETRY_AFTER)
+
+
+def _admit(shard):
+    if not _admission_enabled():
+        return
+    now = time.monotonic()
+    depth = _cached_queue_depth(shard, now)
+    if depth is None:
+        depth = queue_length(RedisConnector.get_connection(), shard=shard)
+        _store_queue_depth(shard, depth, now)
+    _check_queue_depth(depth)
+
+
+def _rate_limit(user_id, tier):
+    if not settings.ORDER_RATE_LIMIT_ENABLED:
+        return None
+    tiers = settings.ORDER_RATE_LIMIT_TIERS
+    limit = tiers.get(tier, tiers["default"])
+    return RateLimit(
+        key=f"{settings.ORDER_RATE_LIMIT_KEY}:{user_id}",
+        rate=limit["rate"],
+        burst=limit["burst"],
+    )
+
+
+def order_bulk_max_size(tier: str = "default") -> int:
+    """
+    Returns the most orders a user can send with one bulk request.
+
+    With the rate limit a bulk request needs a token per order, so it can't hold
+    more orders than the burst of the user's rate tier.
+
+    Args:
+        tier (str): The rate tier of the user (see `User.rate_tier`).
+    """
+
+    max_size = settings.ORDER_BULK_CREATE_MAX_SIZE
+    if not settings.ORDER_RATE_LIMIT_ENABLED:
+        return max_size
+    tiers = settings.ORDER_RATE_LIMIT_TIERS
+    return min(max_size, tiers.get(tier, tiers["default"])["burst"])
+
+
+def _idempotency(user_id, key, amount, price):
+    if key is None:
+        return None
+    return IdempotencyKey(
+        # keys are chosen by the clients, they are only unique per user
+        key=f"{settings.ORDER_IDEMPOTENCY_KEY}:{user_id}:{key}",
+        value=f"{amount}:{price}",
+        ttl=settings.ORDER_IDEMPOTENCY_KEY_TTL,
+    )
+
+
+def _check_guarded_push(result, idempotency):
+    # `result` is returned by `queue_push_guarded`, tells if the orders are new
+    wait, previous = result
+    if wait < 0:
+        msg = "More orders than your rate limit allows at once."
+        raise RateLimited(detail=msg)
+    if wait > 0:
+        raise RateLimited(wait=math.ceil(wait / 1000))
+    if previous is None:
+        return True
+    if previous != idempotency.value:
+        raise IdempotencyKeyReused
+    return False
+
+
+async def _admit_async(redis, shard):
+    if not _admission_enabled():
+        return
+    now = time.monotonic()
+    depth = _cached_queue_depth(shard, now)
+    if depth is None:
+        depth = await queue_length_async(redis, shard=shard)
+        _store_queue_depth(shard, depth, now)
+    _check_queue_depth(depth)
+
+
+def order_receive(
+    *,
+    user_id: str,
+    amount: int,
+    price: int,
+    tier: str = "default",
+    idempotency_key: str | None = None,
+) -> bool:
     """
     Adds an order to the Redis queue for asynchronous processing.
 
-    This function packages the given `user_id`, `amount`, and `price` into a dictionary,
-    serializes it to JSON, and pushes it to a Redis list (queue).
-    The queue name is defined in `settings.REQUEST_HANDLER_QUEUE_NAME`.
+    This function serializes the given `user_id`, `amount`, and `price` (as JSON or
+    in a compact binary format, see `codecs.encode_order`), and pushes it to the
+    Redis queue (a list or a stream,
+    see `settings.REQUEST_HANDLER_QUEUE_BACKEND`). With
+    `settings.ORDER_INTAKE_BUFFER_ENABLED` the order is pushed together with the
+    other orders received by the worker meanwhile (see `intake.OrderIntakeBuffer`).
+    The queue name is defined in `settings.REQUEST_HANDLER_QUEUE_NAME`, with several
+    queue shards the order goes to the shard of its user (see `queues.queue_shard`).
+    With `settings.ORDER_RATE_LIMIT_ENABLED` or an idempotency key the order is
+    pushed by the same Lua script which takes a token from the bucket of the user
+    and sets the key (see `queues.queue_push_guarded`), the intake buffer is not
+    used then. With `settings.ORDER_SPOOL_ENABLED` an order which can't reach
+    Redis is written to the local spool (see `spool.OrderSpool`) instead of being
+    refused, without rate limit.
 
     Args:
         user_id (str): The unique identifier of the user placing the order.
         amount (int): The quantity or amount of the order.
         price (int): The price of the order.
+        tier (str): The rate tier of the user (see `User.rate_tier`).
+        idempotency_key (str | None): Chosen by the client, an order sent again
+            with the same key in `settings.ORDER_IDEMPOTENCY_KEY_TTL` seconds is
+            not pushed again.
+
+    Returns:
+        bool: False if the order was already received with the idempotency key.
 
     Raises:
+        QueueFull: If the queue shard holds more orders than
+        `settings.REQUEST_HANDLER_QUEUE_HARD_LIMIT`.
+        RateLimited: If the user sent more orders than their rate tier allows.
+        IdempotencyKeyReused: If the idempotency key was used for another order.
         ServiceUnavailable: If an error occurs while connecting to Redis or pushing data
         to the queue.
     """
 
-    data = {
-        "user_id": user_id,
-        "amount": amount,
-        "price": price,
-    }
+    entry = (
+        queue_shard(user_id),
+        encode_order(user_id=user_id, amount=amount, price=price),
+    )
+    rate_limit = _rate_limit(user_id, tier)
+    idempotency = _idempotency(user_id, idempotency_key, amount, price)
     try:
-        redis = RedisConnector.get_connection()
-        redis.rpush(
-            settings.REQUEST_HANDLER_QUEUE_NAME,
-            json.dumps(data),
+        _admit(entry[0])
+        if rate_limit or idempotency:
+            shard, item = entry
+            return _order_push_guarded(shard, [item], rate_limit, idempotency)
+        if settings.ORDER_INTAKE_BUFFER_ENABLED:
+            # returns after the batch holding this order is pushed
+            get_intake_buffer(_order_push).submit(entry)
+        else:
+            _order_push([entry])
+    except (QueueFull, RateLimited, IdempotencyKeyReused):
+        raise
+    except RedisConnectionError:
+        _order_spool([entry], idempotency)
+    except Exception:  # noqa: BLE001
+        msg = "Error on reciveing order, please try later!"
+        raise ServiceUnavailable(msg)  # noqa: B904
+    return True
+
+
+def order_receive_bulk(*, user_id: str, orders: list[dict], tier: str = "default"):
+    """
+    Adds several orders of a user to the Redis queue at once.
+
+    Same as `order_receive` for every order, but all of them are pushed by one
+    multi-value RPUSH (or one pipelined XADD with the stream backend). With the
+    rate limit every order takes a token, all orders are received or none.
+
+    Args:
+        user_id (str): The unique identifier of the user placing the orders.
+        orders (list[dict]): Validated orders, each with `amount` and `price`.
+        tier (str): The rate tier of the user (see `User.rate_tier`).
+
+    Raises:
+        QueueFull: If the queue shard holds more orders than
+        `settings.REQUEST_HANDLER_QUEUE_HARD_LIMIT`.
+        RateLimited: If the user sent more orders than their rate tier allows.
+        ServiceUnavailable: If an error occurs while connecting to Redis or pushing
+        data to the queue, none of the orders is received then.
+    """
+
+    shard = queue_shard(user_id)
+    entries = [
+        (
+            shard,
+            encode_order(user_id=user_id, amount=order["amount"], price=order["price"]),
         )
+        for order in orders
+    ]
+    rate_limit = _rate_limit(user_id, tier)
+    try:
+        _admit(shard)
+        if rate_limit:
+            items = [item for _, item in entries]
+            _order_push_guarded(shard, items, rate_limit, None)
+        else:
+            _order_push(entries)
+    except (QueueFull, RateLimited):
+        raise
+    except RedisConnectionError:
+        _order_spool(entries)
+    except Exception:  # noqa: BLE001
+        msg = "Error on reciveing order, please try later!"
+        raise ServiceUnavailable(msg)  # noqa: B904
+
+
+def _order_push(entries):
+    # entries are (shard, serialized order) pairs
+    items_by_shard = defaultdict(list)
+    for shard, item in entries:
+        items_by_shard[shard].append(item)
+
+    redis = RedisConnector.get_connection()
+    if len(items_by_shard) == 1:
+        [(shard, items)] = items_by_shard.items()
+        queue_push(redis, items, shard=shard)
+        return
+
+    # orders of several shards (e.g. a flush of the intake buffer), one round trip
+    pipe = redis.pipeline(transaction=False)
+    for shard, items in items_by_shard.items():
+        queue_push(pipe, items, shard=shard)
+    pipe.execute()
+
+
+def _order_spool(entries, idempotency=None):
+    # Redis is unreachable, so the orders were not pushed (a command may have
+    # reached Redis right before the connection broke, only orders with an
+    # idempotency key are sure to be received once then)
+    msg = "Error on reciveing order, please try later!"
+    if not settings.ORDER_SPOOL_ENABLED:
+        raise ServiceUnavailable(msg)
+    try:
+        get_spool().append(entries, idempotency)
+    except OSError:
+        logger.exception("Error on spooling orders")
+        raise ServiceUnavailable(msg)  # noqa: B904
+
+
+def _order_push_guarded(shard, items, rate_limit, idempotency):
+    result = queue_push_guarded(
+        RedisConnector.get_connection(),
+        items,
+        shard=shard,
+        rate_limit=rate_limit,
+        idempotency=idempotency,
+    )
+    return _check_guarded_push(result, idempotency)
+
+
+async def order_receive_async(
+    *,
+    user_id: str,
+    amount: int,
+    price: int,
+    tier: str = "default",
+    idempotency_key: str | None = None,
+) -> bool:
+    """
+    Asynchronous variant of `order_receive` for ASGI workers.
+
+    Pushes the order with a `redis.asyncio` connection taken from the shared pool
+    of `AsyncRedisConnector`, so waiting for Redis doesn't block the worker.
+
+    Returns:
+        bool: False if the order was already received with the idempotency key.
+
+    Raises:
+        QueueFull: If the queue shard holds more orders than
+        `settings.REQUEST_HANDLER_QUEUE_HARD_LIMIT`.
+        RateLimited: If the user sent more orders than their rate tier allows.
+        IdempotencyKeyReused: If the idempotency key was used for another order.
+        ServiceUnavailable: If an error occurs while connecting to Redis or pushing
+        data to the queue.
+    """
+
+    item = encode_order(user_id=user_id, amount=amount, price=price)
+    shard = queue_shard(user_id)
+    rate_limit = _rate_limit(user_id, tier)
+    idempotency = _idempotency(user_id, idempotency_key, amount, price)
+    try:
+        redis = AsyncRedisConnector.get_connection()
+        await _admit_async(redis, shard)
+        if rate_limit or idempotency:
+            result = await queue_push_guarded_async(
+                redis,
+                [item],
+                shard=shard,
+                rate_limit=rate_limit,
+                idempotency=idempotency,
+            )
+            return _check_guarded_push(result, idempotency)
+        await queue_push_async(redis, [item], shard=shard)
+    except (QueueFull, RateLimited, IdempotencyKeyReused):
+        raise
+    except RedisConnectionError:
+        await sync_to_async(_order_spool)([(shard, item)], idempotency)
     except Exception:  # noqa: BLE001
         msg = "Error on reciveing order, please try later!"
         raise ServiceUnavailable(msg)  # noqa: B904
+    return True
+
+
+def _pending_value_add(placed_orders, shard):
+    value_by_price = defaultdict(int)
+    for order in placed_orders:
+        value_by_price[order.price] += order.amount
+
+    # Always called at the end of the transaction and in price order, so the
+    # price rows are locked last and in the same order by every validator. Only
+    # the rows of the validated shard are written.
+    for price in sorted(value_by_price):
+        PendingValue.objects.get_or_create(price=price, shard=shard)
+        PendingValue.objects.filter(price=price, shard=shard).update(
+            value=F("value") + value_by_price[price],
+        )
+
+
+def _place_orders(raw_orders, shard):
+    # Group the orders by owner, keeping the arrival order inside each group,
+    # so the balance of every user is checked and written only once per batch
+    orders_by_owner = defaultdict(list)
+    for index, data in enumerate(raw_orders):
+        orders_by_owner[int(data["user_id"])].append(index)
+
+    accepted = [False] * len(raw_orders)
+    debits = []  # Balance entries of the users who placed orders
+
+    with transaction.atomic():
+        # Lock the wallets of the users for transaction safety, in user id order so
+        # concurrent validators always lock rows in the same order. The balances
+        # are read after the lock, so they include every entry already written.
+        balances = wallet_balances(wallet_lock(orders_by_owner))
+
+        for user_id, current in balances.items():
+            # Running balance of the user over his/her orders in arrival order,
+            # an order is accepted if the balance left by the previous ones is enough
+            balance = current.balance
+            for index in orders_by_owner[user_id]:
+                amount = raw_orders[index]["amount"]
+                if balance >= amount:
+                    balance -= amount
+                    accepted[index] = True
+
+            if balance != current.balance:
+                debits.append(
+                    BalanceEntry(wallet_id=user_id, balance=balance - current.balance),
+                )
+
+        placed_orders = []
+        droped_orders = []
+        for index, data in enumerate(raw_orders):
+            if accepted[index]:
+                placed_orders.append(
+                    Order(
+                        user_id=data["user_id"],
+                        price=data["price"],
+                        amount=data["amount"],
+                    ),
+                )
+            else:
+                # Insufficient balance or unknown user (no wallet)
+                droped_orders.append(int(data["user_id"]))
+
+        # Debit the wallets and save placed orders in bulk to decrease IO operation
+        if debits:
+            BalanceEntry.objects.bulk_create(debits)
+        if placed_orders:
+            placed_orders = Order.objects.bulk_create(placed_orders)
+            _pending_value_add(placed_orders, shard)
+
+    return [
+        (order.id, int(order.user_id), order.price, order.amount)
+        for order in placed_orders
+    ], droped_orders
+
+
+# The whole batch is sent as three arrays and PostgreSQL decides which orders are
+# accepted. `order_owner` reads the balances like `wallet_balances` (snapshot plus
+# the entries after it), the wallets are locked by a previous statement. `walk`
+# visits the orders of each user in arrival order and carries the remaining
+# balance from one order to the next, exactly like the running balance in
+# `_place_orders`, so an order is dropped only when the balance left by the
+# previous orders of the same user is not enough.
+_PLACE_ORDERS_SQL = """
+WITH RECURSIVE batch AS (
+    SELECT
+        b.user_id,
+        b.amount,
+        b.price,
+        b.seq,
+        row_number() OVER (PARTITION BY b.user_id ORDER BY b.seq) AS rn
+    FROM unnest(%s::bigint[], %s::integer[], %s::integer[])
+        WITH ORDINALITY AS b(user_id, amount, price, seq)
+),
+order_owner AS (
+    SELECT wl.user_id AS id, wl.balance + COALESCE(SUM(e.balance), 0) AS balance
+    FROM {wallet_table} wl
+    LEFT JOIN {entry_table} e ON e.wallet_id = wl.user_id AND e.id > wl.entry_id
+    WHERE wl.user_id IN (SELECT user_id FROM batch)
+    GROUP BY wl.user_id, wl.balance
+),
+walk AS (
+    SELECT
+        b.user_id,
+        b.rn,
+        b.seq,
+        b.amount,
+        b.price,
+        b.amount <= o.balance AS accepted,
+        CASE WHEN b.amount <= o.balance
+            THEN o.balance - b.amount ELSE o.balance END AS remaining
+    FROM batch b
+    JOIN order_owner o ON o.id = b.user_id
+    WHERE b.rn = 1
+    UNION ALL
+    SELECT
+        b.user_id,
+        b.rn,
+        b.seq,
+        b.amount,
+        b.price,
+        b.amount <= w.remaining,
+        CASE WHEN b.amount <= w.remaining
+            THEN w.remaining - b.amount ELSE w.remaining END
+    FROM walk w
+    JOIN batch b ON b.user_id = w.user_id AND b.rn = w.rn + 1
+),
+debit AS (
+    INSERT INTO {entry_table} (wallet_id, balance, token_balance, created_at)
+    SELECT user_id, -SUM(amount), 0, now()
+    FROM walk
+    WHERE accepted
+    GROUP BY user_id
+    ORDER BY user_id
+),
+placed AS (
+    INSERT INTO {order_table} (created_at, updated_at, user_id, price, amount)
+    SELECT now(), now(), user_id, price, amount
+    FROM walk
+    WHERE accepted
+    ORDER BY seq
+    RETURNING id, user_id, price, amount
+),
+pending AS (
+    INSERT INTO {pending_table} AS p (price, shard, value)
+    SELECT price, %s, SUM(amount)
+    FROM walk
+    WHERE accepted
+    GROUP BY price
+    ORDER BY price
+    ON CONFLICT (price, shard) DO UPDATE SET value = p.value + EXCLUDED.value
+)
+SELECT id, user_id, price, amount FROM placed
+UNION ALL
+SELECT NULL, b.user_id, NULL, NULL
+FROM batch b
+LEFT JOIN walk w ON w.seq = b.seq
+WHERE w.accepted IS NOT TRUE
+"""
+
+
+def _place_orders_set_based(raw_orders, shard):
+    # orders of users without a wallet never join `order_owner`, so they are
+    # dropped too
+    sql = _PLACE_ORDERS_SQL.format(
+        wallet_table=connection.ops.quote_name(Wallet._meta.db_table),  # noqa: SLF001
+        entry_table=connection.ops.quote_name(BalanceEntry._meta.db_table),  # noqa: SLF001
+        order_table=connection.ops.quote_name(Order._meta.db_table),  # noqa: SLF001
+        pending_table=connection.ops.quote_name(PendingValue._meta.db_table),  # noqa: SLF001
+    )
+    params = (
+        [int(data["user_id"]) for data in raw_orders],
+        [data["amount"] for data in raw_orders],
+        [data["price"] for data in raw_orders],
+        shard,
+    )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Locked by a separate statement, so the balances read by the next one
+        # include the entries of the transactions waited for
+        wallet_lock(set(params[0]))
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    placed_orders = [row for row in rows if row[0] is not None]
+    droped_orders = [row[1] for row in rows if row[0] is None]
+    return placed_orders, droped_orders
 
 
-def order_validator():
+def _processed_key(shard, entry_id):
+    # entry IDs are only unique inside one stream, shard 0 is the stream used with
+    # a single shard
+    if shard == 0:
+        return entry_id
+    return f"{shard}:{entry_id}"
+
+
+def _unprocessed_items(entry_ids, items, shard):
+    if not entry_ids:
+        # list backend, the batch was removed from the queue by `queue_claim`
+        return items
+
+    # The stream delivers an entry again until it is acknowledged. Entries placed
+    # by a validator which crashed (or failed to acknowledge) before are skipped,
+    # and the others are recorded in this transaction so they are placed only once.
+    # A validator placing the same entries at the same time fails on the primary
+    # key and leaves them pending.
+    keys = [_processed_key(shard, entry_id) for entry_id in entry_ids]
+    processed = set(
+        ProcessedEntry.objects.filter(entry_id__in=keys).values_list(
+            "entry_id",
+            flat=True,
+        ),
+    )
+    new_entries = [
+        (key, item)
+        for key, item in zip(keys, items, strict=True)
+        if key not in processed and item is not None
+    ]
+    ProcessedEntry.objects.bulk_create(
+        ProcessedEntry(entry_id=key) for key, _ in new_entries
+    )
+    return [item for _, item in new_entries]
+
+
+def _parse_orders(items):
+    raw_orders = []
+    for item in items:
+        try:
+            data = decode_order(item)
+        except ValueError:
+            # A malformed order would fail every batch it is claimed in, so it is
+            # dropped (and acknowledged with the batch) instead
+            logger.error("Dropping malformed queued order: %r", item)  # noqa: TRY400
+            continue
+        raw_orders.append(data)
+    return raw_orders
+
+
+def _forget_processed(entry_ids, shard):
+    # acknowledged entries are never delivered again
+    if not entry_ids:
+        return
+    try:
+        ProcessedEntry.objects.filter(
+            entry_id__in=[_processed_key(shard, entry_id) for entry_id in entry_ids],
+        ).delete()
+    except DatabaseError:
+        logger.exception("Error on cleaning %d processed entries", len(entry_ids))
+
+
+def order_validator(*, block: int | None = None, shard: int = 0):
     """
     Validates and processes a batch of orders from the Redis queue.
 
     This function retrieves a batch of raw orders from a Redis queue, validates them
-    against the users' balances, and processes them in a transactional manner. Valid
-    orders are placed, users' balances are updated, and invalid orders are dropped.
+    against the users' wallets, and processes them in a transactional manner. Valid
+    orders are placed, wallet balances are updated, and invalid orders are dropped.
+
+    Args:
+        block (int | None): If given, wait up to this many milliseconds for new
+            orders when the queue is empty. Used by the `run_order_consumer` daemon.
+        shard (int): The queue shard to validate. A user's orders are always in
+            the same shard, so validators of different shards never wait for each
+            other's locks.
 
     Returns:
         tuple: A tuple containing:
@@ -66,96 +660,283 @@ def order_validator():
             - If there is a failure in the database transaction.
 
     Steps:
-        1. Retrieve a batch of orders from the Redis queue.
+        1. Atomically claim a batch of orders from the Redis queue.
         2. Parse and prepare raw orders and their associated user IDs.
-        3. Validate and process orders in a database transaction:
+        3. Validate and process orders in a database transaction (on PostgreSQL the
+           whole batch is validated by one set-based statement, see
+           `settings.ORDER_VALIDATOR_SET_BASED`):
             - Deduct balance for valid orders.
             - Save valid orders in the database.
             - Drop invalid orders (insufficient balance).
         4. Handle transaction failures:
             - Move placed orders to the dropped list if the transaction fails.
+        5. Acknowledge the batch (stream backend only), unacknowledged batches are
+           claimed again by another validator. The entry IDs of a placed batch are
+           recorded in its transaction (`ProcessedEntry`), so a batch claimed
+           again is never placed twice.
     """
 
     try:
-        redis = RedisConnector.get_connection()
-        items = redis.lrange(
-            settings.REQUEST_HANDLER_QUEUE_NAME,
-            0,
-            settings.REQUEST_HANDLER_BATCH_SIZE - 1,
+        # binary orders can't be decoded as text, see `codecs.decode_order`
+        redis = RedisConnector.get_connection(binary=True)
+        entry_ids, items = queue_claim(
+            redis,
+            settings.REQUEST_HANDLER_BATCH_SIZE,
+            block=block,
+            shard=shard,
         )
-        if not items:
+        if all(item is None for item in items):
+            # Nothing to process, but entries without payload must be acknowledged
+            queue_ack(redis, entry_ids, shard=shard)
             # Return empty lists if no items are found in the queue
             return [], []
-
-        # Trim the Redis queue to remove the processed batch
-        redis.ltrim(
-            settings.REQUEST_HANDLER_QUEUE_NAME,
-            settings.REQUEST_HANDLER_BATCH_SIZE,
-            -1,
-        )
     except Exception as e:  # noqa: BLE001
         msg = f"Error accessing Redis: {e}"
         raise ServiceUnavailable(msg)  # noqa: B904
 
-    raw_orders = []
-    order_owner_ids = []
-    for item in items:
-        # Deserialize each order and collect user IDs for further processing
-        data = json.loads(item)
-        raw_orders.append(data)
-        order_owner_ids.append(data["user_id"])
-
     try:
         with transaction.atomic():
-            # Retrieve users with their balances in a locked state for transaction safety  # noqa: E501
-            order_owner_queryset = (
-                User.objects.select_for_update()
-                .filter(id__in=order_owner_ids)
-                .only(
-                    "id",
-                    "email",
-                    "balance",
+            items = _unprocessed_items(entry_ids, items, shard)
+            # Deserialize each order for further processing
+            raw_orders = _parse_orders(items)
+            if not raw_orders:
+                placed_orders, droped_orders = [], []
+            elif (
+                settings.ORDER_VALIDATOR_SET_BASED and connection.vendor == "postgresql"
+            ):
+                placed_orders, droped_orders = _place_orders_set_based(
+                    raw_orders,
+                    shard,
                 )
-            )
-
-            # Map users by their IDs for quick lookup
-            order_owner_map = {user.id: user for user in order_owner_queryset}
-            user_balance_update = []  # Users whose balances will be updated
-            placed_orders = []
-            droped_orders = []
-
-            for _ in raw_orders:
-                order = Order(
-                    user_id=_["user_id"],
-                    price=_["price"],
-                    amount=_["amount"],
-                )
-                order_owner = order_owner_map.get(int(order.user_id))
-
-                # Check if the user has enough balance to place the order
-                if order_owner.balance >= order.amount:
-                    order_owner.balance -= order.amount
-                    user_balance_update.append(order_owner)
-                    placed_orders.append(order)
-                else:
-                    droped_orders.append(order.user_id)
-
-            # Update user balances and save placed orders in bulk to decrease IO operation  # noqa: E501
-            if user_balance_update:
-                User.objects.bulk_update(user_balance_update, ["balance"])
-            if placed_orders:
-                placed_orders = Order.objects.bulk_create(placed_orders)
-
+            else:
+                placed_orders, droped_orders = _place_orders(raw_orders, shard)
     except DatabaseError as e:
-        # If the transaction fails, move placed orders to the dropped list
-        droped_orders.extend(placed_orders)
-        placed_orders = []
-
         msg = f"Database transaction failed: {e}"
         raise ServiceUnavailable(msg)  # noqa: B904
 
+    try:
+        queue_ack(redis, entry_ids, shard=shard)
+    except Exception:
+        # The batch is already committed, failing here would hide the result from
+        # the caller, so we only report it. the entries stay pending and will be
+        # claimed again after `REQUEST_HANDLER_CLAIM_IDLE_TIME`, then skipped
+        # because they are recorded as processed.
+        logger.exception("Error on acknowledging %d queued orders", len(entry_ids))
+    else:
+        _forget_processed(entry_ids, shard)
+
+    if settings.ORDER_BOOK_ENABLED and placed_orders:
+        order_book_publish(placed_orders)
+
     # Return the IDs of placed orders and dropped orders
-    return [i.id for i in placed_orders], droped_orders
+    return [order[0] for order in placed_orders], droped_orders
+
+
+def order_delete(queryset):
+    """
+    Deletes pending orders outside the validator and the filler (e.g. from the admin).
+
+    The pending value of their prices is decreased in the same transaction, so
+    `PendingValue` keeps matching the order table.
+
+    Args:
+        queryset (QuerySet): Orders to delete.
+
+    Returns:
+        int: Number of deleted orders.
+    """
+
+    with transaction.atomic():
+        orders = list(
+            queryset.select_for_update()
+            .order_by("id")
+            .values_list("id", "price", "amount"),
+        )
+        Order.objects.filter(id__in=[order[0] for order in orders]).delete()
+
+        value_by_price = defaultdict(int)
+        for _, price, amount in orders:
+            value_by_price[price] += amount
+        for price in sorted(value_by_price):
+            _pending_value_subtract(price, value_by_price[price])
+
+    return len(orders)
+
+
+def _pending_value(price):
+    return (
+        (
+            PendingValue.objects.filter(price=price).aggregate(value=Sum("value"))[
+                "value"
+            ]
+        )
+        or 0
+    )
+
+
+def _pending_value_subtract(price, value):
+    # Like `_pending_value_add`, the price rows are locked after the wallets, in
+    # shard order. The value filled is not known per shard, so the rows are folded
+    # into the first one, which keeps every row positive.
+    rows = list(
+        PendingValue.objects.select_for_update().filter(price=price).order_by("shard"),
+    )
+    if not rows:
+        return
+    total = sum(row.value for row in rows) - value
+    for row in rows:
+        row.value = 0
+    rows[0].value = total
+    PendingValue.objects.bulk_update(rows, ["value"])
+
+
+def _fill_chunk(chunk, price, token_group_by_user):
+    filled_value = 0
+    for _, user_id, _, amount in chunk:
+        filled_value += amount
+        # Calculate tokens for each user and accumulate them
+        token_group_by_user[user_id] = token_group_by_user.get(
+            user_id,
+            0,
+        ) + (amount // price)
+
+    # Archive and delete the processed orders from the database,
+    # because we need the number of records in the table to be optimized
+    # for faster access
+    ArchiveOrder.objects.bulk_create(
+        ArchiveOrder(id=order_id, user_id=user_id, price=price, amount=amount)
+        for order_id, user_id, price, amount in chunk
+    )
+    Order.objects.filter(id__in=[order[0] for order in chunk]).delete()
+    return filled_value
+
+
+def _credit_tokens(token_group_by_user):
+    # Lock the wallets by user id like the validators do before crediting them,
+    # otherwise a validator and the filler could deadlock
+    locked_user_ids = wallet_lock(token_group_by_user)
+
+    BalanceEntry.objects.bulk_create(
+        BalanceEntry(wallet_id=user_id, token_balance=token_group_by_user[user_id])
+        for user_id in locked_user_ids
+        if token_group_by_user[user_id]
+    )
+    return locked_user_ids
+
+
+def _fill_orders(price):
+    queryset = Order.objects.filter(price=price)
+    # Dictionary to group tokens count by user ID,
+    # if we don't use this mechanism we need to update field in db by each order
+    # placed by a specific user
+    # example: if user 'A' placed 2 order with volume 10$ on price 5
+    # he must recieve 4 tokens.
+    # well, if we don't use this algorithm he/she just recieves 2 tokens
+    token_group_by_user = {}
+    filled_value = 0
+
+    with transaction.atomic():
+        # Orders placed after this point wait for the next run, otherwise the walk
+        # below could chase new orders forever
+        last_id = queryset.aggregate(last_id=Max("id")).get("last_id") or 0
+        cursor_id = 0
+
+        # Walk the orders by primary key in chunks, so memory is bounded by the chunk
+        # size and the number of users, not by the number of pending orders
+        while cursor_id < last_id:
+            chunk = list(
+                queryset.filter(id__gt=cursor_id, id__lte=last_id)
+                .order_by("id")
+                .values_list("id", "user_id", "price", "amount")[
+                    : settings.ORDER_FILLER_CHUNK_SIZE
+                ],
+            )
+            if not chunk:
+                break
+
+            filled_value += _fill_chunk(chunk, price, token_group_by_user)
+            cursor_id = chunk[-1][0]
+
+        _credit_tokens(token_group_by_user)
+        _pending_value_subtract(price, filled_value)
+
+    return sorted(token_group_by_user)
+
+
+def _fill_order_ids(price, order_ids, min_value):
+    token_group_by_user = {}
+    chunk_size = settings.ORDER_FILLER_CHUNK_SIZE
+
+    with transaction.atomic():
+        # Lock the orders first, orders which are already gone (e.g. deleted from
+        # the admin) are not found and never credited
+        orders = []
+        for start in range(0, len(order_ids), chunk_size):
+            orders.extend(
+                Order.objects.select_for_update()
+                .filter(id__in=order_ids[start : start + chunk_size], price=price)
+                .order_by("id")
+                .values_list("id", "user_id", "price", "amount"),
+            )
+
+        # The book may be stale, the orders which still exist must reach the
+        # minimum value on their own
+        if not orders or sum(order[3] for order in orders) < min_value:
+            return [], orders
+
+        filled_value = 0
+        for start in range(0, len(orders), chunk_size):
+            filled_value += _fill_chunk(
+                orders[start : start + chunk_size],
+                price,
+                token_group_by_user,
+            )
+
+        _credit_tokens(token_group_by_user)
+        _pending_value_subtract(price, filled_value)
+
+    return sorted(token_group_by_user), []
+
+
+# Moves every order of the given price to the archive in one statement. `moved`
+# holds exactly the deleted rows, so orders placed while the statement runs are
+# neither archived nor lost, they wait for the next run. Tokens are computed per
+# order (amount / price) and summed per user, like the python path does, and
+# credited afterwards by `_credit_tokens`.
+_FILL_ORDERS_SQL = """
+WITH moved AS (
+    DELETE FROM {order_table}
+    WHERE price = %(price)s
+    RETURNING id, user_id, price, amount
+),
+archived AS (
+    INSERT INTO {archive_table} (id, created_at, updated_at, user_id, price, amount)
+    SELECT id, now(), now(), user_id, price, amount
+    FROM moved
+)
+SELECT user_id, SUM(amount / %(price)s), SUM(amount)
+FROM moved
+GROUP BY user_id
+"""
+
+
+def _fill_orders_set_based(price):
+    sql = _FILL_ORDERS_SQL.format(
+        order_table=connection.ops.quote_name(Order._meta.db_table),  # noqa: SLF001
+        archive_table=connection.ops.quote_name(ArchiveOrder._meta.db_table),  # noqa: SLF001
+    )
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {"price": price})
+            rows = cursor.fetchall()
+
+        # Separate statements, so the users are surely locked in id order and the
+        # price row after them
+        user_ids = _credit_tokens({row[0]: row[1] for row in rows})
+        _pending_value_subtract(price, sum(row[2] for row in rows))
+
+    return user_ids
 
 
 def order_filler():
@@ -163,22 +944,26 @@ def order_filler():
     Processes orders that match a specific price, updates user token balances,
     and archives the orders in bulk.
 
-    This function checks if the total value of orders with a price matching
-    `settings.TOKEN_PRICE` meets or exceeds a minimum threshold (`settings.MIN_ORDERS_VALUE`).
+    This function checks if the total value of orders with a price matching the
+    current token price (see `prices.token_price_get`) meets or exceeds a minimum
+    threshold (`settings.MIN_ORDERS_VALUE`).
     If so, it calculates the number of tokens to add to each user's balance based on their
     orders, archives the orders, and updates the users' balances within a database transaction.
 
     Returns:
         list: A list of user IDs whose token balances were updated.
 
-    Returns an empty list if the total value of orders is below the minimum threshold.
+    Returns an empty list if the total value of orders is below the minimum threshold,
+    or if the orders are filled by the order book (`settings.ORDER_BOOK_ENABLED`).
 
     Steps:
-        1. Retrieve and aggregate orders with the matching price.
+        1. Read the pending value of the matching price from `PendingValue`.
         2. Check if the total value of these orders meets the minimum threshold.
-        3. If valid, process the orders:
+        3. If valid, process the orders (on PostgreSQL with one set-based statement,
+           see `settings.ORDER_FILLER_SET_BASED`, otherwise in primary key chunks of
+           `settings.ORDER_FILLER_CHUNK_SIZE` orders):
             - Group token amounts by user.
-            - Update user balances with the calculated tokens.
+            - Credit the calculated tokens to the users' wallets.
             - Archive the processed orders.
             - Delete the processed orders from the database.
         4. Return the list of updated user IDs.
@@ -188,52 +973,192 @@ def order_filler():
             - If there is a failure in the database transaction.
     """
 
-    queryset = Order.objects.filter(price=settings.TOKEN_PRICE)
-    total_value = queryset.aggregate(
-        total_value=Sum(
-            "amount",
-            default=0,
-        ),
-    ).get("total_value")
+    if settings.ORDER_BOOK_ENABLED:
+        # `run_order_book` fills the orders, filling them here too would leave
+        # stale levels in its book
+        return []
 
-    if total_value >= settings.MIN_ORDERS_VALUE:
-        updated_user_token = []
-        archive_order = []
-
-        # Dictionary to group tokens count by user ID,
-        # if we don't use this mechanism we need to update field in db by each order
-        # placed by a specific user
-        # example: if user 'A' placed 2 order with volume 10$ on price 5
-        # he must recieve 4 tokens.
-        # well, if we don't use this algorithm he/she just recieves 2 tokens
-        token_group_by_user = {}
+    price = token_price_get()
+    # Read the maintained counter instead of aggregating the order table
+    total_value = _pending_value(price)
 
+    if total_value >= settings.MIN_ORDERS_VALUE:
         try:
-            with transaction.atomic():
-                for order in queryset.select_related("user"):
-                    # Calculate tokens for each user and accumulate them
-                    token_group_by_user[order.user.id] = token_group_by_user.get(
-                        order.user.id,
-                        0,
-                    ) + (order.amount // settings.TOKEN_PRICE)
-                    archive_order.append(order)
-                    updated_user_token.append(order.user)
-
-                # Update user token balances in memory
-                for user in updated_user_token:
-                    user.token_balance += token_group_by_user.get(user.id)
-
-                User.objects.bulk_update(updated_user_token, ["token_balance"])
-
-                # Archive and delete the processed orders from the database,
-                # because we need the number of records in the table to be optimized
-                # for faster access
-                ArchiveOrder.objects.bulk_create(archive_order)
-                queryset.delete()
-
-            return [user.id for user in updated_user_token]
+            if settings.ORDER_FILLER_SET_BASED and connection.vendor == "postgresql":
+                return _fill_orders_set_based(price)
+            return _fill_orders(price)
         except DatabaseError as e:
             msg = f"Database transaction failed: {e}"
             raise ServiceUnavailable(msg)  # noqa: B904
 
     return []
+
+
+def order_filler_trigger():
+    """
+    Decides if the filler must run right now.
+
+    This function is called after a batch of orders is placed. If the pending value
+    on the current token price reached `settings.MIN_ORDERS_VALUE`, it tries to take a
+    short Redis lock (`SET NX PX`) so only one of the concurrent validators starts
+    the filler for the same crossing.
+
+    Returns:
+        bool: True if the caller must start the filler.
+
+    Notes:
+        Redis errors are only logged, the periodic filler task fills the orders
+        a bit later in that case.
+    """
+
+    # The order book engine fills the orders itself
+    if settings.ORDER_BOOK_ENABLED:
+        return False
+
+    if _pending_value(token_price_get()) < settings.MIN_ORDERS_VALUE:
+        return False
+
+    try:
+        redis = RedisConnector.get_connection()
+        return bool(
+            redis.set(
+                settings.ORDER_FILLER_TRIGGER_KEY,
+                1,
+                nx=True,
+                px=settings.ORDER_FILLER_TRIGGER_DEBOUNCE,
+            ),
+        )
+    except Exception:
+        logger.exception("Error on triggering the order filler")
+        return False
+
+
+def order_book_publish(placed_orders: list):
+    """
+    Publishes newly placed orders to the order book engine.
+
+    Placed orders are appended as one entry to the Redis stream defined in
+    `settings.ORDER_BOOK_STREAM_NAME`, which is consumed by the `run_order_book`
+    daemon to keep its in-memory book in sync with the `Order` table.
+
+    Args:
+        placed_orders (list): `(id, user_id, price, amount)` of the placed orders.
+
+    Notes:
+        Redis errors are only logged, the orders are already committed and the
+        engine loads them from the database on its next start.
+    """
+
+    try:
+        redis = RedisConnector.get_connection()
+        redis.xadd(
+            settings.ORDER_BOOK_STREAM_NAME,
+            {STREAM_PAYLOAD_FIELD: json.dumps(placed_orders)},
+            maxlen=settings.ORDER_BOOK_STREAM_MAXLEN,
+            approximate=True,
+        )
+    except Exception:
+        logger.exception("Error on publishing %d placed orders", len(placed_orders))
+
+
+def order_book_load(book: OrderBook):
+    """
+    Loads every pending order from the database into the order book.
+
+    Orders are streamed from the database in chunks of
+    `settings.ORDER_FILLER_CHUNK_SIZE`, orders already in the book are skipped.
+
+    Returns:
+        OrderBook: The given book.
+    """
+
+    queryset = Order.objects.order_by("id").values_list(
+        "id",
+        "user_id",
+        "price",
+        "amount",
+    )
+    for row in queryset.iterator(chunk_size=settings.ORDER_FILLER_CHUNK_SIZE):
+        book.add(BookOrder(*row))
+    return book
+
+
+def order_book_fill(book: OrderBook):
+    """
+    Fills the price level of the order book which became fillable.
+
+    The level of the current token price is taken from the book when its value
+    reached `settings.MIN_ORDERS_VALUE`, then the fill is persisted: the orders
+    are archived and deleted, tokens are credited to their owners and the pending
+    value of the price is decreased, all in one transaction. The total of the
+    orders still in the table is checked again before, so a stale level is put
+    back in the book instead of being filled below the minimum value.
+
+    Args:
+        book (OrderBook): The in-memory order book.
+
+    Returns:
+        list: A list of user IDs whose token balances were updated.
+
+    Raises:
+        ServiceUnavailable:
+            - If there is a failure in the database transaction, the orders are
+              put back in the book.
+    """
+
+    price = token_price_get()
+    orders = book.match(price, settings.MIN_ORDERS_VALUE)
+    if not orders:
+        return []
+
+    try:
+        user_ids, unfilled_orders = _fill_order_ids(
+            price,
+            [order.id for order in orders],
+            settings.MIN_ORDERS_VALUE,
+        )
+    except DatabaseError as e:
+        # Nothing is persisted, the orders are still pending
+        for order in orders:
+            book.add(order)
+
+        msg = f"Database transaction failed: {e}"
+        raise ServiceUnavailable(msg)  # noqa: B904
+
+    # Below the minimum value in the database, the orders which still exist are
+    # put back and wait for more orders on their price
+    for row in unfilled_orders:
+        book.add(BookOrder(*row))
+    return user_ids
+
+
+def order_history(*, user_id: int, page_size: int | None = None):
+    """
+    Yields the filled orders of a user, oldest first.
+
+    The orders are read from `ArchiveOrder` one page at a time, each page starting
+    after the last id of the previous one (keyset pagination on the `(user, id)`
+    index), so memory stays bounded and no query or transaction is held open
+    between two pages, whatever the number of orders of the user.
+
+    Args:
+        user_id (int): ID of the user.
+        page_size (int | None): Orders per query, defaults to
+            `settings.ORDER_HISTORY_PAGE_SIZE`.
+
+    Yields:
+        tuple: (id, price, amount, filled at) of every order.
+    """
+
+    page_size = page_size or settings.ORDER_HISTORY_PAGE_SIZE
+    last_id = 0
+    while True:
+        page = list(
+            ArchiveOrder.objects.filter(user_id=user_id, id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "price", "amount", "created_at")[:page_size],
+        )
+        yield from page
+        if len(page) < page_size:
+            return
+        last_id = page[-1][0]
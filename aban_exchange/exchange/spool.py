@@ -0,0 +1,289 @@
+import fcntl
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+
+from .queues import IdempotencyKey
+from .queues import queue_push_guarded
+
+logger = logging.getLogger(__name__)
+
+# A segment is a sequence of records: payload length and CRC32 of the payload,
+# then the payload made of the queue shard, the lengths of the idempotency key and
+# value, the key, the value and the serialized order.
+_RECORD_HEADER = struct.Struct("<II")
+_RECORD_FIELDS = struct.Struct("<HHH")
+
+# segments are named by their creation time, so sorting them by name replays the
+# oldest first; a segment is renamed from ".open" to ".seg" once it is complete
+OPEN_SUFFIX = ".open"
+SEALED_SUFFIX = ".seg"
+CHECKPOINT_SUFFIX = ".ckpt"
+
+
+def _to_bytes(value):
+    return value.encode() if isinstance(value, str) else value
+
+
+def _pack_record(shard, item, idempotency):
+    key = _to_bytes(idempotency.key) if idempotency else b""
+    value = _to_bytes(idempotency.value) if idempotency else b""
+    payload = b"".join(
+        [
+            _RECORD_FIELDS.pack(shard, len(key), len(value)),
+            key,
+            value,
+            _to_bytes(item),
+        ],
+    )
+    return _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class OrderSpool:
+    """
+    Append-only spool of the orders received while Redis is unreachable.
+
+    Every process appends to its own segment file in `directory` and holds an
+    exclusive `flock` on it, so `spool_drain` knows whether a writer is still alive.
+    Segments are sealed once they reach `segment_size` bytes.
+
+    `append` returns once the records are on disk. Concurrent appends share their
+    fsync: the thread syncing the file covers every record written before it
+    started, the others only wait for it.
+    """
+
+    def __init__(self, directory, *, segment_size: int):
+        self._directory = Path(directory)
+        self._segment_size = segment_size
+        # lock order: `_sync_lock` then `_lock`
+        self._sync_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._written = 0  # appends written to the current segment
+        self._synced = 0  # appends of the current segment known to be on disk
+
+    def _open_segment(self):
+        self._directory.mkdir(parents=True, exist_ok=True)
+        name = f"{time.time_ns():020d}-{socket.gethostname()}-{os.getpid()}"
+        new_path = self._directory / f"{name}.new"
+        segment = new_path.open("ab")
+        fcntl.flock(segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # only locked segments are visible to the drainer
+        self._path = new_path.rename(new_path.with_suffix(OPEN_SUFFIX))
+        self._file = segment
+        self._written = 0
+        self._synced = 0
+
+    def _sync(self, segment, ticket):
+        with self._sync_lock:
+            with self._lock:
+                if self._file is not segment or self._synced >= ticket:
+                    # synced by another append, or by `seal`
+                    return
+                target = self._written
+            # appends go on while the file is synced
+            os.fsync(segment.fileno())
+            self._synced = target
+
+    def append(self, entries, idempotency: IdempotencyKey | None = None):
+        """
+        Writes orders to the spool and waits until they are on disk.
+
+        Args:
+            entries (list[tuple]): (queue shard, serialized order) pairs.
+            idempotency (IdempotencyKey | None): The idempotency key of a single
+                order, kept so the replay can't push it twice.
+
+        Raises:
+            OSError: If the orders can't be written.
+        """
+
+        data = b"".join(
+            _pack_record(shard, item, idempotency) for shard, item in entries
+        )
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            segment = self._file
+            segment.write(data)
+            segment.flush()
+            self._written += 1
+            ticket = self._written
+            full = segment.tell() >= self._segment_size
+
+        self._sync(segment, ticket)
+        if full:
+            self.seal()
+
+    def seal(self):
+        """
+        Completes the current segment, the next append starts a new one.
+        """
+
+        with self._sync_lock, self._lock:
+            if self._file is None:
+                return
+            segment, self._file = self._file, None
+            os.fsync(segment.fileno())
+            self._path.rename(self._path.with_suffix(SEALED_SUFFIX))
+            segment.close()
+
+
+# spool of this process, forked workers open their own segment
+_spool = {"pid": None, "instance": None}
+_spool_lock = threading.Lock()
+
+
+def get_spool():
+    """
+    Returns the order spool of the current process.
+    """
+
+    with _spool_lock:
+        if _spool["pid"] != os.getpid():
+            _spool["instance"] = OrderSpool(
+                settings.ORDER_SPOOL_DIR,
+                segment_size=settings.ORDER_SPOOL_SEGMENT_SIZE,
+            )
+            _spool["pid"] = os.getpid()
+        return _spool["instance"]
+
+
+def _read_records(path, offset):
+    # yields (offset of the next record, shard, idempotency key, value, order) for
+    # the complete records after `offset`
+    with path.open("rb") as segment:
+        segment.seek(offset)
+        data = segment.read()
+
+    position = 0
+    while position + _RECORD_HEADER.size <= len(data):
+        length, crc = _RECORD_HEADER.unpack_from(data, position)
+        start = position + _RECORD_HEADER.size
+        payload = data[start : start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            # still being written, or torn by a crash of the writer
+            return
+        shard, key_length, value_length = _RECORD_FIELDS.unpack_from(payload)
+        key_end = _RECORD_FIELDS.size + key_length
+        value_end = key_end + value_length
+        position = start + length
+        yield (
+            offset + position,
+            shard,
+            payload[_RECORD_FIELDS.size : key_end].decode(),
+            payload[key_end:value_end].decode(),
+            payload[value_end:],
+        )
+
+
+def _read_checkpoint(path):
+    try:
+        return int(path.read_text())
+    except FileNotFoundError:
+        return 0
+
+
+def _write_checkpoint(path, offset):
+    tmp = path.with_suffix(".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, str(offset).encode())
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    tmp.replace(path)
+
+
+def _seal_abandoned(path):
+    # an open segment nobody holds the lock of was left by a dead process
+    with path.open("rb") as segment:
+        try:
+            fcntl.flock(segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return path
+        sealed = path.with_suffix(SEALED_SUFFIX)
+        path.rename(sealed)
+        return sealed
+
+
+def _drain_segment(redis, path, batch_size):
+    checkpoint = path.with_suffix(CHECKPOINT_SUFFIX)
+    offset = _read_checkpoint(checkpoint)
+    read = replayed = 0
+    for next_offset, shard, client_key, value, item in _read_records(path, offset):
+        # the position of the record is unique, the replay of a record pushed just
+        # before a crash of the drainer is skipped by Redis
+        key = client_key or f"{settings.ORDER_SPOOL_KEY}:{path.stem}:{offset}"
+        _, previous = queue_push_guarded(
+            redis,
+            [item],
+            shard=shard,
+            idempotency=IdempotencyKey(
+                key=key,
+                value=value,
+                ttl=settings.ORDER_IDEMPOTENCY_KEY_TTL,
+            ),
+        )
+        if previous is None:
+            replayed += 1
+        offset = next_offset
+        read += 1
+        if read % batch_size == 0:
+            _write_checkpoint(checkpoint, offset)
+    if read:
+        _write_checkpoint(checkpoint, offset)
+
+    if path.suffix == SEALED_SUFFIX:
+        if offset < path.stat().st_size:
+            logger.error("Torn record at %d in order spool %s, dropped", offset, path)
+        path.unlink()
+        checkpoint.unlink(missing_ok=True)
+    return replayed
+
+
+def spool_drain(redis, *, batch_size: int = 500) -> int:
+    """
+    Replays the spooled orders into the order queue.
+
+    Segments are replayed oldest first and the records of a segment in the order
+    they were written. The position reached in each segment is checkpointed every
+    `batch_size` records; records replayed again after a crash are skipped thanks
+    to the idempotency key pushed with them (the client's one, or the position of
+    the record). Sealed segments, and open segments whose writer died, are removed
+    once replayed.
+
+    Args:
+        redis (Redis): An open Redis connection.
+        batch_size (int): Records replayed between two checkpoints.
+
+    Returns:
+        int: The number of orders pushed to the queue.
+
+    Raises:
+        RedisError: If an order can't be pushed, the replay resumes from the last
+        checkpoint on the next call.
+    """
+
+    directory = Path(settings.ORDER_SPOOL_DIR)
+    if not directory.is_dir():
+        return 0
+
+    segments = [
+        *directory.glob(f"*{OPEN_SUFFIX}"),
+        *directory.glob(f"*{SEALED_SUFFIX}"),
+    ]
+    replayed = 0
+    for path in sorted(segments, key=lambda path: path.stem):
+        if path.suffix == OPEN_SUFFIX:
+            path = _seal_abandoned(path)  # noqa: PLW2901
+        replayed += _drain_segment(redis, path, batch_size)
+    return replayed
@@ -1,11 +1,16 @@
 from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
 
+from .partitions import archive_partitions_maintain
+from .partitions import partitioning_supported
 from .services import order_filler
+from .services import order_filler_trigger
 from .services import order_validator
 
 
 @shared_task()
-def handle_batch_of_request():
+def handle_batch_of_request(block: int | None = None, shard: int = 0):
     """
     A Celery task that processes a batch of orders from the Redis queue
     and sends notifications for placed and dropped orders.
@@ -15,20 +20,31 @@ def handle_batch_of_request():
     - Successfully placed orders.
     - Dropped orders due to insufficient balance or other issues.
 
+    Args:
+        block (int | None): Milliseconds to wait for new orders when the queue is
+            empty, passed to `order_validator`.
+        shard (int): The queue shard to validate, passed to `order_validator`.
+
     Steps:
         1. Call `order_validator` to validate and process orders.
         2. If there are successfully placed orders, invoke the `placed_order_notif`
            task.
         3. If there are dropped orders, invoke the `droped_order_notif` task.
+        4. If the placed orders pushed the pending value over `MIN_ORDERS_VALUE`,
+           start `accumulate_batch_of_placed_order` right away instead of waiting
+           for its next periodic run.
 
     Returns:
         None: This is a background task, so no value is returned.
     """
-    placed_order, droped_order = order_validator()
+    placed_order, droped_order = order_validator(block=block, shard=shard)
 
     if placed_order:
         placed_order_notif.delay(placed_order)
 
+        if order_filler_trigger():
+            accumulate_batch_of_placed_order.delay()
+
     if droped_order:
         droped_order_notif.delay(droped_order)
 
@@ -71,3 +87,25 @@ def filled_order_notif(user_ids: list):
     A pointless task for simulate
     """
     return f"filled order count {len(user_ids)}"
+
+
+@shared_task()
+def maintain_archive_partitions():
+    """
+    Creates the partitions of the archived orders of the coming months and removes
+    the expired ones, like the `archive_partitions` command.
+
+    Uses `settings.ARCHIVE_PARTITIONS_AHEAD` and `settings.ARCHIVE_RETENTION_MONTHS`,
+    does nothing if the database is not PostgreSQL.
+
+    Returns:
+        None
+    """
+    if not partitioning_supported():
+        return
+
+    archive_partitions_maintain(
+        today=timezone.now().date(),
+        ahead=settings.ARCHIVE_PARTITIONS_AHEAD,
+        retention=settings.ARCHIVE_RETENTION_MONTHS,
+    )
@@ -0,0 +1,91 @@
+import json
+from datetime import UTC
+from datetime import datetime
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from aban_exchange.exchange.archive_export import ExportedOrder
+from aban_exchange.exchange.archive_export import archive_export
+from aban_exchange.exchange.archive_export import archive_export_read
+from aban_exchange.exchange.models import ArchiveOrder
+from aban_exchange.users.tests.factories import UserFactory
+
+START = datetime(2026, 3, 1, tzinfo=UTC)
+END = datetime(2026, 4, 1, tzinfo=UTC)
+
+
+def _archive(order_id, user, created_at):
+    ArchiveOrder.objects.create(id=order_id, user=user, price=10, amount=order_id)
+    ArchiveOrder.objects.filter(id=order_id).update(created_at=created_at)
+    return ExportedOrder(order_id, user.id, 10, order_id, created_at)
+
+
+@pytest.mark.django_db
+def test_archive_export_read_by_user(tmp_path):
+    user1 = UserFactory(id=1)
+    user2 = UserFactory(id=2)
+    user3 = UserFactory(id=3)
+    expected = {1: [], 2: []}
+    for order_id in range(1, 8):
+        user = user1 if order_id % 2 else user2
+        created_at = datetime(2026, 3, order_id, 12, 30, 0, order_id, tzinfo=UTC)
+        expected[user.id].append(_archive(order_id, user, created_at))
+    # outside of the period
+    _archive(8, user3, datetime(2026, 4, 1, tzinfo=UTC))
+
+    path = tmp_path / "march"
+    assert archive_export(path, start=START, end=END, chunk_size=3) == 7  # noqa: PLR2004
+    # sorted by user, the chunks of other users are skipped
+    chunks = json.loads(path.with_suffix(".idx").read_text())["chunks"]
+    assert [(chunk["min_user_id"], chunk["max_user_id"]) for chunk in chunks] == [
+        (1, 1),
+        (1, 2),
+        (2, 2),
+    ]
+
+    assert list(archive_export_read(path, user_id=1)) == expected[1]
+    assert list(archive_export_read(path, user_id=2)) == expected[2]
+    assert list(archive_export_read(path, user_id=3)) == []
+    with pytest.raises(FileExistsError):
+        archive_export(path, start=START, end=END, chunk_size=3)
+
+
+@pytest.mark.django_db
+def test_export_archive_command(tmp_path):
+    user = UserFactory(id=1)
+    order = _archive(1, user, datetime(2026, 3, 31, 23, 59, tzinfo=UTC))
+
+    out = StringIO()
+    call_command(
+        "export_archive",
+        "2026-03-01",
+        "2026-04-01",
+        directory=str(tmp_path),
+        stdout=out,
+    )
+
+    path = tmp_path / "archive-20260301-20260401"
+    assert f"1 archived orders exported to {path}." in out.getvalue()
+    assert list(archive_export_read(path, user_id=1)) == [order]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "archive-20260301-20260401.col",
+        "archive-20260301-20260401.idx",
+    ]
+
+    with pytest.raises(CommandError):
+        call_command(
+            "export_archive",
+            "2026-03-01",
+            "2026-04-01",
+            directory=str(tmp_path),
+        )
+    with pytest.raises(CommandError):
+        call_command(
+            "export_archive",
+            "2026-04-01",
+            "2026-03-01",
+            directory=str(tmp_path),
+        )
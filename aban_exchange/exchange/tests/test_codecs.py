@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from aban_exchange.exchange.codecs import BINARY_V1
+from aban_exchange.exchange.codecs import decode_order
+from aban_exchange.exchange.codecs import encode_order
+
+
+@pytest.mark.parametrize("codec", ["json", "binary"])
+def test_encode_decode_order(codec, settings):
+    settings.REQUEST_HANDLER_QUEUE_CODEC = codec
+
+    item = encode_order(user_id="12", amount=100, price=10)
+
+    assert decode_order(item) == {"user_id": 12, "amount": 100, "price": 10}
+
+
+def test_binary_order_is_compact(settings):
+    settings.REQUEST_HANDLER_QUEUE_CODEC = "binary"
+
+    item = encode_order(user_id=12, amount=100, price=10)
+
+    assert item[0] == BINARY_V1
+    assert len(item) < len(json.dumps({"user_id": 12, "amount": 100, "price": 10}))
+
+
+def test_decode_order_reads_both_codecs_from_bytes(settings):
+    # a binary connection returns JSON orders as bytes too
+    settings.REQUEST_HANDLER_QUEUE_CODEC = "json"
+    json_item = encode_order(user_id=1, amount=5, price=2).encode()
+    settings.REQUEST_HANDLER_QUEUE_CODEC = "binary"
+    binary_item = encode_order(user_id=2, amount=6, price=3)
+
+    assert [decode_order(item)["user_id"] for item in [json_item, binary_item]] == [
+        1,
+        2,
+    ]
+
+
+@pytest.mark.parametrize(
+    "item",
+    ["not json", '{"user_id": 1}', "[1, 2]", b"\x01\x02", b"\xff"],
+)
+def test_decode_order_rejects_malformed_items(item):
+    with pytest.raises(ValueError):  # noqa: PT011
+        decode_order(item)
@@ -0,0 +1,205 @@
+import json
+import signal
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils import timezone
+
+from aban_exchange.exchange.models import ArchiveOrder
+from aban_exchange.exchange.models import Order
+from aban_exchange.exchange.models import PendingValue
+from aban_exchange.exchange.partitions import archive_partition_create
+from aban_exchange.exchange.partitions import archive_partitions
+from aban_exchange.users.services import wallet_balances
+from aban_exchange.users.tests.factories import UserFactory
+from aban_exchange.utils.exception.system import ServiceUnavailable
+
+
+@patch("aban_exchange.exchange.management.commands.run_order_consumer.time.sleep")
+@patch(
+    "aban_exchange.exchange.management.commands.run_order_consumer.close_old_connections",
+)
+@patch(
+    "aban_exchange.exchange.management.commands.run_order_consumer.handle_batch_of_request",
+)
+def test_run_order_consumer_graceful_shutdown(
+    mock_handle_batch,
+    mock_close_old_connections,
+    mock_sleep,
+):
+    calls = []
+
+    def handle_batch(block, shard):
+        calls.append(block)
+        if len(calls) == 1:
+            msg = "Error accessing Redis"
+            raise ServiceUnavailable(msg)
+        # SIGTERM while a batch is in progress, the batch must still finish
+        signal.raise_signal(signal.SIGTERM)
+
+    mock_handle_batch.side_effect = handle_batch
+    previous = signal.getsignal(signal.SIGTERM)
+    out = StringIO()
+    try:
+        call_command("run_order_consumer", block=100, stdout=out, stderr=StringIO())
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    assert calls == [100, 100]
+    mock_sleep.assert_called_once_with(1)
+    assert "Stopping order consumer..." in out.getvalue()
+
+
+@patch("aban_exchange.exchange.management.commands.run_order_consumer.time.sleep")
+@patch(
+    "aban_exchange.exchange.management.commands.run_order_consumer.close_old_connections",
+)
+@patch(
+    "aban_exchange.exchange.management.commands.run_order_consumer.handle_batch_of_request",
+)
+def test_run_order_consumer_survives_unexpected_errors(
+    mock_handle_batch,
+    mock_close_old_connections,
+    mock_sleep,
+):
+    calls = []
+
+    def handle_batch(block, shard):
+        calls.append(block)
+        if len(calls) == 1:
+            msg = "unexpected"
+            raise RuntimeError(msg)
+        signal.raise_signal(signal.SIGTERM)
+
+    mock_handle_batch.side_effect = handle_batch
+    previous = signal.getsignal(signal.SIGTERM)
+    try:
+        call_command("run_order_consumer", block=100, stdout=StringIO())
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    assert calls == [100, 100]
+    # broken database connections are dropped before every batch
+    assert mock_close_old_connections.call_count == 2  # noqa: PLR2004
+    mock_sleep.assert_called_once_with(1)
+
+
+def test_run_order_consumer_rejects_unknown_shard(settings):
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 2
+
+    with pytest.raises(CommandError, match="Shard must be in"):
+        call_command("run_order_consumer", shard=2, stdout=StringIO())
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.management.commands.run_order_book.filled_order_notif")
+@patch(
+    "aban_exchange.exchange.management.commands.run_order_book.close_old_connections",
+)
+@patch(
+    "aban_exchange.exchange.management.commands.run_order_book.RedisConnector.get_connection",
+)
+def test_run_order_book(
+    mock_redis_connection,
+    mock_close_old_connections,
+    mock_filled_order_notif,
+    settings,
+):
+    settings.TOKEN_PRICE = 10
+    settings.MIN_ORDERS_VALUE = 100
+    user = UserFactory(id=1, token_balance=0)
+    order1 = Order.objects.create(user=user, price=10, amount=60)
+    order2 = Order.objects.create(user=user, price=10, amount=40)
+    PendingValue.objects.create(price=10, value=100)
+
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.xrevrange.return_value = []
+
+    def xread(streams, block):
+        signal.raise_signal(signal.SIGTERM)
+        # both orders are loaded from the table and published again by the validator
+        payload = json.dumps([[order1.id, 1, 10, 60], [order2.id, 1, 10, 40]])
+        return [[settings.ORDER_BOOK_STREAM_NAME, [("1-0", {"data": payload})]]]
+
+    mock_redis.xread.side_effect = xread
+    previous = signal.getsignal(signal.SIGTERM)
+    try:
+        call_command("run_order_book", stdout=StringIO(), stderr=StringIO())
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    mock_filled_order_notif.delay.assert_called_once_with([user.id])
+    assert Order.objects.count() == 0
+    assert wallet_balances([1])[1].token_balance == 10  # noqa: PLR2004
+
+
+def _month(offset):
+    # first day of the month `offset` months from now
+    today = timezone.now().date()
+    index = today.year * 12 + today.month - 1 + offset
+    return today.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def _partition_of(order_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT tableoid::regclass::text FROM exchange_archiveorder WHERE id = %s",
+            [order_id],
+        )
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(
+    connection.vendor != "postgresql",
+    reason="archived orders are only partitioned on PostgreSQL",
+)
+def test_archive_partitions_command():
+    user = UserFactory(id=1)
+    ArchiveOrder.objects.create(id=1, user=user, price=10, amount=10)
+    ArchiveOrder.objects.create(id=2, user=user, price=10, amount=10)
+    # no partition yet this far ahead, the order is in the default partition
+    ArchiveOrder.objects.filter(id=2).update(
+        created_at=timezone.now().replace(day=1) + timezone.timedelta(days=31 * 5),
+    )
+    assert _partition_of(2) == "exchange_archiveorder_default"
+
+    out = StringIO()
+    call_command("archive_partitions", ahead=5, stdout=out)
+
+    assert f"Partition of {_month(5):%Y-%m} created." in out.getvalue()
+    assert _partition_of(1) == f"exchange_archiveorder_p{_month(0):%Y%m}"
+    assert _partition_of(2) == f"exchange_archiveorder_p{_month(5):%Y%m}"
+
+    archive_partition_create(_month(-2))
+    ArchiveOrder.objects.create(id=3, user=user, price=10, amount=10)
+    ArchiveOrder.objects.filter(id=3).update(
+        created_at=timezone.now().replace(day=1) - timezone.timedelta(days=40),
+    )
+    with connection.cursor() as cursor:
+        # the test transaction would still hold the deferred foreign key checks of
+        # the rows, PostgreSQL refuses to drop their table then
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+    out = StringIO()
+    call_command("archive_partitions", retention=1, stdout=out)
+
+    assert f"Partition of {_month(-2):%Y-%m} dropped." in out.getvalue()
+    assert _month(-2) not in archive_partitions()
+    assert sorted(ArchiveOrder.objects.values_list("id", flat=True)) == [1, 2]
+
+
+@pytest.mark.skipif(
+    connection.vendor == "postgresql",
+    reason="archived orders are partitioned on PostgreSQL",
+)
+def test_archive_partitions_command_needs_postgresql():
+    with pytest.raises(CommandError):
+        call_command("archive_partitions")
@@ -0,0 +1,123 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+from redis.exceptions import ConnectionError  # noqa: A004
+
+from aban_exchange.exchange import services
+from aban_exchange.exchange.intake import OrderIntakeBuffer
+from aban_exchange.exchange.services import order_receive
+from aban_exchange.utils.exception.system import ServiceUnavailable
+
+
+def _submit_all(buffer, items):
+    errors = []
+
+    def submit(item):
+        try:
+            buffer.submit(item)
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit, args=(item,)) for item in items]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return errors
+
+
+def test_intake_buffer_flushes_full_batch_with_one_push():
+    pushed = []
+    buffer = OrderIntakeBuffer(pushed.append, max_size=4, max_wait=5000, timeout=5000)
+
+    errors = _submit_all(buffer, ["a", "b", "c", "d"])
+
+    # the batch is full long before the wait time is over
+    assert errors == []
+    assert len(pushed) == 1
+    assert sorted(pushed[0]) == ["a", "b", "c", "d"]
+
+
+def test_intake_buffer_flushes_after_wait_time():
+    pushed = []
+    buffer = OrderIntakeBuffer(pushed.append, max_size=100, max_wait=1, timeout=5000)
+
+    buffer.submit("a")
+    buffer.submit("b")
+
+    assert pushed == [["a"], ["b"]]
+
+
+def test_intake_buffer_push_error_reaches_every_request():
+    def push(items):
+        msg = "Redis is down"
+        raise ConnectionError(msg)
+
+    buffer = OrderIntakeBuffer(push, max_size=3, max_wait=5000, timeout=5000)
+
+    errors = _submit_all(buffer, ["a", "b", "c"])
+
+    assert len(errors) == 3  # noqa: PLR2004
+    assert all(isinstance(error, ConnectionError) for error in errors)
+
+
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_receive_with_intake_buffer(mock_redis_connection, settings):
+    settings.ORDER_INTAKE_BUFFER_ENABLED = True
+    mock_redis = mock_redis_connection.return_value
+
+    with patch(
+        "aban_exchange.exchange.services.get_intake_buffer",
+        return_value=OrderIntakeBuffer(
+            services._order_push,  # noqa: SLF001
+            max_size=10,
+            max_wait=1,
+            timeout=5000,
+        ),
+    ):
+        order_receive(user_id="1", amount=100, price=10)
+
+        mock_redis.rpush.side_effect = ConnectionError("Redis is down")
+        with pytest.raises(ServiceUnavailable):
+            order_receive(user_id="1", amount=100, price=10)
+
+    mock_redis.rpush.assert_called_with(
+        settings.REQUEST_HANDLER_QUEUE_NAME,
+        '{"user_id": "1", "amount": 100, "price": 10}',
+    )
+
+
+def test_intake_buffer_times_out_on_stuck_push():
+    release = threading.Event()
+    buffer = OrderIntakeBuffer(
+        lambda items: release.wait(5),
+        max_size=10,
+        max_wait=1,
+        timeout=50,
+    )
+
+    with pytest.raises(TimeoutError):
+        buffer.submit("a")
+    release.set()
+
+
+def test_intake_buffer_drops_timed_out_items():
+    release = threading.Event()
+    pushed = []
+
+    def push(items):
+        release.wait(5)
+        pushed.append(items)
+
+    buffer = OrderIntakeBuffer(push, max_size=1, max_wait=1, timeout=50)
+
+    # "a" is being pushed when "b" times out, "b" is never pushed
+    with pytest.raises(TimeoutError):
+        buffer.submit("a")
+    with pytest.raises(TimeoutError):
+        buffer.submit("b")
+    release.set()
+    buffer.submit("c")
+
+    assert pushed == [["a"], ["c"]]
@@ -0,0 +1,37 @@
+from aban_exchange.exchange.order_book import BookOrder
+from aban_exchange.exchange.order_book import OrderBook
+
+
+def test_order_book_levels():
+    book = OrderBook()
+    book.add(BookOrder(id=1, user_id=1, price=10, amount=30))
+    book.add(BookOrder(id=2, user_id=2, price=5, amount=20))
+    book.add(BookOrder(id=3, user_id=1, price=10, amount=40))
+    # the same order received twice is counted once
+    book.add(BookOrder(id=3, user_id=1, price=10, amount=40))
+
+    assert len(book) == 3  # noqa: PLR2004
+    assert book.prices == [5, 10]
+    assert book.level_value(10) == 70  # noqa: PLR2004
+    assert book.level_value(7) == 0
+
+    orders = book.pop_level(10)
+
+    assert [order.id for order in orders] == [1, 3]
+    assert book.prices == [5]
+    assert 1 not in book
+    assert book.pop_level(10) == []
+
+
+def test_order_book_match():
+    book = OrderBook()
+    book.add(BookOrder(id=1, user_id=1, price=10, amount=30))
+    book.add(BookOrder(id=2, user_id=2, price=5, amount=20))
+
+    assert book.match(10, 50) == []
+    assert book.match(7, 0) == []
+
+    book.add(BookOrder(id=3, user_id=2, price=10, amount=20))
+
+    assert [order.id for order in book.match(10, 50)] == [1, 3]
+    assert book.prices == [5]
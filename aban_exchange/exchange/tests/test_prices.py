@@ -0,0 +1,94 @@
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from aban_exchange.exchange import prices
+from aban_exchange.exchange.prices import token_price_get
+from aban_exchange.exchange.prices import token_price_set
+
+
+@pytest.fixture(autouse=True)
+def _dynamic_price(settings):
+    settings.DYNAMIC_TOKEN_PRICE = True
+    settings.TOKEN_PRICE = 5
+    prices._cache.update(price=None, version=0, expires_at=0.0)  # noqa: SLF001
+    prices._listener.update(pid=None, thread=None)  # noqa: SLF001
+
+
+@patch("aban_exchange.exchange.prices.RedisConnector.get_connection")
+def test_token_price_get_uses_snapshot(mock_redis_connection):
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.hmget.return_value = ["7", "3"]
+
+    assert token_price_get() == 7  # noqa: PLR2004
+    assert token_price_get() == 7  # noqa: PLR2004
+
+    # the second call is served from the snapshot
+    mock_redis.hmget.assert_called_once()
+    mock_redis.pubsub.return_value.subscribe.assert_called_once()
+
+
+@patch("aban_exchange.exchange.prices.RedisConnector.get_connection")
+def test_token_price_get_defaults(mock_redis_connection, settings):
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.hmget.return_value = [None, None]
+    assert token_price_get() == settings.TOKEN_PRICE
+
+    prices._cache.update(expires_at=0.0)  # noqa: SLF001
+    mock_redis.hmget.side_effect = ConnectionError
+    assert token_price_get() == settings.TOKEN_PRICE
+
+
+@patch("aban_exchange.exchange.prices.RedisConnector.get_connection")
+def test_token_price_notification(mock_redis_connection, settings):
+    settings.TOKEN_PRICE_CACHE_TTL = 60000
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.hmget.return_value = ["7", "3"]
+    token_price_get()
+
+    # new price published by another process
+    prices._on_price_message({"data": "4:9"})  # noqa: SLF001
+    assert token_price_get() == 9  # noqa: PLR2004
+
+    # a late notification of an older version is ignored
+    prices._on_price_message({"data": "2:6"})  # noqa: SLF001
+    assert token_price_get() == 9  # noqa: PLR2004
+    mock_redis.hmget.assert_called_once()
+
+
+@patch("aban_exchange.exchange.prices.RedisConnector.get_connection")
+def test_token_price_set(mock_redis_connection, settings):
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.eval.return_value = 4
+
+    assert token_price_set(9) == 4  # noqa: PLR2004
+
+    args = mock_redis.eval.call_args.args
+    assert args[1:] == (
+        1,
+        settings.TOKEN_PRICE_KEY,
+        9,
+        settings.TOKEN_PRICE_CHANNEL,
+    )
+    assert token_price_get() == 9  # noqa: PLR2004
+
+
+@pytest.mark.parametrize("price", [0, -3])
+@patch("aban_exchange.exchange.prices.RedisConnector.get_connection")
+def test_token_price_set_rejects_non_positive_price(mock_redis_connection, price):
+    with pytest.raises(ValueError, match="at least 1"):
+        token_price_set(price)
+
+    mock_redis_connection.return_value.eval.assert_not_called()
+
+    with pytest.raises(CommandError):
+        call_command("set_token_price", str(price))
+
+
+@patch("aban_exchange.exchange.prices.RedisConnector.get_connection")
+def test_token_price_get_ignores_non_positive_price(mock_redis_connection, settings):
+    mock_redis_connection.return_value.hmget.return_value = ["0", "4"]
+
+    assert token_price_get() == settings.TOKEN_PRICE
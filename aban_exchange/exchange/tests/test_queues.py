@@ -0,0 +1,161 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django_celery_beat.models import PeriodicTask
+
+from aban_exchange.exchange import services
+from aban_exchange.exchange.queues import queue_name
+from aban_exchange.exchange.queues import queue_shard
+from aban_exchange.exchange.services import order_receive
+from aban_exchange.exchange.services import order_receive_bulk
+from aban_exchange.exchange.services import order_validator
+from aban_exchange.users.tests.factories import UserFactory
+
+
+def test_queue_name(settings):
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 1
+    # a single shard keeps the queue of the previous releases
+    assert queue_name(0) == settings.REQUEST_HANDLER_QUEUE_NAME
+
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 4
+    assert queue_name(0) == settings.REQUEST_HANDLER_QUEUE_NAME
+    assert queue_name(3) == f"{settings.REQUEST_HANDLER_QUEUE_NAME}:3"
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_orders_queued_before_sharding_are_validated(mock_redis_connection, settings):
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 1
+    mock_redis = mock_redis_connection.return_value
+    UserFactory(id=3, balance=200)
+    order_receive(user_id="3", amount=100, price=10)
+    [queued] = mock_redis.rpush.call_args_list
+
+    # the order is still in the queue of a single shard when a second one is added
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 2
+    mock_redis.lpop.return_value = list(queued.args[1:])
+    placed_orders, _ = order_validator(shard=0)
+
+    assert len(placed_orders) == 1
+    mock_redis.lpop.assert_called_once_with(
+        queued.args[0],
+        settings.REQUEST_HANDLER_BATCH_SIZE,
+    )
+
+
+def test_queue_shard_keeps_every_user_on_one_shard(settings):
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 4
+
+    assert [queue_shard(user_id) for user_id in (0, 1, 5, "6", 7)] == [0, 1, 1, 2, 3]
+    # stable across processes, unlike hash() of a string
+    assert queue_shard("5") == queue_shard(5)
+
+
+def test_rebalancing_moves_users_to_other_shards(settings):
+    # Changing the shard count moves most users to another shard. Orders queued
+    # before the change stay in their old queue: keep the validators of the old
+    # shards running until their queues are empty (see the next test), otherwise
+    # those orders are never validated.
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 2
+    before = {user_id: queue_shard(user_id) for user_id in range(12)}
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 3
+    after = {user_id: queue_shard(user_id) for user_id in range(12)}
+
+    moved = [user_id for user_id in before if before[user_id] != after[user_id]]
+    assert moved == [2, 3, 4, 5, 8, 9, 10, 11]
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_old_shard_is_drained_after_rebalancing(mock_redis_connection, settings):
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 2
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.lpop.return_value = [
+        '{"user_id": "3", "amount": 100, "price": 10}',
+    ]
+    UserFactory(id=3, balance=200)
+
+    # user 3 moved from shard 1 to shard 0, shard 1 still holds an old order
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 3
+    assert queue_shard(3) == 0
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 2
+    placed_orders, _ = order_validator(shard=1)
+
+    assert len(placed_orders) == 1
+    mock_redis.lpop.assert_called_once_with(
+        f"{settings.REQUEST_HANDLER_QUEUE_NAME}:1",
+        settings.REQUEST_HANDLER_BATCH_SIZE,
+    )
+
+
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_receive_routes_to_user_shard(mock_redis_connection, settings):
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 4
+    mock_redis = mock_redis_connection.return_value
+
+    order_receive(user_id="6", amount=100, price=10)
+    order_receive_bulk(user_id=7, orders=[{"amount": 5, "price": 10}])
+
+    assert [call.args[0] for call in mock_redis.rpush.call_args_list] == [
+        f"{settings.REQUEST_HANDLER_QUEUE_NAME}:2",
+        f"{settings.REQUEST_HANDLER_QUEUE_NAME}:3",
+    ]
+
+
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_push_of_several_shards_uses_one_pipeline(
+    mock_redis_connection,
+    settings,
+):
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 2
+    mock_redis = mock_redis_connection.return_value
+
+    # e.g. a flush of the intake buffer
+    services._order_push([(0, "a"), (1, "b"), (0, "c")])  # noqa: SLF001
+
+    pipe = mock_redis.pipeline.return_value
+    assert sorted(call.args for call in pipe.rpush.call_args_list) == [
+        (settings.REQUEST_HANDLER_QUEUE_NAME, "a", "c"),
+        (f"{settings.REQUEST_HANDLER_QUEUE_NAME}:1", "b"),
+    ]
+    pipe.execute.assert_called_once_with()
+    mock_redis.rpush.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_init_periodic_tasks_schedules_every_shard(settings):
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 3
+
+    call_command("init_periodic_tasks")
+
+    tasks = PeriodicTask.objects.filter(
+        task="aban_exchange.exchange.tasks.handle_batch_of_request",
+    )
+    assert sorted(json.loads(task.kwargs)["shard"] for task in tasks) == [0, 1, 2]
+
+
+@pytest.mark.django_db
+def test_init_periodic_tasks_updates_tasks_of_previous_runs(settings):
+    # task of a release without shards
+    call_command("init_periodic_tasks")
+    PeriodicTask.objects.filter(
+        task="aban_exchange.exchange.tasks.handle_batch_of_request",
+    ).update(kwargs="{}")
+
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 3
+    call_command("init_periodic_tasks")
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 2
+    call_command("init_periodic_tasks")
+
+    tasks = PeriodicTask.objects.filter(
+        task="aban_exchange.exchange.tasks.handle_batch_of_request",
+    )
+    assert sorted(
+        (json.loads(task.kwargs)["shard"], task.enabled) for task in tasks
+    ) == [
+        (0, True),
+        (1, True),
+        (2, False),
+    ]
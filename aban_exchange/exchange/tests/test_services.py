@@ -1,16 +1,39 @@
+import asyncio
+import json
 from unittest.mock import patch
 
 import pytest
-from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.utils import DatabaseError
+from django.test.utils import CaptureQueriesContext
 from redis.exceptions import ConnectionError  # noqa: A004
 
+from aban_exchange.exchange import services
+from aban_exchange.exchange.codecs import encode_order
+from aban_exchange.exchange.models import ArchiveOrder
 from aban_exchange.exchange.models import Order
+from aban_exchange.exchange.models import PendingValue
+from aban_exchange.exchange.models import ProcessedEntry
+from aban_exchange.exchange.order_book import BookOrder
+from aban_exchange.exchange.order_book import OrderBook
+from aban_exchange.exchange.services import order_book_fill
+from aban_exchange.exchange.services import order_book_load
+from aban_exchange.exchange.services import order_delete
 from aban_exchange.exchange.services import order_filler
+from aban_exchange.exchange.services import order_filler_trigger
+from aban_exchange.exchange.services import order_history
+from aban_exchange.exchange.services import order_receive
+from aban_exchange.exchange.services import order_receive_bulk
 from aban_exchange.exchange.services import order_validator
+from aban_exchange.users.models import BalanceEntry
+from aban_exchange.users.models import Wallet
+from aban_exchange.users.services import wallet_balances
 from aban_exchange.users.tests.factories import UserFactory
+from aban_exchange.utils.exception.system import IdempotencyKeyReused
+from aban_exchange.utils.exception.system import QueueFull
+from aban_exchange.utils.exception.system import RateLimited
 from aban_exchange.utils.exception.system import ServiceUnavailable
-
-User = get_user_model()
+from aban_exchange.utils.io.redis_helper import AsyncRedisConnector
 
 
 @pytest.mark.django_db
@@ -20,11 +43,10 @@ def test_order_validator(
 ):
     # Mock Redis connection
     mock_redis = mock_redis_connection.return_value
-    mock_redis.lrange.return_value = [
+    mock_redis.lpop.return_value = [
         '{"user_id": "1", "amount": 100, "price": 10}',
         '{"user_id": "2", "amount": 70, "price": 10}',
     ]
-    mock_redis.ltrim.return_value = None  # Mock trimming
 
     UserFactory(id=1, balance=200)
     UserFactory(id=2, balance=50)
@@ -34,21 +56,181 @@ def test_order_validator(
     # Assert that order was placed for user1 and dropped for user2
     assert len(placed_orders) == 1
     assert (
-        User.objects.get(id=1).balance == 100  # noqa: PLR2004
+        wallet_balances([1])[1].balance == 100  # noqa: PLR2004
     )  # 200 - 100 (order amount)
     assert len(dropped_orders) == 1
 
 
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_binary_codec(mock_redis_connection, settings):
+    settings.REQUEST_HANDLER_QUEUE_CODEC = "binary"
+    binary_item = encode_order(user_id=1, amount=100, price=10)
+    mock_redis = mock_redis_connection.return_value
+    # orders queued before the codec was switched are still JSON
+    mock_redis.lpop.return_value = [
+        b'{"user_id": "2", "amount": 30, "price": 10}',
+        binary_item,
+    ]
+
+    UserFactory(id=1, balance=200)
+    UserFactory(id=2, balance=50)
+
+    placed_orders, dropped_orders = order_validator()
+
+    assert len(placed_orders) == 2  # noqa: PLR2004
+    assert dropped_orders == []
+    mock_redis_connection.assert_called_with(binary=True)
+    assert wallet_balances([1])[1].balance == 100  # noqa: PLR2004
+
+
 @pytest.mark.django_db
 @patch("aban_exchange.exchange.services.RedisConnector.get_connection")
 def test_order_validator_redis_error(mock_redis_connection):
     mock_redis = mock_redis_connection.return_value
-    mock_redis.lrange.side_effect = ConnectionError("Redis connection error")
+    mock_redis.lpop.side_effect = ConnectionError("Redis connection error")
 
     with pytest.raises(ServiceUnavailable, match="Error accessing Redis"):
         order_validator()
 
 
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_stream_backend(mock_redis_connection, settings):
+    settings.REQUEST_HANDLER_QUEUE_BACKEND = "stream"
+    mock_redis = mock_redis_connection.return_value
+    # one entry left pending by a crashed worker, one new entry
+    mock_redis.xautoclaim.return_value = [
+        "0-0",
+        [("1-0", {"data": '{"user_id": "1", "amount": 100, "price": 10}'})],
+        [],
+    ]
+    mock_redis.xreadgroup.return_value = [
+        [
+            settings.REQUEST_HANDLER_QUEUE_NAME,
+            [("2-0", {"data": '{"user_id": "1", "amount": 50, "price": 10}'})],
+        ],
+    ]
+
+    UserFactory(id=1, balance=200)
+
+    placed_orders, dropped_orders = order_validator()
+
+    assert len(placed_orders) == 2  # noqa: PLR2004
+    assert dropped_orders == []
+    assert wallet_balances([1])[1].balance == 50  # noqa: PLR2004
+    mock_redis.pipeline.return_value.xack.assert_called_once_with(
+        settings.REQUEST_HANDLER_QUEUE_NAME,
+        settings.REQUEST_HANDLER_CONSUMER_GROUP,
+        "1-0",
+        "2-0",
+    )
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_stream_backend_skips_processed_entries(
+    mock_redis_connection,
+    settings,
+):
+    settings.REQUEST_HANDLER_QUEUE_BACKEND = "stream"
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.xautoclaim.return_value = ["0-0", [], []]
+    mock_redis.xreadgroup.return_value = [
+        [
+            settings.REQUEST_HANDLER_QUEUE_NAME,
+            [("1-0", {"data": '{"user_id": "1", "amount": 100, "price": 10}'})],
+        ],
+    ]
+    # the acknowledgement of the first batch fails, its entry stays pending
+    mock_redis.pipeline.return_value.execute.side_effect = [ConnectionError, None]
+
+    UserFactory(id=1, balance=200)
+
+    placed_orders, _ = order_validator()
+    assert len(placed_orders) == 1
+    assert ProcessedEntry.objects.filter(entry_id="1-0").exists()
+
+    # another validator claims the same entry again
+    mock_redis.xautoclaim.return_value = [
+        "0-0",
+        [("1-0", {"data": '{"user_id": "1", "amount": 100, "price": 10}'})],
+        [],
+    ]
+    mock_redis.xreadgroup.return_value = []
+
+    placed_orders, dropped_orders = order_validator()
+
+    assert placed_orders == []
+    assert dropped_orders == []
+    assert wallet_balances([1])[1].balance == 100  # noqa: PLR2004
+    assert Order.objects.count() == 1
+    # acknowledged this time, the entry will never be delivered again
+    assert not ProcessedEntry.objects.exists()
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_drops_malformed_orders(mock_redis_connection, settings):
+    settings.REQUEST_HANDLER_QUEUE_BACKEND = "stream"
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.xautoclaim.return_value = ["0-0", [], []]
+    mock_redis.xreadgroup.return_value = [
+        [
+            settings.REQUEST_HANDLER_QUEUE_NAME,
+            [
+                ("1-0", {"data": "not json"}),
+                ("2-0", {"data": '{"user_id": "1", "price": 10}'}),
+                ("3-0", {"data": '{"user_id": "1", "amount": 100, "price": 10}'}),
+            ],
+        ],
+    ]
+
+    UserFactory(id=1, balance=200)
+
+    placed_orders, dropped_orders = order_validator()
+
+    assert len(placed_orders) == 1
+    assert dropped_orders == []
+    # the malformed entries are acknowledged, they would fail every batch
+    mock_redis.pipeline.return_value.xack.assert_called_once_with(
+        settings.REQUEST_HANDLER_QUEUE_NAME,
+        settings.REQUEST_HANDLER_CONSUMER_GROUP,
+        "1-0",
+        "2-0",
+        "3-0",
+    )
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_stream_backend_db_error(mock_redis_connection, settings):
+    settings.REQUEST_HANDLER_QUEUE_BACKEND = "stream"
+    settings.ORDER_VALIDATOR_SET_BASED = False
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.xautoclaim.return_value = ["0-0", [], []]
+    mock_redis.xreadgroup.return_value = [
+        [
+            settings.REQUEST_HANDLER_QUEUE_NAME,
+            [("1-0", {"data": '{"user_id": "1", "amount": 100, "price": 10}'})],
+        ],
+    ]
+
+    UserFactory(id=1, balance=200)
+
+    with (
+        patch(
+            "aban_exchange.exchange.services.Order.objects.bulk_create",
+            side_effect=DatabaseError,
+        ),
+        pytest.raises(ServiceUnavailable),
+    ):
+        order_validator()
+
+    # the batch stays pending so another validator can claim it later
+    mock_redis.pipeline.return_value.xack.assert_not_called()
+
+
 @pytest.mark.django_db
 def test_order_filler():
     user1 = UserFactory(id=1, token_balance=0)
@@ -56,6 +238,7 @@ def test_order_filler():
 
     Order(user=user1, price=10, amount=100).save()
     Order(user=user2, price=10, amount=200).save()
+    PendingValue.objects.create(price=10, value=300)
 
     # Mock token calculation
     with (
@@ -65,8 +248,110 @@ def test_order_filler():
         user_ids = order_filler()
 
     assert user_ids == [user1.id, user2.id]
-    assert User.objects.get(id=1).token_balance == 10  # 100 / 10
-    assert User.objects.get(id=2).token_balance == 20  # 200 / 10
+    assert wallet_balances([1])[1].token_balance == 10  # 100 / 10
+    assert wallet_balances([2])[2].token_balance == 20  # 200 / 10
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(
+    connection.vendor != "postgresql",
+    reason="set-based filling needs PostgreSQL",
+)
+def test_order_filler_set_based():
+    user1 = UserFactory(id=1, token_balance=3)
+    user2 = UserFactory(id=2, token_balance=0)
+
+    first = Order.objects.create(user=user1, price=10, amount=100)
+    Order.objects.create(user=user1, price=10, amount=55)
+    Order.objects.create(user=user2, price=10, amount=200)
+    Order.objects.create(user=user2, price=20, amount=200)
+    PendingValue.objects.create(price=10, value=355)
+    PendingValue.objects.create(price=20, value=200)
+
+    with (
+        patch("aban_exchange.exchange.services.settings.TOKEN_PRICE", 10),
+        patch("aban_exchange.exchange.services.settings.MIN_ORDERS_VALUE", 100),
+    ):
+        user_ids = order_filler()
+
+    assert user_ids == [user1.id, user2.id]
+    assert wallet_balances([1])[1].token_balance == 18  # noqa: PLR2004
+    assert wallet_balances([2])[2].token_balance == 20  # noqa: PLR2004
+    assert ArchiveOrder.objects.count() == 3  # noqa: PLR2004
+    assert ArchiveOrder.objects.filter(id=first.id, amount=100).exists()
+    # orders on another price are not touched
+    assert list(Order.objects.values_list("price", flat=True)) == [20]
+    assert PendingValue.objects.get(price=10).value == 0
+    assert PendingValue.objects.get(price=20).value == 200  # noqa: PLR2004
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(
+    connection.vendor != "postgresql",
+    reason="row locks are only visible on PostgreSQL",
+)
+@pytest.mark.parametrize("set_based", [True, False])
+def test_order_filler_locks_wallets_in_user_id_order(settings, set_based):
+    settings.TOKEN_PRICE = 10
+    settings.MIN_ORDERS_VALUE = 100
+    settings.ORDER_FILLER_SET_BASED = set_based
+    for user_id in (3, 1, 2):
+        Order.objects.create(user=UserFactory(id=user_id), price=10, amount=100)
+    PendingValue.objects.create(price=10, value=300)
+
+    with CaptureQueriesContext(connection) as queries:
+        order_filler()
+
+    wallet_table = Wallet._meta.db_table  # noqa: SLF001
+    wallet_queries = [
+        query["sql"] for query in queries if f'"{wallet_table}"' in query["sql"]
+    ]
+    # like the validators, wallets are locked by user id and never updated, the
+    # tokens are credited by balance entries
+    [lock_query] = wallet_queries
+    assert "FOR NO KEY UPDATE" in lock_query
+    assert f'ORDER BY "{wallet_table}"."user_id" ASC' in lock_query
+    assert sorted(
+        BalanceEntry.objects.values_list("wallet_id", "balance", "token_balance"),
+    ) == [(1, 0, 10), (2, 0, 10), (3, 0, 10)]
+
+
+@pytest.mark.django_db
+def test_order_filler_chunked(settings):
+    settings.ORDER_FILLER_SET_BASED = False
+    settings.ORDER_FILLER_CHUNK_SIZE = 2
+    user1 = UserFactory(id=1, token_balance=3)
+    user2 = UserFactory(id=2, token_balance=0)
+
+    for user, amount in [
+        (user1, 100),
+        (user2, 50),
+        (user1, 55),
+        (user2, 50),
+        (user1, 9),
+    ]:
+        Order.objects.create(user=user, price=10, amount=amount)
+    Order.objects.create(user=user2, price=20, amount=200)
+    PendingValue.objects.create(price=10, value=264)
+
+    with (
+        patch("aban_exchange.exchange.services.settings.TOKEN_PRICE", 10),
+        patch("aban_exchange.exchange.services.settings.MIN_ORDERS_VALUE", 100),
+        patch(
+            "aban_exchange.exchange.services.ArchiveOrder.objects.bulk_create",
+            wraps=ArchiveOrder.objects.bulk_create,
+        ) as mock_bulk_create,
+    ):
+        user_ids = order_filler()
+
+    # 5 orders in chunks of 2
+    assert mock_bulk_create.call_count == 3  # noqa: PLR2004
+    assert user_ids == [user1.id, user2.id]
+    assert wallet_balances([1])[1].token_balance == 18  # noqa: PLR2004
+    assert wallet_balances([2])[2].token_balance == 10  # noqa: PLR2004
+    assert ArchiveOrder.objects.count() == 5  # noqa: PLR2004
+    assert list(Order.objects.values_list("price", flat=True)) == [20]
+    assert PendingValue.objects.get(price=10).value == 0
 
 
 @pytest.mark.django_db
@@ -76,3 +361,449 @@ def test_order_filler_no_valid_orders():
 
     # Assert that no users are updated when there are no valid orders
     assert user_ids == []
+
+
+@pytest.mark.django_db
+def test_order_filler_below_min_value_skips_order_table(django_assert_num_queries):
+    user = UserFactory(id=1, token_balance=0)
+    Order.objects.create(user=user, price=10, amount=50)
+    PendingValue.objects.create(price=10, value=50)
+
+    with (
+        patch("aban_exchange.exchange.services.settings.TOKEN_PRICE", 10),
+        patch("aban_exchange.exchange.services.settings.MIN_ORDERS_VALUE", 100),
+        # only the counter is read
+        django_assert_num_queries(1),
+    ):
+        assert order_filler() == []
+
+    assert Order.objects.count() == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("set_based", [True, False])
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_updates_pending_value(
+    mock_redis_connection,
+    set_based,
+    settings,
+):
+    settings.ORDER_VALIDATOR_SET_BASED = set_based
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.lpop.return_value = [
+        '{"user_id": "1", "amount": 100, "price": 10}',
+        '{"user_id": "1", "amount": 30, "price": 5}',
+        '{"user_id": "1", "amount": 40, "price": 10}',
+        '{"user_id": "1", "amount": 500, "price": 10}',  # dropped
+    ]
+    UserFactory(id=1, balance=200)
+    PendingValue.objects.create(price=10, value=60)
+
+    order_validator()
+
+    assert PendingValue.objects.get(price=10).value == 200  # noqa: PLR2004
+    assert PendingValue.objects.get(price=5).value == 30  # noqa: PLR2004
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("set_based", [True, False])
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_adds_pending_value_of_its_shard(
+    mock_redis_connection,
+    set_based,
+    settings,
+):
+    settings.ORDER_VALIDATOR_SET_BASED = set_based
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 2
+    mock_redis_connection.return_value.lpop.return_value = [
+        '{"user_id": "1", "amount": 100, "price": 10}',
+    ]
+    UserFactory(id=1, balance=200)
+    PendingValue.objects.create(price=10, shard=0, value=60)
+
+    order_validator(shard=1)
+
+    assert PendingValue.objects.get(price=10, shard=0).value == 60  # noqa: PLR2004
+    assert PendingValue.objects.get(price=10, shard=1).value == 100  # noqa: PLR2004
+    assert services._pending_value(10) == 160  # noqa: SLF001, PLR2004
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_blocking(mock_redis_connection):
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.blpop.return_value = (
+        "recieve_order_queue",
+        '{"user_id": "1", "amount": 100, "price": 10}',
+    )
+    mock_redis.lpop.return_value = ['{"user_id": "1", "amount": 50, "price": 10}']
+
+    UserFactory(id=1, balance=120)
+
+    placed_orders, dropped_orders = order_validator(block=2000)
+
+    assert len(placed_orders) == 1
+    assert len(dropped_orders) == 1
+    mock_redis.blpop.assert_called_once()
+    assert mock_redis.blpop.call_args.kwargs["timeout"] == 2  # noqa: PLR2004
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_blocking_timeout(mock_redis_connection):
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.blpop.return_value = None
+
+    assert order_validator(block=2000) == ([], [])
+    mock_redis.lpop.assert_not_called()
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(
+    connection.vendor != "postgresql",
+    reason="set-based validation needs PostgreSQL",
+)
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_set_based(mock_redis_connection):
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.lpop.return_value = [
+        '{"user_id": "1", "amount": 80, "price": 10}',
+        '{"user_id": "2", "amount": 70, "price": 10}',
+        '{"user_id": "1", "amount": 50, "price": 10}',
+        '{"user_id": "1", "amount": 20, "price": 5}',
+        '{"user_id": "3", "amount": 10, "price": 10}',  # unknown user
+    ]
+
+    UserFactory(id=1, balance=100)
+    UserFactory(id=2, balance=50)
+
+    placed_orders, dropped_orders = order_validator()
+
+    # the second order of user 1 doesn't fit, but the third one still does
+    assert len(placed_orders) == 2  # noqa: PLR2004
+    assert sorted(dropped_orders) == [1, 2, 3]
+    assert wallet_balances([1])[1].balance == 0
+    assert wallet_balances([2])[2].balance == 50  # noqa: PLR2004
+    assert list(
+        Order.objects.filter(id__in=placed_orders)
+        .order_by("id")
+        .values_list("amount", flat=True),
+    ) == [80, 20]
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_writes_each_user_once(mock_redis_connection, settings):
+    settings.ORDER_VALIDATOR_SET_BASED = False
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.lpop.return_value = [
+        '{"user_id": "1", "amount": 80, "price": 10}',
+        '{"user_id": "2", "amount": 10, "price": 10}',
+        '{"user_id": "1", "amount": 50, "price": 10}',
+        '{"user_id": "1", "amount": 20, "price": 10}',
+        '{"user_id": "2", "amount": 10, "price": 10}',
+        '{"user_id": "3", "amount": 10, "price": 10}',  # unknown user
+    ]
+
+    UserFactory(id=1, balance=100)
+    UserFactory(id=2, balance=100)
+
+    with patch(
+        "aban_exchange.exchange.services.BalanceEntry.objects.bulk_create",
+        wraps=BalanceEntry.objects.bulk_create,
+    ) as mock_bulk_create:
+        placed_orders, dropped_orders = order_validator()
+
+    # one debit per user for the whole batch
+    debits = mock_bulk_create.call_args.args[0]
+    assert sorted((entry.wallet_id, entry.balance) for entry in debits) == [
+        (1, -100),
+        (2, -20),
+    ]
+    assert len(placed_orders) == 4  # noqa: PLR2004
+    assert dropped_orders == [1, 3]
+    assert wallet_balances([1])[1].balance == 0
+    assert wallet_balances([2])[2].balance == 80  # noqa: PLR2004
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_filler_trigger(mock_redis_connection, settings):
+    settings.TOKEN_PRICE = 10
+    settings.MIN_ORDERS_VALUE = 100
+    mock_redis = mock_redis_connection.return_value
+    PendingValue.objects.create(price=10, value=99)
+
+    assert order_filler_trigger() is False
+    mock_redis.set.assert_not_called()
+
+    PendingValue.objects.filter(price=10).update(value=100)
+    mock_redis.set.return_value = True
+    assert order_filler_trigger() is True
+    mock_redis.set.assert_called_once_with(
+        settings.ORDER_FILLER_TRIGGER_KEY,
+        1,
+        nx=True,
+        px=settings.ORDER_FILLER_TRIGGER_DEBOUNCE,
+    )
+
+    # another validator already started the filler in this window
+    mock_redis.set.return_value = None
+    assert order_filler_trigger() is False
+
+
+@pytest.mark.django_db
+def test_order_book_fill(settings):
+    settings.TOKEN_PRICE = 10
+    settings.MIN_ORDERS_VALUE = 100
+    user1 = UserFactory(id=1, token_balance=0)
+    user2 = UserFactory(id=2, token_balance=0)
+    order1 = Order.objects.create(user=user1, price=10, amount=60)
+    order2 = Order.objects.create(user=user2, price=10, amount=50)
+    order3 = Order.objects.create(user=user2, price=5, amount=50)
+    PendingValue.objects.create(price=10, value=110)
+    PendingValue.objects.create(price=5, value=50)
+
+    book = order_book_load(OrderBook())
+    # deleted by someone else, must not be credited and the rest of the level
+    # is below the minimum value now
+    order_delete(Order.objects.filter(id=order2.id))
+
+    assert order_book_fill(book) == []
+    assert book.prices == [5, 10]
+    assert order1.id in book
+    assert not ArchiveOrder.objects.exists()
+
+    order4 = Order.objects.create(user=user2, price=10, amount=40)
+    PendingValue.objects.filter(price=10).update(value=100)
+    book.add(BookOrder(order4.id, user2.id, 10, 40))
+
+    user_ids = order_book_fill(book)
+
+    assert user_ids == [user1.id, user2.id]
+    assert wallet_balances([1])[1].token_balance == 6  # noqa: PLR2004
+    assert wallet_balances([2])[2].token_balance == 4  # noqa: PLR2004
+    assert sorted(ArchiveOrder.objects.values_list("id", flat=True)) == [
+        order1.id,
+        order4.id,
+    ]
+    assert list(Order.objects.values_list("id", flat=True)) == [order3.id]
+    assert PendingValue.objects.get(price=10).value == 0
+    assert book.prices == [5]
+    assert order_book_fill(book) == []
+
+
+@pytest.mark.django_db
+def test_order_filler_skipped_with_order_book(settings):
+    settings.TOKEN_PRICE = 10
+    settings.MIN_ORDERS_VALUE = 100
+    settings.ORDER_BOOK_ENABLED = True
+    Order.objects.create(user=UserFactory(), price=10, amount=100)
+    PendingValue.objects.create(price=10, value=100)
+
+    # the order book fills the orders, the periodic filler must not
+    assert order_filler() == []
+    assert Order.objects.count() == 1
+
+
+@pytest.mark.django_db
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_validator_publishes_to_order_book(mock_redis_connection, settings):
+    settings.ORDER_BOOK_ENABLED = True
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.lpop.return_value = [
+        '{"user_id": "1", "amount": 100, "price": 10}',
+        '{"user_id": "1", "amount": 500, "price": 10}',
+    ]
+    UserFactory(id=1, balance=200)
+
+    placed_orders, _ = order_validator()
+
+    mock_redis.xadd.assert_called_once()
+    args, kwargs = mock_redis.xadd.call_args
+    assert args[0] == settings.ORDER_BOOK_STREAM_NAME
+    assert json.loads(args[1]["data"]) == [[placed_orders[0], 1, 10, 100]]
+    assert kwargs == {"maxlen": settings.ORDER_BOOK_STREAM_MAXLEN, "approximate": True}
+
+
+@pytest.mark.django_db
+def test_order_delete_keeps_pending_value_in_sync():
+    user = UserFactory()
+    order1 = Order.objects.create(user=user, price=10, amount=100)
+    order2 = Order.objects.create(user=user, price=20, amount=30)
+    Order.objects.create(user=user, price=10, amount=50)
+    PendingValue.objects.create(price=10, value=150)
+    PendingValue.objects.create(price=20, value=30)
+
+    deleted = order_delete(Order.objects.filter(id__in=[order1.id, order2.id]))
+
+    assert deleted == 2  # noqa: PLR2004
+    assert Order.objects.count() == 1
+    assert PendingValue.objects.get(price=10).value == 50  # noqa: PLR2004
+    assert PendingValue.objects.get(price=20).value == 0
+
+
+@pytest.mark.django_db
+def test_order_delete_folds_pending_value_of_every_shard():
+    user = UserFactory()
+    order = Order.objects.create(user=user, price=10, amount=100)
+    Order.objects.create(user=user, price=10, amount=50)
+    PendingValue.objects.create(price=10, shard=0, value=50)
+    PendingValue.objects.create(price=10, shard=1, value=100)
+
+    order_delete(Order.objects.filter(id=order.id))
+
+    # more than the row of shard 0 holds, the rows are folded into it
+    assert list(
+        PendingValue.objects.order_by("shard").values_list("shard", "value"),
+    ) == [(0, 50), (1, 0)]
+
+
+def test_async_redis_connector_keeps_one_client_per_event_loop():
+    async def get_connections():
+        return (
+            AsyncRedisConnector.get_connection(),
+            AsyncRedisConnector.get_connection(),
+        )
+
+    first, same = asyncio.run(get_connections())
+    second, _ = asyncio.run(get_connections())
+
+    assert first is same
+    assert first is not second
+
+
+@patch.dict("aban_exchange.exchange.services._queue_depths", clear=True)
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_receive_refuses_orders_over_hard_limit(mock_redis_connection, settings):
+    settings.REQUEST_HANDLER_QUEUE_HARD_LIMIT = 100
+    settings.REQUEST_HANDLER_QUEUE_RETRY_AFTER = 7
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.llen.return_value = 100
+
+    with pytest.raises(QueueFull) as e:
+        order_receive(user_id=1, amount=10, price=10)
+
+    assert e.value.wait == 7  # noqa: PLR2004
+    mock_redis.rpush.assert_not_called()
+
+
+@patch.dict("aban_exchange.exchange.services._queue_depths", clear=True)
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_receive_caches_queue_depth(mock_redis_connection, settings, caplog):
+    settings.REQUEST_HANDLER_QUEUE_SOFT_LIMIT = 50
+    settings.REQUEST_HANDLER_QUEUE_HARD_LIMIT = 100
+    settings.REQUEST_HANDLER_QUEUE_DEPTH_CACHE_TTL = 60_000
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.llen.return_value = 60
+
+    order_receive(user_id=1, amount=10, price=10)
+    order_receive(user_id=1, amount=10, price=10)
+
+    # over the soft limit the orders are still received, the depth is read once
+    assert mock_redis.rpush.call_count == 2  # noqa: PLR2004
+    mock_redis.llen.assert_called_once_with(settings.REQUEST_HANDLER_QUEUE_NAME)
+    [record] = [r for r in caplog.records if hasattr(r, "metric")]
+    assert record.metric == "order_queue.soft_limit"
+    assert record.depth == 60  # noqa: PLR2004
+
+
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_receive_rate_limited(mock_redis_connection, settings):
+    settings.ORDER_RATE_LIMIT_ENABLED = True
+    settings.ORDER_RATE_LIMIT_TIERS = {
+        "default": {"rate": 1, "burst": 5},
+        "pro": {"rate": 10, "burst": 50},
+    }
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.eval.return_value = [0, None]
+
+    assert order_receive(user_id=7, amount=10, price=10, tier="pro")
+
+    # the bucket is checked and the order pushed by a single script call
+    mock_redis.rpush.assert_not_called()
+    args = mock_redis.eval.call_args.args
+    assert args[1:] == (
+        2,
+        settings.REQUEST_HANDLER_QUEUE_NAME,
+        f"{settings.ORDER_RATE_LIMIT_KEY}:7",
+        "list",
+        10,
+        50,
+        0,
+        "",
+        encode_order(user_id=7, amount=10, price=10),
+    )
+
+    # the bucket is empty, retry once the next token is added
+    mock_redis.eval.return_value = [1200, None]
+    with pytest.raises(RateLimited) as e:
+        order_receive(user_id=7, amount=10, price=10, tier="unknown")
+    assert e.value.wait == 2  # noqa: PLR2004
+    assert mock_redis.eval.call_args.args[6] == 5  # noqa: PLR2004
+
+
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_receive_bulk_over_burst(mock_redis_connection, settings):
+    settings.ORDER_RATE_LIMIT_ENABLED = True
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.eval.return_value = [-1, None]
+
+    with pytest.raises(RateLimited) as e:
+        order_receive_bulk(
+            user_id=7,
+            orders=[{"amount": 10, "price": 10}, {"amount": 20, "price": 10}],
+        )
+
+    assert e.value.wait is None
+    # every order of the request is sent to the script, which takes one token each
+    assert mock_redis.eval.call_args.args[-2:] == (
+        encode_order(user_id=7, amount=10, price=10),
+        encode_order(user_id=7, amount=20, price=10),
+    )
+
+
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_receive_idempotency_key(mock_redis_connection, settings):
+    mock_redis = mock_redis_connection.return_value
+    mock_redis.eval.return_value = [0, None]
+
+    assert order_receive(user_id=7, amount=10, price=20, idempotency_key="k1")
+
+    # the key is set by the script pushing the order
+    mock_redis.rpush.assert_not_called()
+    args = mock_redis.eval.call_args.args
+    assert args[1:4] == (
+        2,
+        settings.REQUEST_HANDLER_QUEUE_NAME,
+        f"{settings.ORDER_IDEMPOTENCY_KEY}:7:k1",
+    )
+    assert args[5:9] == (0, 0, settings.ORDER_IDEMPOTENCY_KEY_TTL, "10:20")
+
+    # a retry is not pushed again
+    mock_redis.eval.return_value = [0, "10:20"]
+    assert not order_receive(user_id=7, amount=10, price=20, idempotency_key="k1")
+
+    # the key can't be used for another order
+    with pytest.raises(IdempotencyKeyReused):
+        order_receive(user_id=7, amount=11, price=20, idempotency_key="k1")
+
+
+@pytest.mark.django_db
+def test_order_history_pages_by_id(django_assert_num_queries):
+    user = UserFactory(id=1)
+    for order_id in (4, 2, 9, 7, 1):
+        ArchiveOrder.objects.create(id=order_id, user=user, price=10, amount=order_id)
+    ArchiveOrder.objects.create(id=5, user=UserFactory(id=2), price=10, amount=5)
+
+    # a last page shorter than the page size ends the walk
+    with django_assert_num_queries(3):
+        history = list(order_history(user_id=1, page_size=2))
+
+    assert [(order_id, amount) for order_id, _, amount, _ in history] == [
+        (1, 1),
+        (2, 2),
+        (4, 4),
+        (7, 7),
+        (9, 9),
+    ]
@@ -0,0 +1,191 @@
+import threading
+from io import StringIO
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from redis.exceptions import ConnectionError  # noqa: A004
+
+from aban_exchange.exchange.codecs import encode_order
+from aban_exchange.exchange.queues import IdempotencyKey
+from aban_exchange.exchange.services import order_receive
+from aban_exchange.exchange.spool import OrderSpool
+from aban_exchange.exchange.spool import spool_drain
+from aban_exchange.utils.exception.system import ServiceUnavailable
+
+
+@pytest.fixture
+def spool_dir(settings, tmp_path):
+    settings.ORDER_SPOOL_DIR = str(tmp_path)
+    return tmp_path
+
+
+def _redis(previous=None):
+    redis = MagicMock()
+    redis.eval.return_value = [0, previous]
+    return redis
+
+
+def _pushed(redis):
+    # (shard queue, idempotency key, order) of every replayed order
+    return [
+        (call.args[2], call.args[3], call.args[-1])
+        for call in redis.eval.call_args_list
+    ]
+
+
+def test_spool_drain_replays_orders_in_order(spool_dir, settings):
+    settings.REQUEST_HANDLER_QUEUE_SHARDS = 2
+    spool = OrderSpool(spool_dir, segment_size=1024)
+    spool.append([(0, "a"), (0, "b")])
+    spool.append([(1, b"\x01c")], IdempotencyKey("client:k", "1:2", 60))
+    spool.seal()
+
+    redis = _redis()
+    assert spool_drain(redis) == 3  # noqa: PLR2004
+
+    [segment] = {key.split(":")[1] for _, key, _ in _pushed(redis) if "spool" in key}
+    first, second, third = _pushed(redis)
+    # orders without a client key are deduplicated by their position
+    assert first == (
+        settings.REQUEST_HANDLER_QUEUE_NAME,
+        f"{settings.ORDER_SPOOL_KEY}:{segment}:0",
+        b"a",
+    )
+    assert second[0] == settings.REQUEST_HANDLER_QUEUE_NAME
+    assert second[1] != first[1]
+    assert second[2] == b"b"
+    assert third == (f"{settings.REQUEST_HANDLER_QUEUE_NAME}:1", "client:k", b"\x01c")
+    # a replayed segment is removed
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_spool_drain_resumes_open_segment(spool_dir):
+    spool = OrderSpool(spool_dir, segment_size=1024)
+    spool.append([(0, "a")])
+
+    redis = _redis()
+    assert spool_drain(redis) == 1
+    # the writer is alive, its segment is kept and only the new orders replayed
+    spool.append([(0, "b")])
+    assert spool_drain(redis) == 1
+    assert [order for _, _, order in _pushed(redis)] == [b"a", b"b"]
+    assert len(list(spool_dir.glob("*.open"))) == 1
+
+
+def test_spool_drain_skips_orders_already_pushed(spool_dir):
+    spool = OrderSpool(spool_dir, segment_size=1024)
+    spool.append([(0, "a")])
+    spool.seal()
+
+    # e.g. the drainer crashed after the push and before the checkpoint
+    assert spool_drain(_redis(previous="")) == 0
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_spool_drain_keeps_checkpoint_on_redis_error(spool_dir):
+    spool = OrderSpool(spool_dir, segment_size=1024)
+    spool.append([(0, "a")])
+    spool.append([(0, "b")])
+    spool.seal()
+
+    redis = _redis()
+    redis.eval.side_effect = [[0, None], ConnectionError]
+    with pytest.raises(ConnectionError):
+        spool_drain(redis, batch_size=1)
+
+    redis = _redis()
+    assert spool_drain(redis) == 1
+    assert [order for _, _, order in _pushed(redis)] == [b"b"]
+
+
+def test_spool_drain_ignores_torn_record(spool_dir):
+    spool = OrderSpool(spool_dir, segment_size=1024)
+    spool.append([(0, "a")])
+    spool.seal()
+    [segment] = spool_dir.glob("*.seg")
+    with segment.open("ab") as f:
+        f.write(b"\x10\x00\x00\x00torn")
+
+    redis = _redis()
+    assert spool_drain(redis) == 1
+    assert [order for _, _, order in _pushed(redis)] == [b"a"]
+
+
+def test_spool_rotates_full_segment(spool_dir):
+    spool = OrderSpool(spool_dir, segment_size=16)
+    for i in range(3):
+        spool.append([(0, f"order-{i}")])
+
+    assert len(list(spool_dir.glob("*.seg"))) == 3  # noqa: PLR2004
+    redis = _redis()
+    assert spool_drain(redis) == 3  # noqa: PLR2004
+    assert [order for _, _, order in _pushed(redis)] == [
+        b"order-0",
+        b"order-1",
+        b"order-2",
+    ]
+
+
+def test_spool_concurrent_appends(spool_dir):
+    spool = OrderSpool(spool_dir, segment_size=64)
+
+    threads = [
+        threading.Thread(target=spool.append, args=([(0, f"order-{i}")],))
+        for i in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    spool.seal()
+
+    redis = _redis()
+    assert spool_drain(redis) == 10  # noqa: PLR2004
+    assert sorted(order for _, _, order in _pushed(redis)) == sorted(
+        f"order-{i}".encode() for i in range(10)
+    )
+
+
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_receive_spools_when_redis_is_down(
+    mock_redis_connection,
+    spool_dir,
+    settings,
+):
+    settings.ORDER_SPOOL_ENABLED = True
+    mock_redis_connection.return_value.rpush.side_effect = ConnectionError
+
+    with patch("aban_exchange.exchange.services.get_spool") as mock_get_spool:
+        mock_get_spool.return_value = OrderSpool(spool_dir, segment_size=1024)
+        assert order_receive(user_id=1, amount=10, price=20)
+
+    redis = _redis()
+    assert spool_drain(redis) == 1
+    assert _pushed(redis)[0][2] == encode_order(user_id=1, amount=10, price=20).encode()
+
+
+@patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+def test_order_receive_spool_disabled(mock_redis_connection, spool_dir):
+    mock_redis_connection.return_value.rpush.side_effect = ConnectionError
+
+    with pytest.raises(ServiceUnavailable):
+        order_receive(user_id=1, amount=10, price=20)
+    assert list(spool_dir.iterdir()) == []
+
+
+@patch(
+    "aban_exchange.exchange.management.commands.drain_order_spool.RedisConnector.get_connection",
+)
+def test_drain_order_spool_command(mock_redis_connection, spool_dir):
+    mock_redis_connection.return_value.eval.return_value = [0, None]
+    spool = OrderSpool(spool_dir, segment_size=1024)
+    spool.append([(0, "a")])
+    spool.seal()
+
+    out = StringIO()
+    call_command("drain_order_spool", once=True, stdout=out)
+
+    assert "1 spooled orders pushed." in out.getvalue()
+    assert list(spool_dir.iterdir()) == []
@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django_celery_beat.models import PeriodicTask
+
+from aban_exchange.exchange.tasks import handle_batch_of_request
+from aban_exchange.exchange.tasks import maintain_archive_partitions
+
+
+@patch("aban_exchange.exchange.tasks.accumulate_batch_of_placed_order")
+@patch("aban_exchange.exchange.tasks.placed_order_notif")
+@patch("aban_exchange.exchange.tasks.order_filler_trigger")
+@patch("aban_exchange.exchange.tasks.order_validator")
+def test_handle_batch_of_request_triggers_filler(
+    mock_order_validator,
+    mock_order_filler_trigger,
+    mock_placed_order_notif,
+    mock_accumulate,
+):
+    mock_order_validator.return_value = ([1, 2], [])
+    mock_order_filler_trigger.return_value = True
+
+    handle_batch_of_request()
+
+    mock_placed_order_notif.delay.assert_called_once_with([1, 2])
+    mock_accumulate.delay.assert_called_once_with()
+
+
+@patch("aban_exchange.exchange.tasks.accumulate_batch_of_placed_order")
+@patch("aban_exchange.exchange.tasks.droped_order_notif")
+@patch("aban_exchange.exchange.tasks.order_filler_trigger")
+@patch("aban_exchange.exchange.tasks.order_validator")
+def test_handle_batch_of_request_without_placed_orders(
+    mock_order_validator,
+    mock_order_filler_trigger,
+    mock_droped_order_notif,
+    mock_accumulate,
+):
+    mock_order_validator.return_value = ([], [1])
+
+    handle_batch_of_request()
+
+    mock_droped_order_notif.delay.assert_called_once_with([1])
+    mock_order_filler_trigger.assert_not_called()
+    mock_accumulate.delay.assert_not_called()
+
+
+@pytest.mark.parametrize("supported", [True, False])
+@patch("aban_exchange.exchange.tasks.archive_partitions_maintain")
+@patch("aban_exchange.exchange.tasks.partitioning_supported")
+def test_maintain_archive_partitions(
+    mock_partitioning_supported,
+    mock_archive_partitions_maintain,
+    supported,
+    settings,
+):
+    mock_partitioning_supported.return_value = supported
+    settings.ARCHIVE_PARTITIONS_AHEAD = 2
+    settings.ARCHIVE_RETENTION_MONTHS = 12
+
+    maintain_archive_partitions()
+
+    if supported:
+        kwargs = mock_archive_partitions_maintain.call_args.kwargs
+        assert (kwargs["ahead"], kwargs["retention"]) == (2, 12)
+    else:
+        mock_archive_partitions_maintain.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_init_periodic_tasks_schedules_archive_partitions():
+    call_command("init_periodic_tasks")
+
+    task = PeriodicTask.objects.get(
+        task="aban_exchange.exchange.tasks.maintain_archive_partitions",
+    )
+    assert (task.interval.every, task.interval.period) == (1, "days")
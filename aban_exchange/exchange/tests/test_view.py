@@ -1,10 +1,16 @@
+import asyncio
 from unittest.mock import patch
 
 import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from aban_exchange.exchange.models import ArchiveOrder
+from aban_exchange.users.tests.factories import UserFactory
+
 
 @pytest.mark.django_db
 class TestOrderCreateApi:
@@ -44,6 +50,8 @@ class TestOrderCreateApi:
             )
             mock_order_receive.assert_called_once_with(
                 user_id=user.id,
+                tier="default",
+                idempotency_key=None,
                 amount=10,
                 price=100,
             )
@@ -71,3 +79,308 @@ class TestOrderCreateApi:
         }
         response = api_client.post(reverse("api:orders:create"), order_data)
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    @patch.dict("aban_exchange.exchange.services._queue_depths", clear=True)
+    @patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+    def test_order_create_queue_full(
+        self,
+        mock_redis_connection,
+        api_client,
+        user,
+        settings,
+    ):
+        settings.REQUEST_HANDLER_QUEUE_HARD_LIMIT = 100
+        settings.REQUEST_HANDLER_QUEUE_RETRY_AFTER = 5
+        mock_redis_connection.return_value.llen.return_value = 150
+        access_token = self.get_access_token(api_client, user)
+
+        response = api_client.post(
+            reverse("api:orders:create"),
+            {"amount": 10, "price": 100},
+            HTTP_AUTHORIZATION=f"Bearer {access_token}",
+        )
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response["Retry-After"] == "5"
+        mock_redis_connection.return_value.rpush.assert_not_called()
+
+    @patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+    def test_order_create_rate_limited(
+        self,
+        mock_redis_connection,
+        api_client,
+        user,
+        settings,
+    ):
+        settings.ORDER_RATE_LIMIT_ENABLED = True
+        mock_redis_connection.return_value.eval.return_value = [2500, None]
+        access_token = self.get_access_token(api_client, user)
+
+        response = api_client.post(
+            reverse("api:orders:create"),
+            {"amount": 10, "price": 100},
+            HTTP_AUTHORIZATION=f"Bearer {access_token}",
+        )
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response["Retry-After"] == "3"
+
+    @patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+    def test_order_create_replayed(self, mock_redis_connection, api_client, user):
+        mock_redis = mock_redis_connection.return_value
+        access_token = self.get_access_token(api_client, user)
+
+        responses = []
+        for previous in [None, "10:100"]:
+            mock_redis.eval.return_value = [0, previous]
+            responses.append(
+                api_client.post(
+                    reverse("api:orders:create"),
+                    {"amount": 10, "price": 100},
+                    HTTP_AUTHORIZATION=f"Bearer {access_token}",
+                    HTTP_IDEMPOTENCY_KEY="retry-1",
+                ),
+            )
+
+        first, replay = responses
+        assert first.status_code == replay.status_code == status.HTTP_201_CREATED
+        assert first.data == replay.data
+        assert "Idempotent-Replayed" not in first
+        assert replay["Idempotent-Replayed"] == "true"
+        mock_redis.rpush.assert_not_called()
+
+    def test_order_create_invalid_idempotency_key(self, api_client, user):
+        access_token = self.get_access_token(api_client, user)
+
+        response = api_client.post(
+            reverse("api:orders:create"),
+            {"amount": 10, "price": 100},
+            HTTP_AUTHORIZATION=f"Bearer {access_token}",
+            HTTP_IDEMPOTENCY_KEY="k" * 256,
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "Idempotency-Key" in response.data
+
+
+@pytest.mark.django_db
+class TestOrderBulkCreateApi:
+    @pytest.fixture
+    def api_client(self, user):
+        api_client = APIClient()
+        response = api_client.post(
+            reverse("token_obtain_pair"),
+            {"username": user.username, "password": "password123"},
+        )
+        api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return api_client
+
+    def post(self, api_client, data):
+        return api_client.post(reverse("api:orders:bulk-create"), data, format="json")
+
+    @patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+    def test_bulk_create_pushes_valid_orders_once(
+        self,
+        mock_redis_connection,
+        api_client,
+        user,
+        settings,
+    ):
+        orders = [
+            {"amount": 10, "price": 100},
+            {"amount": -1, "price": 100},
+            {"amount": 20, "price": 50},
+        ]
+
+        response = self.post(api_client, orders)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        results = response.data["results"]
+        assert [result["accepted"] for result in results] == [True, False, True]
+        assert "amount" in results[1]["errors"]
+        # both valid orders are pushed by one command
+        mock_redis_connection.return_value.rpush.assert_called_once_with(
+            settings.REQUEST_HANDLER_QUEUE_NAME,
+            f'{{"user_id": {user.id}, "amount": 10, "price": 100}}',
+            f'{{"user_id": {user.id}, "amount": 20, "price": 50}}',
+        )
+
+    @patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+    def test_bulk_create_without_valid_orders(self, mock_redis_connection, api_client):
+        response = self.post(api_client, [{"amount": 0, "price": 100}, "order"])
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert [result["accepted"] for result in response.data["results"]] == [
+            False,
+            False,
+        ]
+        mock_redis_connection.return_value.rpush.assert_not_called()
+
+    def test_bulk_create_invalid_payload(self, api_client, settings):
+        settings.ORDER_BULK_CREATE_MAX_SIZE = 2
+
+        assert self.post(api_client, {"amount": 10, "price": 100}).status_code == (
+            status.HTTP_400_BAD_REQUEST
+        )
+        assert self.post(api_client, []).status_code == status.HTTP_400_BAD_REQUEST
+        too_many = [{"amount": 10, "price": 100}] * 3
+        assert self.post(api_client, too_many).status_code == (
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_bulk_create_max_size_follows_rate_tier(self, api_client, settings):
+        settings.ORDER_RATE_LIMIT_ENABLED = True
+        settings.ORDER_BULK_CREATE_MAX_SIZE = 5
+        settings.ORDER_RATE_LIMIT_TIERS = {"default": {"rate": 1, "burst": 2}}
+
+        response = self.post(api_client, [{"amount": 10, "price": 100}] * 3)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "No more than 2 orders" in str(response.data)
+
+    @patch("aban_exchange.exchange.services.RedisConnector.get_connection")
+    def test_bulk_create_redis_error(self, mock_redis_connection, api_client):
+        mock_redis_connection.return_value.rpush.side_effect = ConnectionError
+
+        response = self.post(api_client, [{"amount": 10, "price": 100}])
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    def test_bulk_create_unauthenticated(self):
+        response = APIClient().post(
+            reverse("api:orders:bulk-create"),
+            [{"amount": 10, "price": 100}],
+            format="json",
+        )
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+class TestOrderCreateAsyncApi:
+    def get_access_token(self, user):
+        response = APIClient().post(
+            reverse("token_obtain_pair"),
+            {"username": user.username, "password": "password123"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return response.data["access"]
+
+    def post(self, data, access_token=None):
+        headers = {"Authorization": f"Bearer {access_token}"} if access_token else {}
+        return async_to_sync(AsyncClient().post)(
+            reverse("api:orders:async-create"),
+            data,
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_order_create_successful(self, user):
+        access_token = self.get_access_token(user)
+
+        with patch(
+            "aban_exchange.exchange.views.order_receive_async",
+        ) as mock_order_receive:
+            response = self.post({"amount": 10, "price": 100}, access_token)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert (
+            response.json()["detail"]
+            == "we recieve your order successfully. we notice you with email!"
+        )
+        mock_order_receive.assert_awaited_once_with(
+            user_id=user.id,
+            tier="default",
+            idempotency_key=None,
+            amount=10,
+            price=100,
+        )
+
+    def test_order_create_invalid_data(self, user):
+        access_token = self.get_access_token(user)
+
+        response = self.post({"amount": -1, "price": 100}, access_token)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "amount" in response.json()
+
+    def test_order_create_unauthenticated(self):
+        response = self.post({"amount": 10, "price": 100})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_order_create_redis_error(self, user):
+        access_token = self.get_access_token(user)
+
+        with patch(
+            "aban_exchange.exchange.services.AsyncRedisConnector.get_connection",
+        ) as mock_redis_connection:
+            mock_redis_connection.return_value.rpush.side_effect = ConnectionError
+            response = self.post({"amount": 10, "price": 100}, access_token)
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    def test_order_create_twice_in_new_event_loops(self, user):
+        # under WSGI every request runs the view in a new event loop, a client
+        # created in the loop of the first request can't be used by the second
+        access_token = self.get_access_token(user)
+        used = []
+
+        async def queue_push_async(redis, items, shard):
+            used.append((redis, asyncio.get_running_loop()))
+
+        with patch(
+            "aban_exchange.exchange.services.queue_push_async",
+            side_effect=queue_push_async,
+        ):
+            first = self.post({"amount": 10, "price": 100}, access_token)
+            second = self.post({"amount": 10, "price": 100}, access_token)
+
+        assert first.status_code == status.HTTP_201_CREATED
+        assert second.status_code == status.HTTP_201_CREATED
+        (first_redis, first_loop), (second_redis, second_loop) = used
+        assert first_loop is not second_loop
+        assert first_redis is not second_redis
+
+
+@pytest.mark.django_db
+class TestOrderHistoryCsvApi:
+    @pytest.fixture
+    def api_client(self, user):
+        api_client = APIClient()
+        response = api_client.post(
+            reverse("token_obtain_pair"),
+            {"username": user.username, "password": "password123"},
+        )
+        api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return api_client
+
+    def test_history_streams_user_orders(self, api_client, user, settings):
+        settings.ORDER_HISTORY_PAGE_SIZE = 2
+        orders = [
+            ArchiveOrder.objects.create(id=order_id, user=user, price=10, amount=25)
+            for order_id in (3, 1, 5)
+        ]
+        ArchiveOrder.objects.create(id=4, user=UserFactory(), price=10, amount=10)
+
+        response = api_client.get(reverse("api:orders:history"), HTTP_ACCEPT="text/csv")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        assert response["Content-Type"] == "text/csv"
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        assert lines[0] == "id,price,amount,tokens,filled_at"
+        by_id = {order.id: order for order in orders}
+        assert lines[1:] == [
+            f"{order_id},10,25,2,{by_id[order_id].created_at.isoformat()}"
+            for order_id in (1, 3, 5)
+        ]
+
+    def test_history_unauthenticated(self):
+        response = APIClient().get(reverse("api:orders:history"))
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        response = APIClient().get(
+            reverse("api:orders:history"),
+            HTTP_ACCEPT="text/csv",
+        )
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response.content.decode().splitlines()[0] == "detail"
@@ -1,7 +1,10 @@
 from django.urls import include
 from django.urls import path
 
+from .views import OrderBulkCreateApi
 from .views import OrderCreateApi
+from .views import OrderCreateAsyncApi
+from .views import OrderHistoryCsvApi
 
 order_url = [
     path(
@@ -9,6 +12,21 @@ order_url = [
         OrderCreateApi.as_view(),
         name="create",
     ),
+    path(
+        "bulk-create/",
+        OrderBulkCreateApi.as_view(),
+        name="bulk-create",
+    ),
+    path(
+        "async-create/",
+        OrderCreateAsyncApi.as_view(),
+        name="async-create",
+    ),
+    path(
+        "history.csv",
+        OrderHistoryCsvApi.as_view(),
+        name="history",
+    ),
 ]
 
 urlpatterns = [path("order/", include((order_url, "orders")))]
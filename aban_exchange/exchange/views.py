@@ -1,12 +1,51 @@
+import csv
+import json
+
 from django.conf import settings
+from django.http import JsonResponse
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import serializers
+from rest_framework.exceptions import APIException
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.exceptions import ParseError
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BaseRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
+from .services import order_bulk_max_size
+from .services import order_history
 from .services import order_receive
+from .services import order_receive_async
+from .services import order_receive_bulk
 
 User = settings.AUTH_USER_MODEL
 
+ORDER_RECEIVED_MESSAGE = "we recieve your order successfully. we notice you with email!"
+# largest value of the `PositiveIntegerField`s of an order
+MAX_ORDER_FIELD_VALUE = 2**31 - 1
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def get_idempotency_key(request):
+    """
+    Returns the `Idempotency-Key` header of a request, if any.
+
+    Raises:
+        ValidationError: If the key is empty or longer than
+        `IDEMPOTENCY_KEY_MAX_LENGTH`.
+    """
+
+    key = request.headers.get("Idempotency-Key")
+    if key is not None and not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        msg = f"Idempotency-Key must have 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters."
+        raise ValidationError({"Idempotency-Key": [msg]})
+    return key
+
 
 class OrderCreateApi(APIView):
     """
@@ -14,26 +53,204 @@ class OrderCreateApi(APIView):
 
     This API allows authenticated users to create new orders by providing the
     required order details (amount and price). The order data is validated and
-    sent to a Redis queue for further processing.
+    sent to a Redis queue for further processing. A request retried with the same
+    `Idempotency-Key` header receives the same response without creating the
+    order again (with an `Idempotent-Replayed` header).
 
     Methods:
         post: Accepts order data, validates it, and processes the order.
     """
 
     class InputSerializer(serializers.Serializer):
-        amount = serializers.IntegerField(required=True, allow_null=False, min_value=1)
-        price = serializers.IntegerField(required=True, allow_null=False, min_value=1)
+        amount = serializers.IntegerField(
+            required=True,
+            allow_null=False,
+            min_value=1,
+            max_value=MAX_ORDER_FIELD_VALUE,
+        )
+        price = serializers.IntegerField(
+            required=True,
+            allow_null=False,
+            min_value=1,
+            max_value=MAX_ORDER_FIELD_VALUE,
+        )
 
     def post(self, request):
+        idempotency_key = get_idempotency_key(request)
         serializer = self.InputSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        order_receive(
+        received = order_receive(
             user_id=request.user.id,
+            tier=request.user.rate_tier,
+            idempotency_key=idempotency_key,
             **serializer.validated_data,
         )
-        return Response(
+        response = Response(
             data={
-                "detail": "we recieve your order successfully. we notice you with email!",  # noqa: E501
+                "detail": ORDER_RECEIVED_MESSAGE,
             },
             status=201,
         )
+        if not received:
+            response["Idempotent-Replayed"] = "true"
+        return response
+
+
+class OrderBulkCreateApi(APIView):
+    """
+    API view to create several orders with one request.
+
+    Accepts a list of orders (amount and price), every order is validated on its
+    own and the valid ones are sent to the Redis queue together. The result of
+    each order is returned in the request order.
+
+    Methods:
+        post: Accepts a list of orders, validates them, and processes the valid ones.
+    """
+
+    def post(self, request):
+        if not isinstance(request.data, list) or not request.data:
+            msg = "Expected a non-empty list of orders."
+            raise ValidationError(msg)
+        max_size = order_bulk_max_size(request.user.rate_tier)
+        if len(request.data) > max_size:
+            msg = f"No more than {max_size} orders per request."
+            raise ValidationError(msg)
+
+        orders = []
+        results = []
+        for data in request.data:
+            serializer = OrderCreateApi.InputSerializer(data=data)
+            if serializer.is_valid():
+                orders.append(serializer.validated_data)
+                results.append({"accepted": True})
+            else:
+                results.append({"accepted": False, "errors": serializer.errors})
+
+        if orders:
+            order_receive_bulk(
+                user_id=request.user.id,
+                orders=orders,
+                tier=request.user.rate_tier,
+            )
+
+        return Response(
+            data={
+                "detail": ORDER_RECEIVED_MESSAGE if orders else "No valid order.",
+                "results": results,
+            },
+            status=201 if orders else 400,
+        )
+
+
+class _Echo:
+    # file-like object for `csv.writer`, the written line is returned as is
+    def write(self, value):
+        return value
+
+
+class _CsvRenderer(BaseRenderer):
+    # lets clients ask for `text/csv`, the rows themselves are streamed by the
+    # view, only the error responses (a dict) are rendered here
+    media_type = "text/csv"
+    format = "csv"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not data:
+            return b""
+        writer = csv.writer(_Echo())
+        return (writer.writerow(data.keys()) + writer.writerow(data.values())).encode(
+            self.charset,
+        )
+
+
+class OrderHistoryCsvApi(APIView):
+    """
+    API view to download the filled orders of the user as CSV.
+
+    The response is streamed, rows are sent as the orders are read page by page
+    (see `services.order_history`), so it starts at once and uses the same memory
+    for any number of orders.
+
+    Methods:
+        get: Streams the filled orders of the user, oldest first.
+    """
+
+    HEADER = ("id", "price", "amount", "tokens", "filled_at")
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, _CsvRenderer]
+
+    def _rows(self, user_id):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(self.HEADER)
+        for order_id, price, amount, filled_at in order_history(user_id=user_id):
+            yield writer.writerow(
+                (order_id, price, amount, amount // price, filled_at.isoformat()),
+            )
+
+    def get(self, request):
+        response = StreamingHttpResponse(
+            self._rows(request.user.id),
+            content_type="text/csv",
+        )
+        response["Content-Disposition"] = 'attachment; filename="orders.csv"'
+        return response
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class OrderCreateAsyncApi(View):
+    """
+    Asynchronous variant of `OrderCreateApi` for ASGI workers (`config.asgi`).
+
+    DRF views are synchronous, so this view authenticates the request with the
+    configured (stateless) authentication classes, validates the data with
+    `OrderCreateApi.InputSerializer` and awaits `order_receive_async`. A worker
+    keeps serving other requests while the order is pushed to Redis.
+
+    Methods:
+        post: Accepts order data, validates it, and processes the order.
+    """
+
+    def _authenticate(self, request):
+        for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+            result = authenticator().authenticate(request)
+            if result is not None:
+                return result[0]
+        raise NotAuthenticated
+
+    def _parse(self, request):
+        if request.content_type != "application/json":
+            return request.POST
+        try:
+            return json.loads(request.body or b"{}")
+        except ValueError:
+            raise ParseError  # noqa: B904
+
+    async def post(self, request):
+        try:
+            user = self._authenticate(request)
+            idempotency_key = get_idempotency_key(request)
+            data = self._parse(request)
+        except APIException as e:
+            return JsonResponse({"detail": e.detail}, status=e.status_code)
+
+        serializer = OrderCreateApi.InputSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        try:
+            received = await order_receive_async(
+                user_id=user.id,
+                tier=user.rate_tier,
+                idempotency_key=idempotency_key,
+                **serializer.validated_data,
+            )
+        except APIException as e:
+            response = JsonResponse({"detail": e.detail}, status=e.status_code)
+            if getattr(e, "wait", None):
+                response["Retry-After"] = str(int(e.wait))
+            return response
+
+        response = JsonResponse({"detail": ORDER_RECEIVED_MESSAGE}, status=201)
+        if not received:
+            response["Idempotent-Replayed"] = "true"
+        return response
@@ -1,18 +1,35 @@
 from django.contrib import admin
 from django.contrib.auth import admin as auth_admin
+from django.db import transaction
 
+from .forms import BalanceEntryAdminForm
 from .forms import UserAdminChangeForm
 from .forms import UserAdminCreationForm
+from .models import BalanceEntry
 from .models import User
+from .models import Wallet
+from .services import wallet_lock
+
+
+class WalletInline(admin.StackedInline):
+    # a snapshot of the balances, they are changed by adding balance entries
+    model = Wallet
+    can_delete = False
+    readonly_fields = ["balance", "token_balance", "entry_id"]
+
+    def has_add_permission(self, request, obj):
+        return False
 
 
 @admin.register(User)
 class UserAdmin(auth_admin.UserAdmin):
     form = UserAdminChangeForm
     add_form = UserAdminCreationForm
+    inlines = [WalletInline]
     fieldsets = (
         (None, {"fields": ("username", "password")}),
-        ("Personal info", {"fields": ("name", "email", "balance", "token_balance")}),
+        ("Personal info", {"fields": ("name", "email")}),
+        ("Limits", {"fields": ("rate_tier",)}),
         (
             "Permissions",
             {
@@ -29,3 +46,23 @@ class UserAdmin(auth_admin.UserAdmin):
     )
     list_display = ["username", "name", "is_superuser"]
     search_fields = ["name"]
+
+
+@admin.register(BalanceEntry)
+class BalanceEntryAdmin(admin.ModelAdmin):
+    # entries are never changed, a correction is a new entry
+    form = BalanceEntryAdminForm
+    list_display = ["id", "wallet", "balance", "token_balance", "created_at"]
+    raw_id_fields = ["wallet"]
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        # written while the wallet is locked, like the validators and the filler do
+        with transaction.atomic():
+            wallet_lock([obj.wallet_id])
+            obj.save()
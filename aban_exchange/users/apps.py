@@ -5,3 +5,6 @@ from django.utils.translation import gettext_lazy as _
 class UsersConfig(AppConfig):
     name = "aban_exchange.users"
     verbose_name = _("Users")
+
+    def ready(self):
+        from . import signals  # noqa: F401
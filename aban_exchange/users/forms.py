@@ -1,6 +1,9 @@
+from django import forms
 from django.contrib.auth import forms as admin_forms
 
+from .models import BalanceEntry
 from .models import User
+from .services import wallet_balances
 
 
 class UserAdminChangeForm(admin_forms.UserChangeForm):
@@ -19,3 +22,22 @@ class UserAdminCreationForm(admin_forms.UserCreationForm):
         error_messages = {
             "username": {"unique": "This username has already been taken."},
         }
+
+
+class BalanceEntryAdminForm(forms.ModelForm):
+    class Meta:
+        model = BalanceEntry
+        fields = ["wallet", "balance", "token_balance"]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        wallet = cleaned_data.get("wallet")
+        if wallet is not None:
+            current = wallet_balances([wallet.user_id])[wallet.user_id]
+            if (
+                current.balance + (cleaned_data.get("balance") or 0) < 0
+                or current.token_balance + (cleaned_data.get("token_balance") or 0) < 0
+            ):
+                msg = "The balances of the wallet can't go below zero."
+                raise forms.ValidationError(msg)
+        return cleaned_data
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.10 on 2026-10-18 14:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_alter_user_token_balance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='rate_tier',
+            field=models.CharField(default='default', max_length=32, verbose_name='Order rate tier'),
+        ),
+    ]
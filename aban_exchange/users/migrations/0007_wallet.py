@@ -0,0 +1,57 @@
+# Generated by Django 5.0.10 on 2026-10-18 14:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_wallet_fillfactor(apps, schema_editor):
+    # leave room in every page so a balance update can be a HOT update
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE users_wallet SET (fillfactor = 70)')
+
+
+def populate_wallet(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Wallet = apps.get_model('users', 'Wallet')
+    Wallet.objects.bulk_create(
+        (
+            Wallet(
+                user_id=user['id'],
+                balance=user['balance'],
+                token_balance=user['token_balance'],
+            )
+            for user in User.objects.values('id', 'balance', 'token_balance').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+def restore_user_balances(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Wallet = apps.get_model('users', 'Wallet')
+    for wallet in Wallet.objects.iterator():
+        User.objects.filter(id=wallet.user_id).update(
+            balance=wallet.balance,
+            token_balance=wallet.token_balance,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_user_rate_tier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Wallet',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='wallet', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Wallet owner')),
+                ('balance', models.PositiveIntegerField(default=0, verbose_name='Wallet balance')),
+                ('token_balance', models.PositiveIntegerField(default=0, verbose_name='Token balance')),
+            ],
+        ),
+        migrations.RunPython(set_wallet_fillfactor, migrations.RunPython.noop),
+        migrations.RunPython(populate_wallet, restore_user_balances),
+    ]
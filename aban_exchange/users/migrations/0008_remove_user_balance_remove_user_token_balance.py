@@ -0,0 +1,21 @@
+# Generated by Django 5.0.10 on 2026-10-18 14:19
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_wallet'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='balance',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='token_balance',
+        ),
+    ]
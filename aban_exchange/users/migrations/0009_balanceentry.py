@@ -0,0 +1,33 @@
+# Generated by Django 5.0.10 on 2026-10-18 14:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_remove_user_balance_remove_user_token_balance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='entry_id',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Last folded entry'),
+        ),
+        migrations.CreateModel(
+            name='BalanceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.IntegerField(default=0, verbose_name='Balance change')),
+                ('token_balance', models.IntegerField(default=0, verbose_name='Token balance change')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('wallet', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='users.wallet', verbose_name='Wallet')),
+            ],
+            options={
+                'verbose_name_plural': 'balance entries',
+                'indexes': [models.Index(fields=['wallet', 'id'], name='users_balan_wallet__d926fc_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.10 on 2026-10-18 15:02
+
+from django.db import migrations
+
+
+def create_missing_wallets(apps, schema_editor):
+    # users created after 0007_wallet by anything else than `user_create` or the
+    # admin have no wallet, the wallets are created with the users since then
+    User = apps.get_model('users', 'User')
+    Wallet = apps.get_model('users', 'Wallet')
+    Wallet.objects.bulk_create(
+        (
+            Wallet(user_id=user_id)
+            for user_id in User.objects.filter(wallet__isnull=True)
+            .values_list('id', flat=True)
+            .iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_balanceentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_wallets, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,14 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.db.models import CASCADE
 from django.db.models import CharField
+from django.db.models import DateTimeField
+from django.db.models import ForeignKey
+from django.db.models import Index
+from django.db.models import IntegerField
+from django.db.models import Model
+from django.db.models import OneToOneField
+from django.db.models import PositiveBigIntegerField
 from django.db.models import PositiveIntegerField
 
 
@@ -15,8 +24,77 @@ class User(AbstractUser):
     first_name = None  # type: ignore[assignment]
     last_name = None  # type: ignore[assignment]
 
+    # order rate limit of the user, a key of `settings.ORDER_RATE_LIMIT_TIERS`,
+    # sent in the JWT claims (see `serializers.TokenObtainPairSerializer`)
+    rate_tier = CharField(
+        max_length=32,
+        default="default",
+        verbose_name="Order rate tier",
+    )
+
+
+class Wallet(Model):
+    """
+    Balances of a user, kept apart from the user row.
+
+    The balances are a snapshot: orders placed and filled append `BalanceEntry`
+    rows, which `services.wallet_snapshot` folds in from time to time. The current
+    balances are the snapshot plus the entries after `entry_id`, read them with
+    `services.wallet_balances`.
+
+    A narrow row keeps the snapshot updates cheap and leaves the wide user row
+    untouched. The table is created with a lower fillfactor on PostgreSQL so the
+    new row versions fit in the same page (HOT updates).
+    """
+
+    user = OneToOneField(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=CASCADE,
+        primary_key=True,
+        related_name="wallet",
+        verbose_name="Wallet owner",
+    )
+
     # balance field should be float for commertical use case
     balance = PositiveIntegerField(default=0, verbose_name="Wallet balance")
 
     # token balance field used for save user assets count
     token_balance = PositiveIntegerField(default=0, verbose_name="Token balance")
+
+    # last `BalanceEntry` folded in the balances above
+    entry_id = PositiveBigIntegerField(default=0, verbose_name="Last folded entry")
+
+    def __str__(self):
+        return f"user: {self.user_id}, balance: {self.balance}"
+
+
+class BalanceEntry(Model):
+    """
+    A change of the balances of a wallet, rows are only ever inserted.
+
+    Debits are written when orders are placed and credits when they are filled,
+    always while the wallet row is locked, so the entries of a wallet are committed
+    in id order and a snapshot never skips one.
+    """
+
+    wallet = ForeignKey(
+        to=Wallet,
+        on_delete=CASCADE,
+        related_name="entries",
+        db_index=False,
+        verbose_name="Wallet",
+    )
+    # negative for a debit
+    balance = IntegerField(default=0, verbose_name="Balance change")
+    token_balance = IntegerField(default=0, verbose_name="Token balance change")
+    created_at = DateTimeField(auto_now_add=True, verbose_name="Created at")
+
+    class Meta:
+        verbose_name_plural = "balance entries"
+        indexes = [
+            # the entries of a wallet after its snapshot
+            Index(fields=["wallet", "id"]),
+        ]
+
+    def __str__(self):
+        return f"wallet: {self.wallet_id}, {self.balance:+}$, {self.token_balance:+}"
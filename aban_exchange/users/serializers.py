@@ -0,0 +1,19 @@
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer as BaseTokenObtainPairSerializer,
+)
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    """
+    Adds the claims read by the APIs to the token pair of a user.
+
+    Authentication is stateless (`JWTStatelessUserAuthentication`), so
+    `request.user` only knows the claims of the access token. Refreshed access
+    tokens copy the claims of the refresh token.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["rate_tier"] = user.rate_tier
+        return token
@@ -1,4 +1,25 @@
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BigIntegerField
+from django.db.models import Count
+from django.db.models import Exists
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from .models import BalanceEntry
 from .models import User
+from .models import Wallet
+
+
+class WalletBalance(NamedTuple):
+    balance: int
+    token_balance: int
 
 
 def user_create(*, username: str, email: str, password: str):
@@ -7,6 +28,7 @@ def user_create(*, username: str, email: str, password: str):
 
     This function uses Django's `create_user` method to create a new user in the
     database. It ensures that the password is properly hashed and stored securely.
+    The user's empty wallet is created with it (see `signals.wallet_create`).
 
     Args:
         username (str): The username for the new user.
@@ -20,4 +42,148 @@ def user_create(*, username: str, email: str, password: str):
         IntegrityError: If the username or email is not unique.
         ValidationError: If the provided data is invalid.
     """
-    return User.objects.create_user(username=username, email=email, password=password)
+    with transaction.atomic():
+        return User.objects.create_user(
+            username=username,
+            email=email,
+            password=password,
+        )
+
+
+def wallet_lock(user_ids) -> list[int]:
+    """
+    Locks the wallets of the given users, in user id order.
+
+    Must be called in a transaction before writing `BalanceEntry` rows of the
+    wallets, or before reading balances which are checked before such a write.
+
+    Args:
+        user_ids (Iterable[int]): IDs of the users.
+
+    Returns:
+        list[int]: IDs of the users who have a wallet, in ascending order.
+    """
+
+    return list(
+        Wallet.objects.select_for_update(no_key=True)
+        .filter(user_id__in=user_ids)
+        .order_by("user_id")
+        .values_list("user_id", flat=True),
+    )
+
+
+def _unfolded_entries():
+    return BalanceEntry.objects.filter(
+        wallet=OuterRef("pk"),
+        id__gt=OuterRef("entry_id"),
+    )
+
+
+def _unfolded_sum(field):
+    return Coalesce(
+        Subquery(
+            _unfolded_entries()
+            .values("wallet")
+            .annotate(total=Sum(field))
+            .values("total"),
+        ),
+        0,
+        output_field=BigIntegerField(),
+    )
+
+
+def wallet_balances(user_ids) -> dict[int, WalletBalance]:
+    """
+    Returns the current balances of the given users.
+
+    The balances are the snapshot of the wallet plus the entries written after
+    it, read by one statement so a concurrent snapshot is never counted twice.
+
+    Args:
+        user_ids (Iterable[int]): IDs of the users.
+
+    Returns:
+        dict[int, WalletBalance]: Balances by user ID, users without a wallet are
+        left out.
+    """
+
+    rows = (
+        Wallet.objects.filter(user_id__in=user_ids)
+        .annotate(
+            current_balance=F("balance") + _unfolded_sum("balance"),
+            current_token_balance=F("token_balance") + _unfolded_sum("token_balance"),
+        )
+        .values_list("user_id", "current_balance", "current_token_balance")
+    )
+    return {
+        user_id: WalletBalance(balance, token_balance)
+        for user_id, balance, token_balance in rows
+    }
+
+
+def wallet_snapshot(*, batch_size: int | None = None) -> int:
+    """
+    Folds the balance entries written since the last snapshot into the wallets.
+
+    Wallets are walked in user id order, `batch_size` of them per transaction.
+    Each batch is locked like the validators and the filler do, so the entries
+    of a wallet written before the lock are all committed and the ones written
+    after it are newer than the entry the snapshot stops at. Entries are kept
+    as the history of the balances.
+
+    Args:
+        batch_size (int | None): Wallets per transaction, defaults to
+            `settings.WALLET_SNAPSHOT_BATCH_SIZE`.
+
+    Returns:
+        int: The number of entries folded.
+    """
+
+    batch_size = batch_size or settings.WALLET_SNAPSHOT_BATCH_SIZE
+    folded = 0
+    last_user_id = 0
+    while True:
+        with transaction.atomic():
+            wallets = list(
+                Wallet.objects.select_for_update(no_key=True)
+                .filter(Exists(_unfolded_entries()), user_id__gt=last_user_id)
+                .order_by("user_id")[:batch_size],
+            )
+            if not wallets:
+                break
+
+            unfolded = {
+                row["wallet_id"]: row
+                for row in BalanceEntry.objects.filter(
+                    wallet_id__in=[wallet.user_id for wallet in wallets],
+                    id__gt=F("wallet__entry_id"),
+                )
+                .values("wallet_id")
+                .annotate(
+                    balance_change=Sum("balance"),
+                    token_balance_change=Sum("token_balance"),
+                    last_entry_id=Max("id"),
+                    entries=Count("id"),
+                )
+            }
+            changed = []
+            for wallet in wallets:
+                # nothing left when another snapshot folded it first
+                row = unfolded.get(wallet.user_id)
+                if row is None:
+                    continue
+                wallet.balance += row["balance_change"]
+                wallet.token_balance += row["token_balance_change"]
+                wallet.entry_id = row["last_entry_id"]
+                folded += row["entries"]
+                changed.append(wallet)
+            if changed:
+                Wallet.objects.bulk_update(
+                    changed,
+                    ["balance", "token_balance", "entry_id"],
+                )
+
+        if len(wallets) < batch_size:
+            break
+        last_user_id = wallets[-1].user_id
+    return folded
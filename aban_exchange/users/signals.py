@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import User
+from .models import Wallet
+
+
+@receiver(post_save, sender=User)
+def wallet_create(sender, instance, created, raw, **kwargs):
+    """
+    Creates the empty wallet of a new user.
+
+    Users are created by `user_create`, `createsuperuser`, the admin and other
+    apps, a user without wallet could never place an order. Fixtures (`raw`)
+    bring their own wallets.
+    """
+
+    if created and not raw:
+        Wallet.objects.get_or_create(user=instance)
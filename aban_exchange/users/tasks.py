@@ -0,0 +1,14 @@
+from celery import shared_task
+
+from .services import wallet_snapshot
+
+
+@shared_task()
+def snapshot_wallets():
+    """
+    Folds the balance entries written since the last run into the wallets.
+
+    Returns:
+        int: The number of entries folded.
+    """
+    return wallet_snapshot()
@@ -2,17 +2,48 @@ from collections.abc import Sequence
 from typing import Any
 
 from factory import Faker
+from factory import RelatedFactory
+from factory import SelfAttribute
+from factory import SubFactory
 from factory import post_generation
 from factory.django import DjangoModelFactory
 
 from aban_exchange.users.models import User
+from aban_exchange.users.models import Wallet
+
+
+class WalletFactory(DjangoModelFactory[Wallet]):
+    user = SubFactory("aban_exchange.users.tests.factories.UserFactory", wallet=None)
+    balance = Faker("random_int", min=0, max=1000)
+    token_balance = 0
+
+    class Meta:
+        model = Wallet
+
+    @classmethod
+    def _create(cls, model_class, *args, **kwargs):
+        # the empty wallet is created with the user, only its balances are set
+        user = kwargs.pop("user")
+        wallet, _ = model_class.objects.update_or_create(user=user, defaults=kwargs)
+        return wallet
 
 
 class UserFactory(DjangoModelFactory[User]):
     username = Faker("user_name")
     email = Faker("email")
     name = Faker("name")
-    balance = Faker("random_int", min=0, max=1000)
+
+    # the balances are kept in the wallet of the user
+    wallet = RelatedFactory(
+        WalletFactory,
+        factory_related_name="user",
+        balance=SelfAttribute("..balance"),
+        token_balance=SelfAttribute("..token_balance"),
+    )
+
+    class Params:
+        balance = Faker("random_int", min=0, max=1000)
+        token_balance = 0
 
     @post_generation
     def password(self, create: bool, extracted: Sequence[Any], **kwargs):  # noqa: FBT001
@@ -1,7 +1,14 @@
 import pytest
 from django.db import IntegrityError
 
+from aban_exchange.users.models import BalanceEntry
+from aban_exchange.users.models import User
+from aban_exchange.users.models import Wallet
+from aban_exchange.users.services import WalletBalance
 from aban_exchange.users.services import user_create
+from aban_exchange.users.services import wallet_balances
+from aban_exchange.users.services import wallet_snapshot
+from aban_exchange.users.tests.factories import UserFactory
 
 
 @pytest.mark.django_db
@@ -19,6 +26,16 @@ class TestUserCreate:
             password,
         )
         assert user.id is not None
+        assert Wallet.objects.filter(user=user, balance=0, token_balance=0).exists()
+
+    def test_users_created_elsewhere_have_a_wallet(self):
+        # e.g. by `createsuperuser` or a social login
+        users = [
+            User.objects.create_user(username="plain"),
+            User.objects.create_superuser(username="admin"),
+        ]
+
+        assert Wallet.objects.filter(user__in=users, balance=0).count() == len(users)
 
     def test_user_create_duplicate_username(self):
         username = "existinguser"
@@ -31,3 +48,43 @@ class TestUserCreate:
             user_create(
                 username=username, email="another@example.com", password="password456"
             )
+
+
+@pytest.mark.django_db
+class TestWallet:
+    def test_wallet_balances_reads_snapshot_and_entries(self):
+        UserFactory(id=1, balance=100, token_balance=5)
+        UserFactory(id=2, balance=30)
+        BalanceEntry.objects.create(wallet_id=1, balance=-40)
+        BalanceEntry.objects.create(wallet_id=1, token_balance=3)
+
+        assert wallet_balances([1, 2, 3]) == {
+            1: WalletBalance(60, 8),
+            2: WalletBalance(30, 0),
+        }
+
+    def test_wallet_snapshot_folds_entries(self):
+        UserFactory(id=1, balance=100)
+        UserFactory(id=2, balance=30)
+        UserFactory(id=3, balance=10)
+        BalanceEntry.objects.create(wallet_id=1, balance=-40)
+        BalanceEntry.objects.create(wallet_id=3, token_balance=2)
+        last_entry = BalanceEntry.objects.create(wallet_id=3, balance=-10)
+
+        assert wallet_snapshot(batch_size=1) == 3  # noqa: PLR2004
+
+        wallet = Wallet.objects.get(user_id=3)
+        assert (wallet.balance, wallet.token_balance) == (0, 2)
+        assert wallet.entry_id == last_entry.id
+        assert Wallet.objects.get(user_id=1).balance == 60  # noqa: PLR2004
+        # folded entries are kept but not counted again
+        assert BalanceEntry.objects.count() == 3  # noqa: PLR2004
+        assert wallet_balances([1, 3]) == {
+            1: WalletBalance(60, 0),
+            3: WalletBalance(0, 2),
+        }
+
+        BalanceEntry.objects.create(wallet_id=1, balance=-60)
+        assert wallet_snapshot() == 1
+        assert wallet_snapshot() == 0
+        assert Wallet.objects.get(user_id=1).balance == 0
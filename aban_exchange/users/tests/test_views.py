@@ -3,6 +3,7 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
 User = get_user_model()
 
@@ -53,3 +54,17 @@ class TestUserSignupApi:
 
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert "username" in response.data
+
+
+@pytest.mark.django_db
+def test_token_carries_rate_tier(user):
+    user.rate_tier = "pro"
+    user.save()
+
+    response = APIClient().post(
+        reverse("token_obtain_pair"),
+        {"username": user.username, "password": "password123"},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert AccessToken(response.data["access"])["rate_tier"] == "pro"
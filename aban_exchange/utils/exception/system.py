@@ -1,7 +1,24 @@
 from rest_framework.exceptions import APIException
+from rest_framework.exceptions import Throttled
 
 
 class ServiceUnavailable(APIException):
     status_code = 503
     default_detail = "Service temporarily unavailable, try again later."
     default_code = "service_unavailable"
+
+
+class RateLimited(Throttled):
+    default_detail = "Too many orders, slow down."
+    default_code = "order_rate_limited"
+
+
+class QueueFull(Throttled):
+    default_detail = "Too many orders are waiting, try again later."
+    default_code = "queue_full"
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = 422
+    default_detail = "This Idempotency-Key was already used for another order."
+    default_code = "idempotency_key_reused"
@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while instead of waiting on it.
+
+    Closed: every call is allowed, `failure_threshold` failures in a row open the
+    breaker. Open: calls are refused at once for `recovery_time` milliseconds, then
+    the breaker is half-open. Half-open: a single probe call is allowed, its success
+    closes the breaker and its failure opens it again. A probe which never reports
+    back is replaced after `recovery_time` milliseconds.
+
+    The breaker is thread safe, callers report the outcome of every allowed call
+    with `record_success` or `record_failure`.
+    """
+
+    def __init__(self, name: str, *, failure_threshold: int, recovery_time: int):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._recovery_time = recovery_time / 1000
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Returns whether a call may be made now.
+        """
+
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+
+            now = time.monotonic()
+            if self._state == OPEN:
+                if now - self._opened_at < self._recovery_time:
+                    return False
+                self._state = HALF_OPEN
+                self._probe_started_at = None
+
+            # half-open, one probe at a time
+            if (
+                self._probe_started_at is not None
+                and now - self._probe_started_at < self._recovery_time
+            ):
+                return False
+            self._probe_started_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Circuit breaker %s closed", self.name)
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self._failure_threshold
+            ):
+                logger.warning(
+                    "Circuit breaker %s opened after %d failures",
+                    self.name,
+                    self._failures,
+                )
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started_at = None
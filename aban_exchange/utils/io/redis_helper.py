@@ -1,10 +1,162 @@
+import asyncio
+import weakref
+
 from django.conf import settings
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.asyncio.connection import Connection as AsyncConnection
+from redis.asyncio.connection import SSLConnection as AsyncSSLConnection
+from redis.connection import Connection
+from redis.connection import SSLConnection
+from redis.exceptions import ConnectionError  # noqa: A004
+from redis.exceptions import ResponseError
+from redis.exceptions import TimeoutError  # noqa: A004
+
+from .circuit_breaker import CircuitBreaker
+
+
+class RedisCircuitOpenError(ConnectionError):
+    """
+    Raised instead of sending a command while the Redis circuit breaker is open.
+
+    It is a `ConnectionError`, so callers handle it like an unreachable Redis.
+    """
+
+
+class _CircuitBreakerMixin:
+    """
+    Reports the outcome of the commands of a connection to a circuit breaker.
+
+    While the breaker is open commands fail at once with `RedisCircuitOpenError`
+    instead of waiting for Redis. Connection and timeout errors are failures, any
+    reply (error replies too) is a success.
+    """
+
+    def __init__(self, *args, breaker, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.breaker = breaker
+        # allowed by the breaker until the outcome is reported, so connecting,
+        # health checks and sending a command ask the breaker once
+        self._permitted = False
+
+    def _allow(self):
+        if self._permitted:
+            return
+        if not self.breaker.allow():
+            msg = "Redis circuit breaker is open."
+            raise RedisCircuitOpenError(msg)
+        self._permitted = True
+
+    def _record(self, *, success):
+        self._permitted = False
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def connect(self):
+        self._allow()
+        try:
+            super().connect()
+        except (ConnectionError, TimeoutError):
+            self._record(success=False)
+            raise
+
+    def send_packed_command(self, command, check_health=True):  # noqa: FBT002
+        self._allow()
+        try:
+            super().send_packed_command(command, check_health=check_health)
+        except (ConnectionError, TimeoutError):
+            self._record(success=False)
+            raise
+
+    def read_response(self, *args, **kwargs):
+        try:
+            response = super().read_response(*args, **kwargs)
+        except ResponseError:
+            # an error reply, Redis did answer
+            self._record(success=True)
+            raise
+        except (ConnectionError, TimeoutError):
+            self._record(success=False)
+            raise
+        self._record(success=True)
+        return response
+
+
+class _AsyncCircuitBreakerMixin(_CircuitBreakerMixin):
+    """
+    `redis.asyncio` counterpart of `_CircuitBreakerMixin`.
+    """
+
+    async def connect(self):
+        self._allow()
+        try:
+            await super(_CircuitBreakerMixin, self).connect()
+        except (ConnectionError, TimeoutError):
+            self._record(success=False)
+            raise
+
+    async def send_packed_command(self, command, check_health=True):  # noqa: FBT002
+        self._allow()
+        try:
+            await super(_CircuitBreakerMixin, self).send_packed_command(
+                command,
+                check_health=check_health,
+            )
+        except (ConnectionError, TimeoutError):
+            self._record(success=False)
+            raise
+
+    async def read_response(self, *args, **kwargs):
+        try:
+            response = await super(_CircuitBreakerMixin, self).read_response(
+                *args,
+                **kwargs,
+            )
+        except ResponseError:
+            # an error reply, Redis did answer
+            self._record(success=True)
+            raise
+        except (ConnectionError, TimeoutError):
+            self._record(success=False)
+            raise
+        self._record(success=True)
+        return response
+
+
+class CircuitBreakerConnection(_CircuitBreakerMixin, Connection):
+    pass
+
+
+class CircuitBreakerSSLConnection(_CircuitBreakerMixin, SSLConnection):
+    pass
+
+
+class AsyncCircuitBreakerConnection(_AsyncCircuitBreakerMixin, AsyncConnection):
+    pass
+
+
+class AsyncCircuitBreakerSSLConnection(_AsyncCircuitBreakerMixin, AsyncSSLConnection):
+    pass
+
+
+def _breaker_options(connection_class, ssl_connection_class):
+    if not settings.REDIS_BREAKER_ENABLED:
+        return {}
+    return {
+        "connection_class": ssl_connection_class
+        if settings.REDIS_SSL
+        else connection_class,
+        "breaker": RedisConnector.get_breaker(),
+    }
 
 
 class RedisConnector:
     _instance = None
     _redis = None
+    _binary_redis = None
+    _breaker = None
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
@@ -12,10 +164,75 @@ class RedisConnector:
         return cls._instance
 
     @classmethod
-    def get_connection(cls):
+    def get_breaker(cls):
+        """
+        Returns the circuit breaker shared by every Redis client of the process.
+
+        After `settings.REDIS_BREAKER_FAILURE_THRESHOLD` connection or timeout
+        errors in a row, commands fail at once with `RedisCircuitOpenError` for
+        `settings.REDIS_BREAKER_RECOVERY_TIME` milliseconds, then a single command
+        probes Redis again.
+        """
+
+        if cls._breaker is None:
+            cls._breaker = CircuitBreaker(
+                "redis",
+                failure_threshold=settings.REDIS_BREAKER_FAILURE_THRESHOLD,
+                recovery_time=settings.REDIS_BREAKER_RECOVERY_TIME,
+            )
+        return cls._breaker
+
+    @classmethod
+    def get_connection(cls, *, binary=False):
+        # responses of the binary connection are returned as bytes, not decoded
+        if binary:
+            if cls._binary_redis is None:
+                cls._binary_redis = Redis.from_url(
+                    settings.REDIS_URL,
+                    **_breaker_options(
+                        CircuitBreakerConnection,
+                        CircuitBreakerSSLConnection,
+                    ),
+                )
+            return cls._binary_redis
+
         if cls._redis is None:
             cls._redis = Redis.from_url(
                 settings.REDIS_URL,
                 decode_responses=True,
+                **_breaker_options(
+                    CircuitBreakerConnection,
+                    CircuitBreakerSSLConnection,
+                ),
             )
         return cls._redis
+
+
+class AsyncRedisConnector:
+    """
+    `redis.asyncio` counterpart of `RedisConnector` for async views.
+
+    A `redis.asyncio` client can only be used in the event loop it was created in,
+    so one client (with its pool bounded by `settings.REDIS_ASYNC_MAX_CONNECTIONS`)
+    is kept per running event loop. Under ASGI the process has one loop and all
+    coroutines share one pool; under WSGI every async view runs in a new loop. All
+    clients share the circuit breaker of `RedisConnector`.
+    """
+
+    _clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def get_connection(cls):
+        loop = asyncio.get_running_loop()
+        redis = cls._clients.get(loop)
+        if redis is None:
+            redis = cls._clients[loop] = AsyncRedis.from_url(
+                settings.REDIS_URL,
+                decode_responses=True,
+                max_connections=settings.REDIS_ASYNC_MAX_CONNECTIONS,
+                **_breaker_options(
+                    AsyncCircuitBreakerConnection,
+                    AsyncCircuitBreakerSSLConnection,
+                ),
+            )
+        return redis
@@ -0,0 +1,165 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.connection import AbstractConnection
+from redis.exceptions import ConnectionError  # noqa: A004
+from redis.exceptions import ResponseError
+
+from aban_exchange.utils.io.circuit_breaker import CLOSED
+from aban_exchange.utils.io.circuit_breaker import HALF_OPEN
+from aban_exchange.utils.io.circuit_breaker import OPEN
+from aban_exchange.utils.io.circuit_breaker import CircuitBreaker
+from aban_exchange.utils.io.redis_helper import AsyncCircuitBreakerConnection
+from aban_exchange.utils.io.redis_helper import AsyncRedisConnector
+from aban_exchange.utils.io.redis_helper import CircuitBreakerConnection
+from aban_exchange.utils.io.redis_helper import RedisCircuitOpenError
+from aban_exchange.utils.io.redis_helper import RedisConnector
+
+# nothing listens on this port, connecting fails at once
+UNREACHABLE_REDIS_URL = "redis://127.0.0.1:1/0"
+
+
+@patch("aban_exchange.utils.io.circuit_breaker.time.monotonic")
+def test_circuit_breaker_opens_and_probes(mock_monotonic):
+    mock_monotonic.return_value = 100.0
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_time=5000)
+
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    # a success resets the failures in a row
+    breaker.record_success()
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    # after the recovery time a single probe is allowed
+    mock_monotonic.return_value = 105.0
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    mock_monotonic.return_value = 110.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+@patch("aban_exchange.utils.io.circuit_breaker.time.monotonic")
+def test_circuit_breaker_replaces_lost_probe(mock_monotonic):
+    mock_monotonic.return_value = 100.0
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=5000)
+    breaker.record_failure()
+
+    mock_monotonic.return_value = 105.0
+    assert breaker.allow()
+    # the probe never reported back
+    mock_monotonic.return_value = 110.0
+    assert breaker.allow()
+
+
+def test_redis_connection_fails_fast_when_breaker_is_open():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_time=60000)
+    redis = Redis.from_url(
+        UNREACHABLE_REDIS_URL,
+        connection_class=CircuitBreakerConnection,
+        breaker=breaker,
+    )
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError) as e:
+            redis.ping()
+        assert not isinstance(e.value, RedisCircuitOpenError)
+
+    with (
+        patch.object(AbstractConnection, "connect") as mock_connect,
+        pytest.raises(RedisCircuitOpenError),
+    ):
+        redis.rpush("queue", "order")
+    # Redis is not even tried
+    mock_connect.assert_not_called()
+
+
+@patch("aban_exchange.utils.io.circuit_breaker.time.monotonic")
+def test_redis_error_reply_closes_half_open_breaker(mock_monotonic):
+    mock_monotonic.return_value = 100.0
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=5000)
+    breaker.record_failure()
+    redis = Redis.from_url(
+        UNREACHABLE_REDIS_URL,
+        connection_class=CircuitBreakerConnection,
+        breaker=breaker,
+    )
+
+    mock_monotonic.return_value = 105.0
+    with (
+        patch.object(AbstractConnection, "connect"),
+        patch.object(AbstractConnection, "send_packed_command"),
+        patch.object(
+            AbstractConnection,
+            "read_response",
+            side_effect=ResponseError("WRONGTYPE"),
+        ),
+        pytest.raises(ResponseError),
+    ):
+        redis.rpush("queue", "order")
+
+    # the probe got a reply, the next commands are allowed again
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_async_redis_connection_fails_fast_when_breaker_is_open():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=60000)
+
+    async def ping_twice():
+        redis = AsyncRedis.from_url(
+            UNREACHABLE_REDIS_URL,
+            connection_class=AsyncCircuitBreakerConnection,
+            breaker=breaker,
+        )
+        errors = []
+        for _ in range(2):
+            try:
+                await redis.ping()
+            except ConnectionError as e:
+                errors.append(e)
+        await redis.aclose()
+        return errors
+
+    first, second = asyncio.run(ping_twice())
+
+    assert not isinstance(first, RedisCircuitOpenError)
+    assert isinstance(second, RedisCircuitOpenError)
+
+
+def test_redis_connectors_share_one_breaker(settings):
+    settings.REDIS_URL = UNREACHABLE_REDIS_URL
+
+    async def get_async_connection():
+        return AsyncRedisConnector.get_connection()
+
+    with (
+        patch.object(RedisConnector, "_redis", None),
+        patch.object(RedisConnector, "_binary_redis", None),
+        patch.object(RedisConnector, "_breaker", None),
+    ):
+        pools = [
+            RedisConnector.get_connection().connection_pool,
+            RedisConnector.get_connection(binary=True).connection_pool,
+            asyncio.run(get_async_connection()).connection_pool,
+        ]
+        breaker = RedisConnector.get_breaker()
+
+    assert pools[0].connection_class is CircuitBreakerConnection
+    assert pools[2].connection_class is AsyncCircuitBreakerConnection
+    assert all(pool.connection_kwargs["breaker"] is breaker for pool in pools)
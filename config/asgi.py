@@ -0,0 +1,27 @@
+# ruff: noqa
+"""
+ASGI config for Aban Exchange project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with uvicorn workers to serve the async endpoints (e.g.
+``api:orders:async-create``) without blocking a worker on I/O::
+
+    gunicorn config.asgi --bind 0.0.0.0:5000 --chdir=/app -k uvicorn_worker.UvicornWorker
+
+"""
+
+import os
+import sys
+from pathlib import Path
+
+from django.core.asgi import get_asgi_application
+
+# This allows easy placement of apps within the interior
+# aban_exchange directory.
+BASE_DIR = Path(__file__).resolve(strict=True).parent.parent
+sys.path.append(str(BASE_DIR / "aban_exchange"))
+# If DJANGO_SETTINGS_MODULE is unset, default to the production settings
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.production")
+
+# This application object is used by any ASGI server configured to use this file.
+application = get_asgi_application()
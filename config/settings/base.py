@@ -231,6 +231,13 @@ LOGGING = {
 
 REDIS_URL = env("REDIS_URL", default="redis://redis:6379/0")
 REDIS_SSL = REDIS_URL.startswith("rediss://")
+# connection pool size of each ASGI worker
+REDIS_ASYNC_MAX_CONNECTIONS = env.int("REDIS_ASYNC_MAX_CONNECTIONS", default=100)
+# fail Redis commands at once after REDIS_BREAKER_FAILURE_THRESHOLD connection or
+# timeout errors in a row, probe Redis again after REDIS_BREAKER_RECOVERY_TIME ms
+REDIS_BREAKER_ENABLED = env.bool("REDIS_BREAKER_ENABLED", default=True)
+REDIS_BREAKER_FAILURE_THRESHOLD = env.int("REDIS_BREAKER_FAILURE_THRESHOLD", default=5)
+REDIS_BREAKER_RECOVERY_TIME = env.int("REDIS_BREAKER_RECOVERY_TIME", default=5000)
 
 # Celery
 # ------------------------------------------------------------------------------
@@ -300,6 +307,7 @@ SPECTACULAR_SETTINGS = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=5),
+    "TOKEN_OBTAIN_SERIALIZER": "aban_exchange.users.serializers.TokenObtainPairSerializer",
 }
 
 # System presets
@@ -318,12 +326,222 @@ REQUEST_HANDLER_INTERVAL = env.int(
     "REQUEST_HANDLER_INTERVAL",
     default=500000,
 )
+# orders are split by user into this many queues, each one needs its own validator
+REQUEST_HANDLER_QUEUE_SHARDS = env.int(
+    "REQUEST_HANDLER_QUEUE_SHARDS",
+    default=1,
+)
+# "list" (RPUSH/LPOP) or "stream" (XADD/XREADGROUP, several validators in parallel)
+REQUEST_HANDLER_QUEUE_BACKEND = env(
+    "REQUEST_HANDLER_QUEUE_BACKEND",
+    default="list",
+)
+# "json" or "binary" (compact, see `exchange.codecs`), the validators read both
+REQUEST_HANDLER_QUEUE_CODEC = env(
+    "REQUEST_HANDLER_QUEUE_CODEC",
+    default="json",
+)
+REQUEST_HANDLER_CONSUMER_GROUP = env(
+    "REQUEST_HANDLER_CONSUMER_GROUP",
+    default="order_validators",
+)
+# in milliseconds, unacknowledged stream entries older than this are claimed again
+REQUEST_HANDLER_CLAIM_IDLE_TIME = env.int(
+    "REQUEST_HANDLER_CLAIM_IDLE_TIME",
+    default=60000,
+)
+# admission control on the depth of each queue shard, 0 disables a limit: past the
+# soft limit a warning is logged, past the hard limit orders are refused with 429
+REQUEST_HANDLER_QUEUE_SOFT_LIMIT = env.int(
+    "REQUEST_HANDLER_QUEUE_SOFT_LIMIT",
+    default=100000,
+)
+REQUEST_HANDLER_QUEUE_HARD_LIMIT = env.int(
+    "REQUEST_HANDLER_QUEUE_HARD_LIMIT",
+    default=1000000,
+)
+# in milliseconds, how long a worker reuses the depth it read
+REQUEST_HANDLER_QUEUE_DEPTH_CACHE_TTL = env.int(
+    "REQUEST_HANDLER_QUEUE_DEPTH_CACHE_TTL",
+    default=500,
+)
+# in seconds, sent in the Retry-After header of refused orders
+REQUEST_HANDLER_QUEUE_RETRY_AFTER = env.int(
+    "REQUEST_HANDLER_QUEUE_RETRY_AFTER",
+    default=5,
+)
+# per-user token bucket on order creation, checked by the Lua script pushing the
+# order (the intake buffer is not used then)
+ORDER_RATE_LIMIT_ENABLED = env.bool(
+    "ORDER_RATE_LIMIT_ENABLED",
+    default=True,
+)
+ORDER_RATE_LIMIT_KEY = env(
+    "ORDER_RATE_LIMIT_KEY",
+    default="order_rate_limit",
+)
+# `User.rate_tier` -> orders per second and most orders at once, unknown tiers
+# use "default"; a bulk request needs as many tokens as orders
+ORDER_RATE_LIMIT_TIERS = {
+    "default": {
+        "rate": env.float("ORDER_RATE_LIMIT_DEFAULT_RATE", default=10),
+        "burst": env.int("ORDER_RATE_LIMIT_DEFAULT_BURST", default=100),
+    },
+    "pro": {
+        "rate": env.float("ORDER_RATE_LIMIT_PRO_RATE", default=100),
+        "burst": env.int("ORDER_RATE_LIMIT_PRO_BURST", default=1000),
+    },
+}
+# orders sent with an `Idempotency-Key` header are received once per key and user
+ORDER_IDEMPOTENCY_KEY = env(
+    "ORDER_IDEMPOTENCY_KEY",
+    default="order_idempotency",
+)
+# in seconds, how long a key is remembered
+ORDER_IDEMPOTENCY_KEY_TTL = env.int(
+    "ORDER_IDEMPOTENCY_KEY_TTL",
+    default=86400,
+)
+# keep the orders on the local disk while Redis is unreachable, `drain_order_spool`
+# must run on every web host to push them to the queue once Redis is back
+ORDER_SPOOL_ENABLED = env.bool(
+    "ORDER_SPOOL_ENABLED",
+    default=False,
+)
+ORDER_SPOOL_DIR = env(
+    "ORDER_SPOOL_DIR",
+    default=str(BASE_DIR / "spool"),
+)
+# in bytes, a spool segment is replaced by a new one past this size
+ORDER_SPOOL_SEGMENT_SIZE = env.int(
+    "ORDER_SPOOL_SEGMENT_SIZE",
+    default=16 * 1024 * 1024,
+)
+# prefix of the keys deduplicating the replayed orders
+ORDER_SPOOL_KEY = env(
+    "ORDER_SPOOL_KEY",
+    default="order_spool",
+)
+# in milliseconds, how long `drain_order_spool` waits when the spool is empty
+ORDER_SPOOL_DRAIN_INTERVAL = env.int(
+    "ORDER_SPOOL_DRAIN_INTERVAL",
+    default=1000,
+)
+# collect the orders of a web worker and push them together (threaded workers only)
+ORDER_INTAKE_BUFFER_ENABLED = env.bool(
+    "ORDER_INTAKE_BUFFER_ENABLED",
+    default=False,
+)
+ORDER_INTAKE_BUFFER_SIZE = env.int(
+    "ORDER_INTAKE_BUFFER_SIZE",
+    default=100,
+)
+# in milliseconds, the longest an order waits for other orders before the push
+ORDER_INTAKE_BUFFER_WAIT = env.int(
+    "ORDER_INTAKE_BUFFER_WAIT",
+    default=2,
+)
+# in milliseconds, an order not pushed in this time is answered with 503
+ORDER_INTAKE_BUFFER_TIMEOUT = env.int(
+    "ORDER_INTAKE_BUFFER_TIMEOUT",
+    default=5000,
+)
+# most orders accepted by one `bulk-create` request, lowered to the burst of the
+# user's rate tier when the rate limit is enabled
+ORDER_BULK_CREATE_MAX_SIZE = env.int(
+    "ORDER_BULK_CREATE_MAX_SIZE",
+    default=1000,
+)
+# filled orders read by one query of the CSV order history
+ORDER_HISTORY_PAGE_SIZE = env.int(
+    "ORDER_HISTORY_PAGE_SIZE",
+    default=1000,
+)
+# in milliseconds, how long `run_order_consumer` waits on an empty queue
+ORDER_CONSUMER_BLOCK_TIMEOUT = env.int(
+    "ORDER_CONSUMER_BLOCK_TIMEOUT",
+    default=2000,
+)
+
+# validate a batch with one set-based statement (PostgreSQL only)
+ORDER_VALIDATOR_SET_BASED = env.bool(
+    "ORDER_VALIDATOR_SET_BASED",
+    default=True,
+)
 
 # order filler
 ORDER_FILLER_INTERVAL = env.int(
     "ORDER_FILLER_INTERVAL",
     default=10,
 )
+# fill orders with one set-based statement (PostgreSQL only)
+ORDER_FILLER_SET_BASED = env.bool(
+    "ORDER_FILLER_SET_BASED",
+    default=True,
+)
+# the filler is started by the validator as soon as MIN_ORDERS_VALUE is reached,
+# at most once per debounce window (in milliseconds)
+ORDER_FILLER_TRIGGER_KEY = env(
+    "ORDER_FILLER_TRIGGER_KEY",
+    default="order_filler_trigger",
+)
+ORDER_FILLER_TRIGGER_DEBOUNCE = env.int(
+    "ORDER_FILLER_TRIGGER_DEBOUNCE",
+    default=1000,
+)
+# orders loaded at once when the set-based filler is not available
+ORDER_FILLER_CHUNK_SIZE = env.int(
+    "ORDER_FILLER_CHUNK_SIZE",
+    default=5000,
+)
+
+# archived orders are partitioned by month on PostgreSQL, see `archive_partitions`
+ARCHIVE_PARTITIONS_AHEAD = env.int(
+    "ARCHIVE_PARTITIONS_AHEAD",
+    default=3,
+)
+# months of archived orders kept, the current one included, 0 keeps them all
+ARCHIVE_RETENTION_MONTHS = env.int(
+    "ARCHIVE_RETENTION_MONTHS",
+    default=0,
+)
+
+# cold archived orders are exported by `export_archive` to this directory
+ARCHIVE_EXPORT_DIR = env(
+    "ARCHIVE_EXPORT_DIR",
+    default=str(BASE_DIR / "archive"),
+)
+# orders per chunk of an export, a chunk is decompressed at once when read
+ARCHIVE_EXPORT_CHUNK_SIZE = env.int(
+    "ARCHIVE_EXPORT_CHUNK_SIZE",
+    default=65536,
+)
+
+# wallet snapshots, orders append `BalanceEntry` rows which are folded into the
+# wallets every WALLET_SNAPSHOT_INTERVAL seconds
+WALLET_SNAPSHOT_INTERVAL = env.int(
+    "WALLET_SNAPSHOT_INTERVAL",
+    default=60,
+)
+# wallets folded in one transaction
+WALLET_SNAPSHOT_BATCH_SIZE = env.int(
+    "WALLET_SNAPSHOT_BATCH_SIZE",
+    default=1000,
+)
+
+# order book engine (`run_order_book`), fills orders from an in-memory book
+ORDER_BOOK_ENABLED = env.bool(
+    "ORDER_BOOK_ENABLED",
+    default=False,
+)
+ORDER_BOOK_STREAM_NAME = env(
+    "ORDER_BOOK_STREAM_NAME",
+    default="placed_order_stream",
+)
+ORDER_BOOK_STREAM_MAXLEN = env.int(
+    "ORDER_BOOK_STREAM_MAXLEN",
+    default=100000,
+)
 
 # trade settings
 TOKEN_PRICE = env.int(
@@ -334,3 +552,22 @@ MIN_ORDERS_VALUE = env.int(
     "MIN_ORDERS_VALUE",
     default=20,
 )
+# the token price can be changed at runtime (see `exchange.prices`),
+# TOKEN_PRICE is only used until a price is set
+DYNAMIC_TOKEN_PRICE = env.bool(
+    "DYNAMIC_TOKEN_PRICE",
+    default=True,
+)
+TOKEN_PRICE_KEY = env(
+    "TOKEN_PRICE_KEY",
+    default="token_price",
+)
+TOKEN_PRICE_CHANNEL = env(
+    "TOKEN_PRICE_CHANNEL",
+    default="token_price_changed",
+)
+# in milliseconds, how long a worker uses its snapshot of the price
+TOKEN_PRICE_CACHE_TTL = env.int(
+    "TOKEN_PRICE_CACHE_TTL",
+    default=1000,
+)
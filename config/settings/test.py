@@ -36,3 +36,10 @@ TEMPLATES[0]["OPTIONS"]["debug"] = True  # type: ignore[index]
 MEDIA_URL = "http://media.testserver"
 # Your stuff...
 # ------------------------------------------------------------------------------
+# use the static TOKEN_PRICE, tests must not need a running Redis
+DYNAMIC_TOKEN_PRICE = False
+# no queue depth check, tests enabling it mock the queue length
+REQUEST_HANDLER_QUEUE_SOFT_LIMIT = 0
+REQUEST_HANDLER_QUEUE_HARD_LIMIT = 0
+# orders are pushed without the rate limit script, tests enabling it mock `eval`
+ORDER_RATE_LIMIT_ENABLED = False